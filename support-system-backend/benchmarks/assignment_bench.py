@@ -0,0 +1,54 @@
+"""Simulate the assignment engine under a steady ticket flow.
+
+Usage: python benchmarks/assignment_bench.py [--agents 200] [--tickets 200000]
+
+Each step assigns a new ticket and, with probability --close-rate, closes a
+random open one, so agent loads stay bounded the way they do in production.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.assignment import AssignmentEngine, PRIORITY_WEIGHTS
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', type=int, default=200)
+    parser.add_argument('--companies', type=int, default=500)
+    parser.add_argument('--tickets', type=int, default=200000)
+    parser.add_argument('--close-rate', type=float, default=0.95)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    priorities = list(PRIORITY_WEIGHTS)
+    engine = AssignmentEngine()
+    engine.load([(agent_id, None, None, 0) for agent_id in range(1, args.agents + 1)])
+
+    open_tickets = []
+    started = time.perf_counter()
+    for _ in range(args.tickets):
+        priority = rng.choice(priorities)
+        company_id = rng.randint(1, args.companies)
+        agent_id = engine.reserve(priority, company_id)
+        open_tickets.append((agent_id, priority, company_id))
+        if open_tickets and rng.random() < args.close_rate:
+            index = rng.randrange(len(open_tickets))
+            open_tickets[index], open_tickets[-1] = open_tickets[-1], open_tickets[index]
+            engine.remove(*open_tickets.pop())
+    elapsed = time.perf_counter() - started
+
+    loads = sorted(engine.loads().values())
+    print(f'agents={args.agents} tickets={args.tickets} open={len(open_tickets)}')
+    print(f'elapsed={elapsed:.3f}s  {args.tickets / elapsed:,.0f} assignments/s  '
+          f'{args.tickets / elapsed * 60:,.0f} assignments/min')
+    print(f'load min={loads[0]} median={loads[len(loads) // 2]} max={loads[-1]}')
+
+
+if __name__ == '__main__':
+    main()
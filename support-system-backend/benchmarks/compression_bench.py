@@ -0,0 +1,93 @@
+"""CPU time vs. bytes for each response codec on ticket-shaped JSON.
+
+Usage: python benchmarks/compression_bench.py [--tickets 200] [--messages 8]
+
+Payloads mirror the API: the ticket list (to_dict per ticket) and a single
+ticket with include_messages. brotli and zstd rows appear only when their
+packages are installed.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.compression import CODECS
+
+WORDS = ('printer network access password email vpn error invoice account restart '
+         'cannot login server slow update please help thanks screen laptop office '
+         'report attached urgent again tried still broken configuration').split()
+STATUSES = ['Pending Moderation', 'Open', 'In Progress', 'Awaiting Customer Reply',
+            'Awaiting Agent Reply', 'Resolved', 'Closed']
+LEVELS = {'gzip': (1, 6, 9), 'br': (1, 4, 11), 'zstd': (1, 3, 19)}
+
+
+def text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def user(rng, user_id, role):
+    return {'id': user_id, 'username': f'{role}{user_id}', 'email': f'{role}{user_id}@example.com',
+            'role': role, 'company': {'id': user_id % 5 + 1, 'name': f'Company {user_id % 5 + 1}'}}
+
+
+def ticket(rng, ticket_id, messages=0):
+    created = datetime(2025, 1, 1) + timedelta(minutes=rng.randrange(500000))
+    status = rng.choice(STATUSES)
+    result = {
+        'id': ticket_id, 'title': text(rng, 5), 'description': text(rng, rng.randrange(20, 120)),
+        'customer_id': rng.randrange(100, 400), 'agent_id': rng.randrange(2, 20),
+        'status_id': STATUSES.index(status) + 1, 'priority': rng.choice(['low', 'medium', 'high']),
+        'created_at': created.isoformat(), 'updated_at': created.isoformat(),
+        'closed_at': None, 'sla_due_at': (created + timedelta(hours=8)).isoformat(),
+        'sla_breached': False,
+        'customer': user(rng, rng.randrange(100, 400), 'customer'),
+        'agent': user(rng, rng.randrange(2, 20), 'agent'),
+        'status': {'id': STATUSES.index(status) + 1, 'name': status, 'description': status},
+    }
+    if messages:
+        result['messages'] = [{
+            'id': ticket_id * 100 + n, 'ticket_id': ticket_id, 'sender_id': rng.randrange(2, 400),
+            'content': text(rng, rng.randrange(10, 80)),
+            'created_at': (created + timedelta(minutes=n * 30)).isoformat(),
+            'sender': user(rng, rng.randrange(2, 400), rng.choice(['customer', 'agent'])),
+        } for n in range(messages)]
+    return result
+
+
+def measure(codec, data, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        compressed = codec.compress(data)
+    return len(compressed), (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    rng = random.Random(42)
+    payloads = {
+        f'ticket list ({args.tickets})': [ticket(rng, i) for i in range(1, args.tickets + 1)],
+        f'ticket + {args.messages * 10} messages': ticket(rng, 1, args.messages * 10),
+    }
+    for label, payload in payloads.items():
+        data = json.dumps(payload).encode()
+        print(f'{label}: {len(data):,} bytes')
+        print(f'  {"codec":6} {"level":>5} {"bytes":>9} {"ratio":>6} {"ms":>8} {"MB/s":>8}')
+        for name, codec_class in CODECS.items():
+            for level in LEVELS[name]:
+                size, seconds = measure(codec_class(level), data, args.repeat)
+                print(f'  {name:6} {level:5d} {size:9,d} {len(data) / size:6.1f} '
+                      f'{seconds * 1000:8.2f} {len(data) / seconds / 1e6:8.1f}')
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Messages/sec for the create_message write path on a file-backed SQLite.
+
+Usage: python benchmarks/message_write_bench.py [--messages 2000] [--threads 8]
+
+Modes:
+  two-commits  the old path: status commit inside the model, then a second commit
+  single       one unit of work per message
+  group        messages funnelled through the group committer
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from src.extensions import db, unit_of_work
+from src.models.attachment import Attachment  # noqa: F401 (registers the table)
+from src.models.company import Company  # noqa: F401
+from src.models.knowledge_base import KnowledgeBaseArticle  # noqa: F401
+from src.models.message import Message
+from src.models.status import Status
+from src.models.ticket import Ticket
+from src.models.user import User
+from src.services.group_commit import GroupCommitter
+
+
+def create_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        Status.init_default_statuses()
+        customer = User(username='customer', email='c@example.com', role='customer', password_hash='x')
+        db.session.add(customer)
+        db.session.flush()
+        ticket = Ticket(customer_id=customer.id, title='t', description='d',
+                        status_id=Status.get_id('Open'))
+        db.session.add(ticket)
+        db.session.commit()
+        app.config['BENCH_IDS'] = (customer.id, ticket.id)
+    return app
+
+
+def write_two_commits(customer_id, ticket_id, n):
+    ticket = db.session.get(Ticket, ticket_id)
+    db.session.add(Message(ticket_id=ticket_id, sender_id=customer_id, content=f'message {n}'))
+    ticket.status_id = Status.query.filter_by(name='Awaiting Agent Reply').first().id
+    db.session.commit()
+    db.session.commit()
+
+
+def write_single(customer_id, ticket_id, n):
+    with unit_of_work() as session:
+        session.add(Message(ticket_id=ticket_id, sender_id=customer_id, content=f'message {n}'))
+        session.get(Ticket, ticket_id).update_status_based_on_action('customer')
+
+
+def run(mode, messages, threads, max_batch, max_delay):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app(path)
+    customer_id, ticket_id = app.config['BENCH_IDS']
+    committer = GroupCommitter(max_batch, max_delay)
+    committer.app = app
+
+    def job(n):
+        def write(session):
+            session.add(Message(ticket_id=ticket_id, sender_id=customer_id, content=f'message {n}'))
+            session.get(Ticket, ticket_id).update_status_based_on_action('customer')
+        return write
+
+    def worker(start):
+        with app.app_context():
+            for n in range(start, messages, threads):
+                if mode == 'two-commits':
+                    write_two_commits(customer_id, ticket_id, n)
+                elif mode == 'single':
+                    write_single(customer_id, ticket_id, n)
+                else:
+                    committer.run(job(n))
+            db.session.remove()
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    with app.app_context():
+        written = Message.query.count()
+    # A worker that died part way would make the rate meaningless
+    lost = f'  ({messages - written} NOT WRITTEN)' if written != messages else ''
+    print(f'{mode:12} {written:6d} messages  {elapsed:7.3f}s  {written / elapsed:9,.0f} messages/s{lost}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-delay', type=float, default=0.002)
+    args = parser.parse_args()
+    for mode in ('two-commits', 'single', 'group'):
+        run(mode, args.messages, args.threads, args.max_batch, args.max_delay)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Messages/sec written by several companies at once, by number of shards.
+
+Usage: python benchmarks/shard_bench.py [--companies 8] [--messages 400] [--shards 1,2,4,8] [--hold-ms 0]
+
+Each company has one customer and ticket and its own worker process
+posting messages to it through the routed session (``use_company`` +
+``unit_of_work``), as the create_message route does under a multi-process
+server. Processes rather than threads, since the ORM work per message is
+CPU-bound and threads would only measure the GIL. ``unsharded`` is the
+plain single-database setup; with one shard every company stays on the
+primary database, with more they are spread evenly over that many shard
+files.
+
+``--hold-ms`` keeps each transaction open that long after its first
+write, standing in for work done while holding the write lock (hooks,
+slow storage). It isolates lock contention from CPU: with few cores the
+ORM work alone saturates the machine whatever the number of shards.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from src.extensions import db, unit_of_work
+from src.models.attachment import Attachment  # noqa: F401 (registers the table)
+from src.models.company import Company
+from src.models.knowledge_base import KnowledgeBaseArticle  # noqa: F401
+from src.models.message import Message
+from src.models.rollup import TicketDailyStats  # noqa: F401
+from src.models.status import Status
+from src.models.ticket import Ticket
+from src.models.user import User
+from src.services.sharding import each_shard, shard_router, use_company
+
+
+def create_app(directory, shards):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(directory, 'primary.db')}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 60}}
+    app.config['SHARDING_ENABLED'] = shards is not None
+    # With several shards the primary keeps no companies, so each shard file is one of ``shards``
+    app.config['SHARD_URIS'] = {f'shard{n}': f"sqlite:///{os.path.join(directory, f'shard{n}.db')}"
+                                for n in range(1, (shards or 0) + 1)} if (shards or 0) > 1 else {}
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        Status.init_default_statuses()
+    shard_router.init_app(app)
+    return app
+
+
+def seed(app, companies):
+    targets = []
+    with app.app_context():
+        for n in range(companies):
+            company = Company(name=f'company {n}')
+            customer = User(username=f'customer{n}', email=f'c{n}@example.com', role='customer',
+                            password_hash='x', company=company)
+            db.session.add_all([company, customer])
+            db.session.commit()
+            with use_company(company.id):
+                with unit_of_work() as session:
+                    ticket = Ticket(customer_id=customer.id, title='t', description='d',
+                                    status_id=Status.get_id('Open'))
+                    session.add(ticket)
+                targets.append((company.id, customer.id, ticket.id))
+    return targets
+
+
+def worker(directory, shards, target, messages, hold, barrier):
+    company_id, customer_id, ticket_id = target
+    app = create_app(directory, shards)
+    with app.app_context():
+        barrier.wait()
+        for n in range(messages):
+            with use_company(company_id), unit_of_work() as session:
+                session.add(Message(ticket_id=ticket_id, sender_id=customer_id, content=f'message {n}'))
+                session.get(Ticket, ticket_id).update_status_based_on_action('customer')
+                if hold:
+                    session.flush()
+                    time.sleep(hold)
+
+
+def run(label, shards, companies, messages, hold):
+    directory = tempfile.mkdtemp()
+    app = create_app(directory, shards)
+    targets = seed(app, companies)
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(companies + 1)
+    workers = [context.Process(target=worker, args=(directory, shards, target, messages, hold, barrier))
+               for target in targets]
+    for process in workers:
+        process.start()
+    barrier.wait()  # every worker has its app and connections ready
+    started = time.perf_counter()
+    for process in workers:
+        process.join()
+    elapsed = time.perf_counter() - started
+    with app.app_context():
+        written = sum(Message.query.count() for _ in each_shard())
+    print(f'{label:10} {written:6d} messages  {elapsed:7.3f}s  {written / elapsed:9,.0f} messages/s')
+    shard_router.__init__()  # the next run configures its own shards
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--companies', type=int, default=8)
+    parser.add_argument('--messages', type=int, default=400, help='per company')
+    parser.add_argument('--shards', default='1,2,4,8')
+    parser.add_argument('--hold-ms', type=float, default=0)
+    args = parser.parse_args()
+    print(f'{args.companies} companies x {args.messages} messages, one process each, '
+          f'{args.hold_ms:g} ms hold, {os.cpu_count()} CPUs')
+    for shards in [None] + [int(n) for n in args.shards.split(',')]:
+        label = 'unsharded' if shards is None else f'{shards} shards'
+        run(label, shards, args.companies, args.messages, args.hold_ms / 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Latency of ticket-draft suggestions over a large synthetic corpus.
+
+Usage: python benchmarks/suggest_bench.py [--tickets 100000] [--articles 2000] [--queries 500]
+
+Documents draw words from a Zipf-distributed vocabulary, so common words
+have long postings as in real ticket text. Reports build, incremental add,
+query and snapshot save/load times for the NumPy index, and query times
+for the same scoring done with Python dicts (the search index's approach)
+for comparison.
+"""
+import argparse
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.suggest import SuggestionIndex, term_weights
+
+
+def make_text(rng, vocabulary, words):
+    ranks = rng.zipf(1.3, words)
+    return ' '.join(vocabulary[rank % len(vocabulary)] for rank in ranks)
+
+
+class DictIndex:
+    """Same weights and idf as VectorIndex, scored with Python dicts"""
+
+    def __init__(self, documents):
+        self.postings = {}
+        self.count = 0
+        for doc_id, _, weights in documents:
+            self.count += 1
+            for term, weight in weights.items():
+                self.postings.setdefault(term, {})[doc_id] = weight
+
+    def search(self, query, limit):
+        scores = {}
+        for term, weight in query.items():
+            docs = self.postings.get(term)
+            if not docs or len(docs) > self.count / 2:
+                continue
+            idf = math.log(1.0 + self.count / len(docs))
+            factor = weight * idf * idf
+            for doc_id, doc_weight in docs.items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + doc_weight * factor
+        return sorted(scores.items(), key=lambda item: -item[1])[:limit]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (statistics.median(samples) * 1000, samples[int(len(samples) * 0.99) - 1] * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=100000)
+    parser.add_argument('--articles', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--vocabulary', type=int, default=30000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(42)
+    vocabulary = [f'w{n}x' for n in range(args.vocabulary)]
+
+    started = time.perf_counter()
+    tickets = [(n + 1, int(rng.integers(1, 5000)),
+                term_weights(make_text(rng, vocabulary, 6), make_text(rng, vocabulary, int(rng.integers(15, 80)))))
+               for n in range(args.tickets)]
+    articles = [(n + 1, 0, term_weights(make_text(rng, vocabulary, 8), make_text(rng, vocabulary, 400)))
+                for n in range(args.articles)]
+    print(f'{args.tickets:,} tickets, {args.articles:,} articles '
+          f'(tokenized in {time.perf_counter() - started:.1f}s)')
+
+    index = SuggestionIndex()
+    started = time.perf_counter()
+    index.tickets.build(tickets)
+    index.articles.build(articles)
+    index.synced_at = datetime.utcnow()
+    print(f'build          {time.perf_counter() - started:8.3f} s   {len(index.tickets.vocab):,} terms')
+
+    drafts = [(make_text(rng, vocabulary, 6), make_text(rng, vocabulary, int(rng.integers(5, 60))))
+              for _ in range(args.queries)]
+    timings = []
+    for title, description in drafts:
+        started = time.perf_counter()
+        index.suggest(title, description, limit=20)
+        timings.append(time.perf_counter() - started)
+    p50, p99 = percentiles(timings)
+    print(f'query numpy    p50 {p50:7.2f} ms   p99 {p99:7.2f} ms')
+
+    timings = []
+    for title, description in drafts:
+        started = time.perf_counter()
+        index.suggest(title, description, limit=20, customer_id=int(rng.integers(1, 5000)))
+        timings.append(time.perf_counter() - started)
+    p50, p99 = percentiles(timings)
+    print(f'query customer p50 {p50:7.2f} ms   p99 {p99:7.2f} ms')
+
+    baseline = DictIndex(tickets)
+    timings = []
+    for title, description in drafts[:50]:  # slow; a sample is enough
+        query = term_weights(title, description)
+        started = time.perf_counter()
+        baseline.search(query, 20)
+        timings.append(time.perf_counter() - started)
+    p50, p99 = percentiles(timings)
+    print(f'query dicts    p50 {p50:7.2f} ms   p99 {p99:7.2f} ms   (tickets only)')
+
+    started = time.perf_counter()
+    for n in range(1000):
+        title, description = drafts[n % len(drafts)]
+        index.add_ticket(args.tickets + n + 1, 1, title, description)
+    print(f'add ticket     {(time.perf_counter() - started) * 1000:8.3f} us each (incl. tokenizing)')
+
+    path = os.path.join(tempfile.mkdtemp(), 'suggest_index.npz')
+    started = time.perf_counter()
+    index.save(path)
+    saved = time.perf_counter() - started
+    started = time.perf_counter()
+    SuggestionIndex().load(path)
+    print(f'save {saved:6.3f} s   load {time.perf_counter() - started:6.3f} s   '
+          f'{os.path.getsize(path) / 1e6:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
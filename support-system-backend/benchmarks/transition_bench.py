@@ -0,0 +1,144 @@
+"""Write-lock hold time of ticket assignment under contention, on a file-backed SQLite.
+
+Usage: python benchmarks/transition_bench.py [--assignments 2000] [--threads 8] [--tickets 20]
+
+Modes:
+  read-modify-write  the old path: mutate the loaded ticket, read more rows
+                     (autoflush takes the write lock), then commit
+  conditional        all reads and the rollup statements first, then one
+                     conditional UPDATE, the rollup writes and commit
+
+Hold time is measured from the end of the first write statement of a
+transaction (once the lock is acquired) to the end of its commit.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.orm.exc import StaleDataError
+
+from src.extensions import db, unit_of_work
+from src.models.attachment import Attachment  # noqa: F401 (registers the table)
+from src.models.company import Company  # noqa: F401
+from src.models.knowledge_base import KnowledgeBaseArticle  # noqa: F401
+from src.models.message import Message  # noqa: F401
+from src.models.status import Status
+from src.models.ticket import Ticket
+from src.models.user import User
+from src.services import rollups
+from src.services.assignment import AssignmentEngine
+from src.services.transitions import TransitionConflict, transition
+
+
+def create_app(path, tickets):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    db.init_app(app)
+    rollups.init_app(app)
+    with app.app_context():
+        db.create_all()
+        Status.init_default_statuses()
+        customer = User(username='customer', email='c@example.com', role='customer', password_hash='x')
+        agents = [User(username=f'agent{i}', email=f'a{i}@example.com', role='agent', password_hash='x')
+                  for i in range(4)]
+        db.session.add_all([customer] + agents)
+        db.session.flush()
+        db.session.add_all([Ticket(customer_id=customer.id, title=f't{i}', description='d',
+                                   status_id=Status.get_id('Open')) for i in range(tickets)])
+        db.session.commit()
+        app.config['BENCH_AGENTS'] = [agent.id for agent in agents]
+    return app
+
+
+class LockTimer:
+    """First write statement of the current thread's transaction, to time the lock hold"""
+
+    def __init__(self, engine):
+        self.local = threading.local()
+        event.listen(engine, 'after_cursor_execute', self.after_execute)
+
+    def after_execute(self, connection, cursor, statement, parameters, context, executemany):
+        if getattr(self.local, 'started', None) is None and \
+                not statement.lstrip().upper().startswith('SELECT'):
+            self.local.started = time.perf_counter()
+
+    def stop(self):
+        """Seconds since the first write, called once the transaction has ended"""
+        started, self.local.started = getattr(self.local, 'started', None), None
+        return None if started is None else time.perf_counter() - started
+
+
+def assign_read_modify_write(ticket_id, agent_id):
+    ticket = db.session.get(Ticket, ticket_id)
+    ticket.agent_id = agent_id
+    # Autoflushes the change above, so the lock is held from here on
+    ticket.status_id = Status.query.filter_by(name='In Progress').first().id
+    AssignmentEngine.snapshot(ticket)
+    db.session.commit()
+
+
+def assign_conditional(ticket_id, agent_id):
+    ticket = db.session.get(Ticket, ticket_id)
+    AssignmentEngine.snapshot(ticket)
+    with unit_of_work():
+        transition(ticket, 'In Progress', agent_id=agent_id)
+
+
+def run(mode, assignments, threads, tickets):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app(path, tickets)
+    agents = app.config['BENCH_AGENTS']
+    assign = assign_read_modify_write if mode == 'read-modify-write' else assign_conditional
+    conflicts, holds = [], []
+    with app.app_context():
+        timer = LockTimer(db.engine)
+
+    def worker(start):
+        with app.app_context():
+            for n in range(start, assignments, threads):
+                try:
+                    assign(n % tickets + 1, agents[n // tickets % len(agents)])
+                    hold = timer.stop()
+                    if hold is not None:
+                        holds.append(hold)
+                except (StaleDataError, TransitionConflict):
+                    db.session.rollback()
+                    timer.stop()
+                    conflicts.append(n)
+                db.session.remove()
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    holds.sort()
+    p95 = holds[int(len(holds) * 0.95) - 1] if holds else 0
+    print(f'{mode:18} {len(holds):6d} committed {len(conflicts):5d} conflicts  '
+          f'{len(holds) / elapsed:7,.0f}/s  lock hold mean {statistics.mean(holds) * 1000:6.2f} ms  '
+          f'p95 {p95 * 1000:6.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--assignments', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--tickets', type=int, default=20)
+    args = parser.parse_args()
+    for mode in ('read-modify-write', 'conditional'):
+        run(mode, args.assignments, args.threads, args.tickets)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,56 @@
+from contextlib import contextmanager
+
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+
+class RoutingSession(Session):
+    """Sends plain SELECTs to the read engine chosen for the current request.
+
+    ``g.read_engine`` is set by src/services/routing.py for requests that
+    may read from the read pool; flushes, DML and everything outside such
+    a request use the primary engine. Once a transaction has written, its
+    later reads use the primary too, so they see its uncommitted writes.
+
+    With sharding, ``g.shard_engine`` (set by src/services/sharding.py) is
+    the engine of the shard the request is routed to, and takes every
+    statement; it is None on the default shard, which is the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            shard_engine = g.get('shard_engine')
+            if shard_engine is not None:
+                return shard_engine
+        if bind is None and has_app_context() and g.get('read_engine') is not None:
+            if self._flushing or clause is None or not getattr(clause, 'is_select', False):
+                self.info['wrote'] = True
+            elif not self.info.get('wrote'):
+                return g.read_engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _forget_writes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('wrote', None)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+@contextmanager
+def unit_of_work():
+    """Commit everything done inside the block once, or roll it all back.
 
-db = SQLAlchemy()
\ No newline at end of file
+    Model methods only change state; request handlers wrap their writes in
+    a single unit of work so a request costs one transaction.
+    """
+    try:
+        yield db.session
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
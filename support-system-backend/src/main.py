@@ -10,13 +10,31 @@ from src.models.status import Status
 from src.models.ticket import Ticket
 from src.models.message import Message
 from src.models.knowledge_base import KnowledgeBaseArticle
+from src.models.attachment import Attachment
 from src.routes.user import user_bp
 from src.routes.ticket import ticket_bp
 from src.routes.message import message_bp
 from src.routes.status import status_bp
 from src.routes.knowledge_base import knowledge_bp
 from src.routes.company import bp as company_bp
+from src.routes.export import export_bp
+from src.routes.analytics import analytics_bp
+from src.routes.profiling import profiling_bp
+from src.routes.attachment import attachment_bp
 from src.models.user import db, User
+from src.services import schema, sla
+from src.services.ratelimit import limiter, write_admission
+from src.services.group_commit import group_committer
+from src.services import search
+from src.services.export import export_command
+from src.services import rollups
+from src.services.compression import compressor
+from src.services import transitions
+from src.services.routing import read_router
+from src.services.profiling import request_profiler
+from src.services.attachments import blob_store
+from src.services.suggest import suggestions
+from src.services.sharding import shard_router
 
 app = Flask(__name__, 
             static_folder=os.path.join(os.path.dirname(__file__), 'static'),
@@ -36,19 +54,130 @@ app.register_blueprint(ticket_bp, url_prefix='/api')
 app.register_blueprint(message_bp, url_prefix='/api')
 app.register_blueprint(status_bp, url_prefix='/api')
 app.register_blueprint(knowledge_bp, url_prefix='/api')
-app.register_blueprint(company_bp, url_prefix='/api')
+app.register_blueprint(company_bp)
+app.register_blueprint(export_bp, url_prefix='/api')
+app.register_blueprint(analytics_bp, url_prefix='/api')
+app.register_blueprint(profiling_bp, url_prefix='/api')
+app.register_blueprint(attachment_bp, url_prefix='/api')
+app.cli.add_command(export_command)
 
 # Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+# Databases and stored files live in DATA_DIR; SUPPORT_DATA_DIR moves them (e.g. for tests)
+DATA_DIR = os.environ.get('SUPPORT_DATA_DIR', os.path.join(os.path.dirname(__file__), 'database'))
+app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(DATA_DIR, 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# Read routing: GET requests read from a separate pool. Without a read URI,
+# SQLite reads use read-only connections to the same (WAL) database file
+app.config['READ_ROUTING_ENABLED'] = True
+app.config['SQLALCHEMY_READ_URI'] = None  # e.g. a PostgreSQL streaming replica
+app.config['READ_POOL_SIZE'] = 10
+app.config['READ_AFTER_WRITE_SECONDS'] = 5  # replica only: keep a user's reads on the primary after their write
+
+# Sharding: each company's tickets and messages live in one of SHARD_URIS; users,
+# companies, articles and companies already on the primary stay on the primary
+app.config['SHARDING_ENABLED'] = False
+app.config['SHARD_URIS'] = {
+    'shard1': f"sqlite:///{os.path.join(DATA_DIR, 'shard1.db')}",
+    'shard2': f"sqlite:///{os.path.join(DATA_DIR, 'shard2.db')}",
+}
+app.config['SHARD_MAP_TTL'] = 5  # seconds; workers notice a company move within this
+
+# Ticket assignment
+app.config['AUTO_ASSIGN_ON_MODERATION'] = True
+app.config['ASSIGNMENT_COMPANY_AFFINITY'] = True
+app.config['ASSIGNMENT_REBUILD_INTERVAL'] = 300  # seconds; resyncs load across workers
+
+# SLA tracking: business hours are local to SLA_TIMEZONE
+app.config['SLA_TIMEZONE'] = 'Europe/Moscow'
+app.config['SLA_BUSINESS_HOURS'] = (9, 18)
+app.config['SLA_WORKDAYS'] = (0, 1, 2, 3, 4)
+app.config['SLA_HOLIDAYS'] = ()
+app.config['SLA_AT_RISK_WINDOW'] = 3600  # seconds
+app.config['SLA_SCANNER_INTERVAL'] = 60  # seconds; 0 disables the background scanner
+
+# Company dashboards
+app.config['COMPANY_SUMMARY_TTL'] = 30  # seconds
+
+# Rate limiting; use 'sqlite:///<path>' to share buckets between worker processes
+app.config['RATE_LIMIT_ENABLED'] = True
+app.config['RATE_LIMIT_BACKEND'] = 'memory'
+app.config['RATE_LIMITS'] = {
+    'login': [{'rate': '10/minute', 'key': 'ip'}],
+    'create_ticket': [{'rate': '30/hour', 'burst': 10, 'key': 'user'}],
+    'create_message': [{'rate': '60/minute', 'burst': 20, 'key': 'user'},
+                       {'rate': '600/minute', 'key': 'route'}],
+    'upload_attachment': [{'rate': '60/hour', 'burst': 20, 'key': 'user'}],
+    'suggest': [{'rate': '120/minute', 'burst': 30, 'key': 'user'}],
+}
+# Concurrent write requests per process before new ones wait, then get a 503
+app.config['WRITE_CONCURRENCY_LIMIT'] = 8
+app.config['WRITE_ADMISSION_TIMEOUT'] = 1.0  # seconds
+# Uploads stream to disk and only touch the database briefly at the end
+app.config['WRITE_ADMISSION_EXEMPT_ENDPOINTS'] = ['attachment.upload_attachment']
+
+# Group commit: batch concurrent message writes into shared transactions
+app.config['GROUP_COMMIT_ENABLED'] = False
+app.config['GROUP_COMMIT_MAX_BATCH'] = 64
+app.config['GROUP_COMMIT_MAX_DELAY'] = 0.002  # seconds
+
+# Ticket search index; full rebuild interval bounds drift between workers
+app.config['SEARCH_REBUILD_INTERVAL'] = 3600  # seconds
+
+# Suggestions while a ticket is written; the index is saved here for fast warm starts
+app.config['SUGGEST_INDEX_PATH'] = os.path.join(DATA_DIR, 'suggest_index.npz')
+app.config['SUGGEST_SYNC_INTERVAL'] = 300  # seconds; picks up other workers' writes
+
+# Response compression; brotli/zstd are used only when their packages are installed
+app.config['COMPRESS_ENABLED'] = True
+app.config['COMPRESS_ALGORITHMS'] = ['zstd', 'br', 'gzip']  # server preference order
+app.config['COMPRESS_LEVELS'] = {'gzip': 6, 'br': 4, 'zstd': 3}
+app.config['COMPRESS_MIN_SIZE'] = 1024  # bytes; smaller responses are sent as-is
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'application/x-ndjson', 'text/csv',
+                                    'text/html', 'text/css', 'application/javascript']
+# Message attachments, stored once per distinct content
+app.config['ATTACHMENT_DIR'] = os.path.join(DATA_DIR, 'attachments')
+app.config['ATTACHMENT_MAX_SIZE'] = 25 * 1024 * 1024  # bytes
+app.config['ATTACHMENT_MAX_PER_MESSAGE'] = 10
+
+# Request profiling: admins send X-Profile: 1 (or ?_profile=1) to profile a request
+app.config['PROFILING_ENABLED'] = True
+app.config['PROFILE_SAMPLE_RATE'] = 0.0  # fraction of all requests profiled automatically
+app.config['PROFILE_BUFFER_SIZE'] = 50  # most recent profiles kept in memory
+app.config['PROFILE_MAX_SQL'] = 500  # statements recorded per profile
+app.config['PROFILE_EXCLUDED_PATHS'] = ['/api/admin/profiles']
 db.init_app(app)
+read_router.init_app(app)
+shard_router.init_app(app)
+limiter.init_app(app)
+write_admission.init_app(app)
+group_committer.init_app(app)
+search.init_app(app)
+rollups.init_app(app)
+compressor.init_app(app)
+transitions.init_app(app)
+request_profiler.init_app(app)
+blob_store.init_app(app)
+suggestions.init_app(app)
 with app.app_context():
     db.create_all()
+    # Add columns introduced since the database was created
+    schema.upgrade()
+    for engine in shard_router.engines.values():
+        schema.upgrade(engine)
     # Initialize default statuses
     Status.init_default_statuses()
     # Initialize default knowledge base articles
     KnowledgeBaseArticle.init_default_articles()
+    KnowledgeBaseArticle.render_missing()
     User.init_default_users()
+    # Compute SLA due times for tickets created before SLA tracking
+    sla.backfill(sla.BusinessCalendar.from_config(app.config))
+    # Reopened tickets used to keep their closed_at
+    transitions.clear_reopened()
+
+if app.config['SLA_SCANNER_INTERVAL']:
+    sla.sla_scanner.start(app, app.config['SLA_SCANNER_INTERVAL'])
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
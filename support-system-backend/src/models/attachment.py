@@ -0,0 +1,30 @@
+from src.extensions import db
+from datetime import datetime
+
+class Attachment(db.Model):
+    """A file attached to a message; the bytes live in the blob store under their sha256"""
+    id = db.Column(db.Integer, primary_key=True)
+    message_id = db.Column(db.Integer, db.ForeignKey('message.id'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Sparse fieldsets (see src/services/fields.py)
+    API_COLUMNS = ('id', 'message_id', 'filename', 'content_type', 'size', 'sha256', 'created_at')
+
+    def __repr__(self):
+        return f'<Attachment {self.id}: {self.filename}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'message_id': self.message_id,
+            'filename': self.filename,
+            'content_type': self.content_type,
+            'size': self.size,
+            'sha256': self.sha256,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'url': f'/api/attachments/{self.id}'
+        }
@@ -10,6 +10,9 @@ class Company(db.Model):
     # Relationships
     customers = db.relationship('User', backref='company', lazy='dynamic')
 
+    # Sparse fieldsets (see src/services/fields.py)
+    API_COLUMNS = ('id', 'name', 'created_at', 'updated_at')
+
     def __repr__(self):
         return f'<Company {self.name}>'
 
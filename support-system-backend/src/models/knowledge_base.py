@@ -1,12 +1,18 @@
 from src.extensions import db
+from src.services.markup import excerpt, render_markdown
 from datetime import datetime
+from sqlalchemy import or_
+from sqlalchemy.orm import deferred, undefer
 
 class KnowledgeBaseArticle(db.Model):
     __tablename__ = 'knowledge_base_articles'
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
-    content = db.Column(db.Text, nullable=False)
+    # Full bodies are only loaded when accessed (article detail), not in lists
+    content = deferred(db.Column(db.Text, nullable=False))
+    content_html = deferred(db.Column(db.Text, nullable=True))
+    excerpt = db.Column(db.String(300), nullable=True)
     category = db.Column(db.String(100), nullable=False)
     author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -15,11 +21,34 @@ class KnowledgeBaseArticle(db.Model):
     # Relationships
     author = db.relationship('User', backref='knowledge_articles')
     
+    def render(self):
+        """Regenerate the cached HTML and excerpt; call whenever content changes"""
+        self.content_html = render_markdown(self.content)
+        self.excerpt = excerpt(self.content_html, self.title)
+
+    def to_summary_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'excerpt': self.excerpt,
+            'category': self.category,
+            'author_id': self.author_id,
+            'author': {
+                'id': self.author.id,
+                'username': self.author.username,
+                'email': self.author.email
+            } if self.author else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
     def to_dict(self):
         return {
             'id': self.id,
             'title': self.title,
             'content': self.content,
+            'content_html': self.content_html,
+            'excerpt': self.excerpt,
             'category': self.category,
             'author_id': self.author_id,
             'author': {
@@ -157,7 +186,27 @@ class KnowledgeBaseArticle(db.Model):
             
             for article_data in default_articles:
                 article = KnowledgeBaseArticle(**article_data)
+                article.render()
                 db.session.add(article)
             
             db.session.commit()
 
+    @staticmethod
+    def render_missing():
+        """Render articles saved before HTML caching existed, or cached by an older renderer.
+
+        Only bodies with ``&`` or ``<`` rendered differently before
+        (they were escaped twice); articles whose HTML is unchanged are
+        not written.
+        """
+        article = KnowledgeBaseArticle
+        articles = article.query.options(undefer(article.content), undefer(article.content_html)).filter(
+            or_(article.excerpt.is_(None), article.content.contains('&'), article.content.contains('<'))
+        ).all()
+        stale = [item for item in articles
+                 if item.excerpt is None or item.content_html != render_markdown(item.content)]
+        for item in stale:
+            item.render()
+        if stale:
+            db.session.commit()
+
@@ -7,6 +7,22 @@ class Message(db.Model):
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # A ticket's thread in order, and keyset paging over it (exports)
+    __table_args__ = (
+        db.Index('ix_message_ticket_id_id', 'ticket_id', 'id'),
+    )
+    
+    # Relationships
+    attachments = db.relationship('Attachment', backref='message',
+                                  cascade='all, delete-orphan', order_by='Attachment.id')
+
+    # Sparse fieldsets (see src/services/fields.py)
+    API_COLUMNS = ('id', 'ticket_id', 'sender_id', 'content', 'created_at')
+    API_RELATIONS = {
+        'sender': ('sender', 'sender_id'),
+        'attachments': ('attachments', 'id'),
+    }
 
     def __repr__(self):
         return f'<Message {self.id} in Ticket {self.ticket_id}>'
@@ -18,6 +34,7 @@ class Message(db.Model):
             'sender_id': self.sender_id,
             'content': self.content,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'sender': self.sender.to_dict() if self.sender else None
+            'sender': self.sender.to_dict() if self.sender else None,
+            'attachments': [attachment.to_dict() for attachment in self.attachments]
         }
 
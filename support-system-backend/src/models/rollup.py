@@ -0,0 +1,42 @@
+from src.extensions import db
+
+class TicketDailyStats(db.Model):
+    """Tickets created and closed per day, priority and agent (0 = unassigned)"""
+    __tablename__ = 'ticket_daily_stats'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    priority = db.Column(db.String(20), nullable=False)
+    agent_key = db.Column(db.Integer, nullable=False, default=0)
+    created = db.Column(db.Integer, nullable=False, default=0)
+    closed = db.Column(db.Integer, nullable=False, default=0)
+    resolution_seconds = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'priority', 'agent_key', name='uq_ticket_daily_stats'),
+    )
+
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'priority': self.priority,
+            'agent_id': self.agent_key or None,
+            'created': self.created,
+            'closed': self.closed,
+            'resolution_seconds': self.resolution_seconds
+        }
+
+class TicketResolutionBucket(db.Model):
+    """Histogram of resolution times (closed_at - created_at) of tickets closed per day"""
+    __tablename__ = 'ticket_resolution_buckets'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    priority = db.Column(db.String(20), nullable=False)
+    agent_key = db.Column(db.Integer, nullable=False, default=0)
+    bucket = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'priority', 'agent_key', 'bucket', name='uq_ticket_resolution_buckets'),
+    )
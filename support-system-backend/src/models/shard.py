@@ -0,0 +1,27 @@
+from src.extensions import db
+from datetime import datetime
+
+class CompanyShard(db.Model):
+    """Which shard holds a company's tickets and messages (primary database)"""
+    __tablename__ = 'company_shards'
+
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), primary_key=True)
+    shard = db.Column(db.String(64), nullable=False, index=True)
+    # Set while the company is being copied to another shard; its requests get a 503
+    moving = db.Column(db.Boolean, nullable=False, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class LegacyRowLocation(db.Model):
+    """Company of a row created before sharding, once it has left the default shard (primary database)"""
+    __tablename__ = 'shard_legacy_rows'
+
+    table_name = db.Column(db.String(64), primary_key=True)
+    row_id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, nullable=False, index=True)
+
+class ShardIdCounter(db.Model):
+    """Last id handed out to a company's rows; lives on the company's shard"""
+    __tablename__ = 'shard_id_counters'
+
+    company_id = db.Column(db.Integer, primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
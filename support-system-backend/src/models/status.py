@@ -1,9 +1,33 @@
 from src.extensions import db
 
+_status_ids = {}
+_status_names = {}
+
 class Status(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
     description = db.Column(db.Text)
+
+    # Sparse fieldsets (see src/services/fields.py)
+    API_COLUMNS = ('id', 'name', 'description')
+
+    # Statuses in which a ticket no longer counts as active work
+    INACTIVE_NAMES = ('Resolved', 'Closed')
+    # Statuses set by replies rather than by an explicit status change
+    REPLY_NAMES = ('Awaiting Customer Reply', 'Awaiting Agent Reply')
+
+    # Allowed status changes; staying in the same status is always allowed.
+    # Tickets enter moderation only on creation and leave it by approval
+    # (Open / In Progress) or rejection (Closed).
+    TRANSITIONS = {
+        'Pending Moderation': ('Open', 'In Progress', 'Closed'),
+        'Open': ('In Progress', 'Awaiting Customer Reply', 'Awaiting Agent Reply', 'Resolved', 'Closed'),
+        'In Progress': ('Open', 'Awaiting Customer Reply', 'Awaiting Agent Reply', 'Resolved', 'Closed'),
+        'Awaiting Customer Reply': ('Open', 'In Progress', 'Awaiting Agent Reply', 'Resolved', 'Closed'),
+        'Awaiting Agent Reply': ('Open', 'In Progress', 'Awaiting Customer Reply', 'Resolved', 'Closed'),
+        'Resolved': ('Open', 'In Progress', 'Awaiting Customer Reply', 'Awaiting Agent Reply', 'Closed'),
+        'Closed': ('Open', 'In Progress', 'Awaiting Customer Reply', 'Awaiting Agent Reply'),
+    }
     
     # Relationships
     tickets = db.relationship('Ticket', backref='status', lazy='dynamic')
@@ -11,6 +35,32 @@ class Status(db.Model):
     def __repr__(self):
         return f'<Status {self.name}>'
 
+    @staticmethod
+    def get_id(name):
+        """Id of a status by name, cached per process (statuses are seeded once)"""
+        status_id = _status_ids.get(name)
+        if status_id is None:
+            status = Status.query.filter_by(name=name).first()
+            if status is None:
+                return None
+            status_id = _status_ids[name] = status.id
+        return status_id
+
+    @staticmethod
+    def get_name(status_id):
+        """Name of a status by id, cached like ``get_id``"""
+        name = _status_names.get(status_id)
+        if name is None:
+            status = db.session.get(Status, status_id)
+            if status is None:
+                return None
+            name = _status_names[status_id] = status.name
+        return name
+
+    @staticmethod
+    def can_transition(from_name, to_name):
+        return from_name == to_name or to_name in Status.TRANSITIONS.get(from_name, ())
+
     def to_dict(self):
         return {
             'id': self.id,
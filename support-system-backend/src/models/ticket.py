@@ -1,5 +1,6 @@
 from src.extensions import db
 from datetime import datetime
+from sqlalchemy.orm import selectinload
 
 class Ticket(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -12,10 +13,29 @@ class Ticket(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     closed_at = db.Column(db.DateTime, nullable=True)
+    sla_due_at = db.Column(db.DateTime, nullable=True)
+    # Bumped by every update, which goes through a conditional UPDATE on it
+    # (src/services/transitions.py); replies retry theirs, so they never conflict
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    # Breach scans are range scans over active statuses only
+    __table_args__ = (
+        db.Index('ix_ticket_status_sla_due', 'status_id', 'sla_due_at'),
+    )
     
     # Relationships
     messages = db.relationship('Message', backref='ticket', lazy='dynamic', cascade='all, delete-orphan')
 
+    # Sparse fieldsets (see src/services/fields.py)
+    API_COLUMNS = ('id', 'customer_id', 'agent_id', 'status_id', 'title', 'description', 'priority',
+                   'created_at', 'updated_at', 'closed_at', 'sla_due_at', 'version')
+    API_RELATIONS = {
+        'customer': ('customer', 'customer_id'),
+        'agent': ('agent', 'agent_id'),
+        'status': ('status', 'status_id'),
+    }
+    API_COMPUTED = {'sla_breached': ['sla_due_at', 'closed_at', 'updated_at', 'status_id']}
+
     def __repr__(self):
         return f'<Ticket {self.id}: {self.title}>'
 
@@ -31,38 +51,72 @@ class Ticket(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
             'closed_at': self.closed_at.isoformat() if self.closed_at else None,
+            'sla_due_at': self.sla_due_at.isoformat() if self.sla_due_at else None,
+            'version': self.version,
+            'sla_breached': self.sla_breached(),
             'customer': self.customer.to_dict() if self.customer else None,
             'agent': self.agent.to_dict() if self.agent else None,
             'status': self.status.to_dict() if self.status else None
         }
         
         if include_messages:
-            result['messages'] = [msg.to_dict() for msg in self.messages.order_by('created_at')]
+            from src.models.message import Message
+            messages = self.messages.options(selectinload(Message.attachments)).order_by('created_at')
+            result['messages'] = [msg.to_dict() for msg in messages]
             
         return result
 
-    def update_status_based_on_action(self, action_user_role, new_status_name=None):
-        """Update ticket status based on user action"""
+    def update_sla_due(self, calendar):
+        """Recompute the SLA due time from creation time and priority"""
+        from src.services.sla import compute_due
+        
+        self.sla_due_at = compute_due(self.created_at or datetime.utcnow(), self.priority, calendar)
+
+    def sla_breached(self, now=None):
         from src.models.status import Status
         
+        if not self.sla_due_at:
+            return False
+        if self.status and self.status.name in Status.INACTIVE_NAMES:
+            finished_at = self.closed_at or self.updated_at
+            return bool(finished_at) and finished_at > self.sla_due_at
+        return (now or datetime.utcnow()) > self.sla_due_at
+
+    def update_status_based_on_action(self, action_user_role, new_status_name=None, seen_status_id=None):
+        """Update ticket status based on user action.
+
+        The change is a conditional UPDATE (``transitions.transition``).
+        When another request changed the ticket first, the ticket is
+        re-read and the change retried. A status set since
+        ``seen_status_id`` (the one the sender was looking at) by anything
+        but another reply stands, so a reply never undoes a concurrent
+        close. Flushes; the caller's unit of work commits.
+        """
+        from src.models.status import Status
+        from src.services.transitions import TransitionConflict, transition
+        
         if new_status_name:
             # Explicit status change
-            new_status = Status.query.filter_by(name=new_status_name).first()
-            if new_status:
-                self.status_id = new_status.id
+            status_name = new_status_name
+        elif action_user_role == 'agent':
+            # Agent replied, waiting for customer
+            status_name = 'Awaiting Customer Reply'
+        elif action_user_role == 'customer':
+            # Customer replied, waiting for agent
+            status_name = 'Awaiting Agent Reply'
         else:
-            # Automatic status change based on message sender
-            if action_user_role == 'agent':
-                # Agent replied, waiting for customer
-                awaiting_customer = Status.query.filter_by(name='Awaiting Customer Reply').first()
-                if awaiting_customer:
-                    self.status_id = awaiting_customer.id
-            elif action_user_role == 'customer':
-                # Customer replied, waiting for agent
-                awaiting_agent = Status.query.filter_by(name='Awaiting Agent Reply').first()
-                if awaiting_agent:
-                    self.status_id = awaiting_agent.id
+            status_name = None
         
-        self.updated_at = datetime.utcnow()
-        db.session.commit()
-
+        if seen_status_id is None:
+            seen_status_id = self.status_id
+        while True:
+            current = Status.get_name(self.status_id)
+            if self.status_id != seen_status_id and current not in Status.REPLY_NAMES:
+                status_name = None
+            # Replies never skip moderation
+            if status_name and not Status.can_transition(current, status_name):
+                status_name = None
+            try:
+                return transition(self, status_name)
+            except TransitionConflict:
+                db.session.refresh(self)
@@ -19,6 +19,10 @@ class User(db.Model):
     assigned_tickets = db.relationship('Ticket', foreign_keys='Ticket.agent_id', backref='agent', lazy='dynamic')
     messages = db.relationship('Message', backref='sender', lazy='dynamic')
 
+    # Sparse fieldsets (see src/services/fields.py)
+    API_COLUMNS = ('id', 'username', 'email', 'role', 'company_id', 'created_at', 'updated_at')
+    API_RELATIONS = {'company': ('company', 'company_id')}
+
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
 
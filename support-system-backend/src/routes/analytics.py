@@ -0,0 +1,35 @@
+from datetime import date, datetime, timedelta
+from flask import Blueprint, jsonify, request
+from src.routes.user import admin_required
+from src.services import rollups
+
+analytics_bp = Blueprint('analytics', __name__)
+
+@analytics_bp.route('/analytics/tickets', methods=['GET'])
+@admin_required
+def ticket_analytics():
+    """Tickets created/closed per day, backlog and resolution times, read from rollups"""
+    try:
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else datetime.utcnow().date()
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') \
+            else end - timedelta(days=29)
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    if start > end:
+        return jsonify({'error': 'start must not be after end'}), 400
+    if (end - start).days > 3660:
+        return jsonify({'error': 'Range is limited to 10 years'}), 400
+    
+    result = rollups.ticket_series(
+        start, end,
+        priority=request.args.get('priority'),
+        agent_id=request.args.get('agent_id', type=int)
+    )
+    result.update({'start': start.isoformat(), 'end': end.isoformat()})
+    return jsonify(result)
+
+@analytics_bp.route('/analytics/rollups/rebuild', methods=['POST'])
+@admin_required
+def rebuild_rollups():
+    daily, buckets = rollups.rebuild()
+    return jsonify({'daily_rows': daily, 'histogram_rows': buckets})
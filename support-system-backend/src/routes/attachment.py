@@ -0,0 +1,93 @@
+import mimetypes
+import os
+from flask import Blueprint, current_app, jsonify, request, send_file, session
+from src.extensions import unit_of_work
+from src.models.attachment import Attachment
+from src.models.message import Message
+from src.models.user import User, db
+from src.routes.message import can_post_to_ticket, can_view_ticket
+from src.routes.user import login_required
+from src.services.attachments import AttachmentTooLarge, blob_store
+from src.services.ratelimit import limiter
+
+attachment_bp = Blueprint('attachment', __name__)
+
+# Shown in the browser; everything else is downloaded, so uploaded HTML or
+# SVG never renders in our origin
+INLINE_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'text/plain', 'application/pdf'}
+
+@attachment_bp.route('/messages/<int:message_id>/attachments', methods=['POST'])
+@login_required
+@limiter.limit('upload_attachment')
+def upload_attachment(message_id):
+    """Attach the raw request body to a message; the name comes from ?filename="""
+    user = User.query.get(session['user_id'])
+    message = Message.query.get_or_404(message_id)
+    
+    # Only the sender attaches files, and only while they may still post to the ticket
+    if message.sender_id != user.id or not can_post_to_ticket(user, message.ticket):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    filename = os.path.basename(request.args.get('filename', '').replace('\\', '/')).strip()[:255]
+    if not filename:
+        return jsonify({'error': 'filename is required'}), 400
+    content_type = request.mimetype
+    if not content_type or content_type in ('application/x-www-form-urlencoded', 'multipart/form-data'):
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    
+    max_size = current_app.config.get('ATTACHMENT_MAX_SIZE', 25 * 1024 * 1024)
+    max_count = current_app.config.get('ATTACHMENT_MAX_PER_MESSAGE', 10)
+    if request.content_length is None and not request.environ.get('wsgi.input_terminated'):
+        # The server can't tell where a chunked body ends, so it would read as empty
+        return jsonify({'error': 'Content-Length is required'}), 411
+    if request.content_length is not None and request.content_length > max_size:
+        return jsonify({'error': f'Attachments are limited to {max_size} bytes'}), 413
+    if len(message.attachments) >= max_count:
+        return jsonify({'error': f'A message can have at most {max_count} attachments'}), 400
+    
+    # Don't hold a pooled connection while the body trickles in
+    db.session.close()
+    try:
+        sha256, size = blob_store.store(request.stream, max_size)
+    except AttachmentTooLarge:
+        return jsonify({'error': f'Attachments are limited to {max_size} bytes'}), 413
+    if size == 0:
+        return jsonify({'error': 'Attachment is empty'}), 400
+    
+    with unit_of_work() as uow:
+        if Attachment.query.filter_by(message_id=message_id).count() >= max_count:
+            return jsonify({'error': f'A message can have at most {max_count} attachments'}), 400
+        attachment = Attachment(message_id=message_id, filename=filename,
+                                content_type=content_type[:100], size=size, sha256=sha256)
+        uow.add(attachment)
+    
+    return jsonify(attachment.to_dict()), 201
+
+@attachment_bp.route('/attachments/<int:attachment_id>', methods=['GET'])
+@login_required
+def download_attachment(attachment_id):
+    """Serve an attachment with Range, ETag and If-None-Match support"""
+    user = User.query.get(session['user_id'])
+    attachment = Attachment.query.get_or_404(attachment_id)
+    
+    if not can_view_ticket(user, attachment.message.ticket):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    path = blob_store.path(attachment.sha256)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Attachment file is missing'}), 404
+    
+    response = send_file(
+        path,
+        mimetype=attachment.content_type,
+        as_attachment=attachment.content_type not in INLINE_TYPES,
+        download_name=attachment.filename,
+        conditional=True,
+        etag=attachment.sha256,
+        max_age=3600
+    )
+    # Content never changes for an id, but only the user allowed to see it may cache it
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
@@ -1,18 +1,24 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from src.models.company import Company
 from src.extensions import db
-from flask_jwt_extended import jwt_required
+from src.routes.user import login_required, admin_required
+from src.services import fields
+from src.services.company_summary import company_summaries, company_summary, summary_cache
 
 bp = Blueprint('company', __name__, url_prefix='/api/companies')
 
 @bp.route('/', methods=['GET'])
-@jwt_required()
+@login_required
 def get_companies():
-    companies = Company.query.order_by(Company.name).all()
-    return jsonify([c.to_dict() for c in companies])
+    try:
+        projection = fields.parse(request.args, Company)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    companies = Company.query.options(*fields.query_options(Company, projection)).order_by(Company.name).all()
+    return jsonify([fields.serialize(c, projection) for c in companies])
 
 @bp.route('/', methods=['POST'])
-@jwt_required()
+@admin_required
 def create_company():
     data = request.get_json()
     name = data.get('name')
@@ -23,12 +29,31 @@ def create_company():
     company = Company(name=name)
     db.session.add(company)
     db.session.commit()
+    summary_cache.clear()
     return jsonify(company.to_dict()), 201
 
 @bp.route('/<int:company_id>', methods=['DELETE'])
-@jwt_required()
+@admin_required
 def delete_company(company_id):
     company = Company.query.get_or_404(company_id)
     db.session.delete(company)
     db.session.commit()
+    summary_cache.clear()
     return '', 204
+
+@bp.route('/summary', methods=['GET'])
+@admin_required
+def get_company_summaries():
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    summary_cache.ttl = current_app.config.get('COMPANY_SUMMARY_TTL', 30)
+    return jsonify(company_summaries(page, per_page))
+
+@bp.route('/<int:company_id>/summary', methods=['GET'])
+@admin_required
+def get_company_summary(company_id):
+    summary_cache.ttl = current_app.config.get('COMPANY_SUMMARY_TTL', 30)
+    summary = company_summary(company_id)
+    if summary is None:
+        return jsonify({'error': 'Компания не найдена'}), 404
+    return jsonify(summary)
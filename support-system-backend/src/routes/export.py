@@ -0,0 +1,30 @@
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from src.routes.user import admin_required
+from src.services.export import FORMATS, export, parse_datetime
+
+export_bp = Blueprint('export', __name__)
+
+@export_bp.route('/admin/export/tickets', methods=['GET'])
+@admin_required
+def export_tickets():
+    """Stream all tickets with their messages (admin only)"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify({'error': f"Format must be one of: {', '.join(sorted(FORMATS))}"}), 400
+    try:
+        filters = {
+            'since': parse_datetime(request.args.get('since')),
+            'until': parse_datetime(request.args.get('until')),
+            'status': request.args.get('status'),
+            'company_id': request.args.get('company_id', type=int),
+            'after_id': request.args.get('after_id', type=int),
+            'until_id': request.args.get('until_id', type=int),
+            'chunk_size': min(max(request.args.get('chunk_size', 500, type=int), 1), 5000),
+        }
+    except ValueError:
+        return jsonify({'error': 'Dates must be in ISO format'}), 400
+    
+    extension = 'csv' if fmt == 'csv' else 'ndjson'
+    response = Response(stream_with_context(export(fmt, **filters)), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=tickets.{extension}'
+    return response
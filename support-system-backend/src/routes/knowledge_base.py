@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, session
 from src.models.user import db, User
 from src.models.knowledge_base import KnowledgeBaseArticle
+from sqlalchemy.orm import joinedload, undefer
 
 knowledge_bp = Blueprint('knowledge', __name__)
 
@@ -22,9 +23,11 @@ def get_articles():
                 KnowledgeBaseArticle.content.contains(search)
             )
         
-        articles = query.order_by(KnowledgeBaseArticle.created_at.desc()).all()
+        # content and content_html are deferred, so the list never loads bodies
+        articles = query.options(joinedload(KnowledgeBaseArticle.author)).order_by(
+            KnowledgeBaseArticle.created_at.desc()).all()
         
-        return jsonify([article.to_dict() for article in articles])
+        return jsonify([article.to_summary_dict() for article in articles])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -32,7 +35,9 @@ def get_articles():
 def get_article(article_id):
     """Get a specific knowledge base article"""
     try:
-        article = KnowledgeBaseArticle.query.get_or_404(article_id)
+        article = KnowledgeBaseArticle.query.options(
+            undefer(KnowledgeBaseArticle.content), undefer(KnowledgeBaseArticle.content_html)
+        ).filter_by(id=article_id).first_or_404()
         return jsonify(article.to_dict())
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -60,6 +65,7 @@ def create_article():
             category=data['category'],
             author_id=user.id
         )
+        article.render()
         
         db.session.add(article)
         db.session.commit()
@@ -93,6 +99,8 @@ def update_article(article_id):
             article.content = data['content']
         if 'category' in data:
             article.category = data['category']
+        if 'title' in data or 'content' in data:
+            article.render()
         
         db.session.commit()
         
@@ -1,36 +1,71 @@
 from flask import Blueprint, jsonify, request, session
+from src.extensions import unit_of_work
 from src.models.user import User, db
 from src.models.ticket import Ticket
 from src.models.message import Message
 from src.routes.user import login_required
+from src.services.assignment import assignment_engine
+from src.services.group_commit import group_committer
+from src.services.ratelimit import limiter
+from src.services import fields
 
 message_bp = Blueprint('message', __name__)
 
+def can_view_ticket(user, ticket):
+    """Customers see their own tickets, agents their own and unassigned ones"""
+    if user.role == 'customer':
+        return ticket.customer_id == user.id
+    if user.role == 'agent':
+        return ticket.agent_id == user.id or ticket.agent_id is None
+    return True
+
+def can_post_to_ticket(user, ticket):
+    """Customers post to their own tickets, agents only to tickets assigned to them"""
+    if user.role == 'customer':
+        return ticket.customer_id == user.id
+    if user.role == 'agent':
+        return ticket.agent_id == user.id
+    return True
+
 @message_bp.route('/tickets/<int:ticket_id>/messages', methods=['POST'])
 @login_required
+@limiter.limit('create_message')
 def create_message(ticket_id):
     data = request.json
     user = User.query.get(session['user_id'])
     ticket = Ticket.query.get_or_404(ticket_id)
     
     # Check access permissions
-    if user.role == 'customer' and ticket.customer_id != user.id:
-        return jsonify({'error': 'Access denied'}), 403
-    elif user.role == 'agent' and ticket.agent_id != user.id:
+    if not can_post_to_ticket(user, ticket):
         return jsonify({'error': 'Access denied'}), 403
     
-    message = Message(
-        ticket_id=ticket_id,
-        sender_id=user.id,
-        content=data['content']
-    )
+    before = assignment_engine.snapshot(ticket)
+    sender_id, sender_role = user.id, user.role
+    seen_status_id = ticket.status_id
     
-    db.session.add(message)
+    def write(db_session):
+        message = Message(
+            ticket_id=ticket_id,
+            sender_id=sender_id,
+            content=data['content']
+        )
+        db_session.add(message)
+        
+        # Update ticket status based on who sent the message, unless it changed since it was read
+        db_session.get(Ticket, ticket_id).update_status_based_on_action(
+            sender_role, seen_status_id=seen_status_id)
+        db_session.flush()
+        return message.id
     
-    # Update ticket status based on who sent the message
-    ticket.update_status_based_on_action(user.role)
-    
-    db.session.commit()
+    # Message and status change commit together, in one transaction
+    if group_committer.enabled:
+        message_id = group_committer.run(write)
+        db.session.refresh(ticket)
+    else:
+        with unit_of_work() as uow:
+            message_id = write(uow)
+    message = Message.query.get(message_id)
+    assignment_engine.update(before, assignment_engine.snapshot(ticket))
     
     return jsonify(message.to_dict()), 201
 
@@ -41,12 +76,16 @@ def get_messages(ticket_id):
     ticket = Ticket.query.get_or_404(ticket_id)
     
     # Check access permissions
-    if user.role == 'customer' and ticket.customer_id != user.id:
-        return jsonify({'error': 'Access denied'}), 403
-    elif user.role == 'agent' and ticket.agent_id != user.id and ticket.agent_id is not None:
+    if not can_view_ticket(user, ticket):
         return jsonify({'error': 'Access denied'}), 403
     
-    messages = Message.query.filter_by(ticket_id=ticket_id).order_by(Message.created_at.asc()).all()
+    try:
+        projection = fields.parse(request.args, Message)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    messages = Message.query.filter_by(ticket_id=ticket_id).options(
+        *fields.query_options(Message, projection)).order_by(Message.created_at.asc()).all()
     
-    return jsonify([message.to_dict() for message in messages])
+    return jsonify([fields.serialize(message, projection) for message in messages])
 
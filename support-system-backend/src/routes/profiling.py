@@ -0,0 +1,48 @@
+from flask import Blueprint, Response, jsonify
+from src.routes.user import admin_required
+from src.services.profiling import collapsed_stacks, request_profiler
+
+profiling_bp = Blueprint('profiling', __name__)
+
+@profiling_bp.route('/admin/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    """Recent request profiles, newest first"""
+    return jsonify([profile.summary() for profile in request_profiler.list()])
+
+@profiling_bp.route('/admin/profiles', methods=['DELETE'])
+@admin_required
+def clear_profiles():
+    request_profiler.clear()
+    return '', 204
+
+@profiling_bp.route('/admin/profiles/<int:profile_id>', methods=['GET'])
+@admin_required
+def get_profile(profile_id):
+    """SQL statements and the slowest functions of one profile"""
+    profile = request_profiler.get(profile_id)
+    if profile is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return jsonify(profile.to_dict())
+
+@profiling_bp.route('/admin/profiles/<int:profile_id>.pstats', methods=['GET'])
+@admin_required
+def download_pstats(profile_id):
+    """Binary pstats file, for python -m pstats, snakeviz and similar tools"""
+    profile = request_profiler.get(profile_id)
+    if profile is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    response = Response(profile.pstats_bytes(), mimetype='application/octet-stream')
+    response.headers['Content-Disposition'] = f'attachment; filename=profile-{profile_id}.pstats'
+    return response
+
+@profiling_bp.route('/admin/profiles/<int:profile_id>.collapsed', methods=['GET'])
+@admin_required
+def download_collapsed(profile_id):
+    """Collapsed stacks for flamegraph.pl, speedscope or inferno"""
+    profile = request_profiler.get(profile_id)
+    if profile is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    response = Response(collapsed_stacks(profile.stats), mimetype='text/plain')
+    response.headers['Content-Disposition'] = f'attachment; filename=profile-{profile_id}.collapsed'
+    return response
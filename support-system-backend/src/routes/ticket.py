@@ -1,9 +1,23 @@
-from flask import Blueprint, jsonify, request, session
+from flask import Blueprint, current_app, jsonify, request, session
+from src.extensions import unit_of_work
 from src.models.user import User, db
 from src.models.ticket import Ticket
 from src.models.status import Status
 from src.routes.user import login_required, admin_required
+from src.services.assignment import assignment_engine
+from src.services import sla
+from src.services.ratelimit import limiter
+from src.services.search import search_index, snippet, tokenize
+from src.services.sharding import by_shard, fan_out, shard_router
+from src.services.suggest import suggestions
+from src.services import fields
+from src.services.transitions import TransitionConflict, transition
+from src.models.message import Message
+from src.models.knowledge_base import KnowledgeBaseArticle
+from datetime import datetime
 from functools import wraps
+from operator import itemgetter
+import heapq
 
 ticket_bp = Blueprint('ticket', __name__)
 
@@ -18,8 +32,37 @@ def agent_or_admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def reserve_agent(ticket):
+    """Reserve load for the ticket on the least loaded agent.
+
+    Returns the agent id, or None if there are no agents. The caller must
+    assign the ticket with ``commit_assignment``, which releases the
+    reservation if the assignment fails.
+    """
+    assignment_engine.ensure_loaded(current_app.config.get('ASSIGNMENT_REBUILD_INTERVAL'))
+    company_id = ticket.customer.company_id if ticket.customer else None
+    return assignment_engine.reserve(
+        ticket.priority,
+        company_id,
+        affinity=current_app.config.get('ASSIGNMENT_COMPANY_AFFINITY', True)
+    )
+
+def commit_assignment(ticket, agent_id, expected_version=None, **values):
+    """Move the ticket to In Progress with a reserved agent and commit.
+
+    Releases the reserved load if the transition conflicts or the commit fails.
+    """
+    company_id = ticket.customer.company_id if ticket.customer else None
+    try:
+        with unit_of_work():
+            transition(ticket, 'In Progress', expected_version, agent_id=agent_id, **values)
+    except Exception:
+        assignment_engine.remove(agent_id, ticket.priority, company_id)
+        raise
+
 @ticket_bp.route('/tickets', methods=['POST'])
 @login_required
+@limiter.limit('create_ticket')
 def create_ticket():
     data = request.json
     user = User.query.get(session['user_id'])
@@ -38,11 +81,13 @@ def create_ticket():
         title=data['title'],
         description=data['description'],
         priority=data.get('priority', 'Medium'),
-        status_id=pending_status.id
+        status_id=pending_status.id,
+        created_at=datetime.utcnow()
     )
+    ticket.update_sla_due(sla.BusinessCalendar.from_config(current_app.config))
     
-    db.session.add(ticket)
-    db.session.commit()
+    with unit_of_work() as uow:
+        uow.add(ticket)
     
     return jsonify(ticket.to_dict()), 201
 
@@ -50,40 +95,161 @@ def create_ticket():
 @login_required
 def get_tickets():
     user = User.query.get(session['user_id'])
+    user_id, role = user.id, user.role
     
-    # Build query based on user role
-    if user.role == 'customer':
-        # Customers see only their tickets
-        tickets = Ticket.query.filter_by(customer_id=user.id)
-    elif user.role == 'agent':
-        # Agents see tickets assigned to them or unassigned tickets
-        tickets = Ticket.query.filter(
-            (Ticket.agent_id == user.id) | (Ticket.agent_id == None)
-        )
-    else:  # admin
-        # Admins see all tickets
-        tickets = Ticket.query
-    
-    # Apply filters
+    # Filters
     status_filter = request.args.get('status')
     priority_filter = request.args.get('priority')
     agent_filter = request.args.get('agent_id')
+    sla_filter = request.args.get('sla')
     
-    if status_filter:
-        status = Status.query.filter_by(name=status_filter).first()
-        if status:
-            tickets = tickets.filter_by(status_id=status.id)
+    try:
+        projection = fields.parse(request.args, Ticket)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    if priority_filter:
-        tickets = tickets.filter_by(priority=priority_filter)
+    merge = shard_router.enabled and role != 'customer'
     
-    if agent_filter and user.role == 'admin':
-        tickets = tickets.filter_by(agent_id=agent_filter)
+    def fetch():
+        # Build query based on user role
+        if role == 'customer':
+            # Customers see only their tickets
+            tickets = Ticket.query.filter_by(customer_id=user_id)
+        elif role == 'agent':
+            # Agents see tickets assigned to them or unassigned tickets
+            tickets = Ticket.query.filter(
+                (Ticket.agent_id == user_id) | (Ticket.agent_id == None)
+            )
+        else:  # admin
+            # Admins see all tickets
+            tickets = Ticket.query
+        
+        if status_filter:
+            status = Status.query.filter_by(name=status_filter).first()
+            if status:
+                tickets = tickets.filter_by(status_id=status.id)
+        
+        if priority_filter:
+            tickets = tickets.filter_by(priority=priority_filter)
+        
+        if agent_filter and role == 'admin':
+            tickets = tickets.filter_by(agent_id=agent_filter)
+        
+        if sla_filter == 'breached':
+            tickets = sla.breached_filter(tickets)
+        elif sla_filter == 'at_risk':
+            tickets = sla.at_risk_filter(tickets, current_app.config.get('SLA_AT_RISK_WINDOW', 3600))
+        
+        # Order by creation date (newest first)
+        tickets = tickets.options(*fields.query_options(Ticket, projection)).order_by(
+            Ticket.created_at.desc())
+        if not merge:
+            return [fields.serialize(ticket, projection) for ticket in tickets]
+        # The merge key comes with the row, whether or not the projection loads it
+        return [(created_at or datetime.min, fields.serialize(ticket, projection))
+                for ticket, created_at in tickets.add_columns(Ticket.created_at)]
     
-    # Order by creation date (newest first)
-    tickets = tickets.order_by(Ticket.created_at.desc()).all()
+    # Customers' tickets are on their company's shard; staff lists merge every shard's
+    if not merge:
+        return jsonify(fetch())
+    rows = heapq.merge(*fan_out(fetch), key=itemgetter(0), reverse=True)
+    return jsonify([item for _, item in rows])
+
+@ticket_bp.route('/tickets/search', methods=['GET'])
+@login_required
+def search_tickets():
+    user = User.query.get(session['user_id'])
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+    
+    # Same scoping as get_tickets
+    if user.role == 'customer':
+        allowed = lambda customer_id, agent_id: customer_id == user.id
+    elif user.role == 'agent':
+        allowed = lambda customer_id, agent_id: agent_id == user.id or agent_id is None
+    else:  # admin
+        allowed = None
     
-    return jsonify([ticket.to_dict() for ticket in tickets])
+    search_index.ensure_loaded(current_app.config.get('SEARCH_REBUILD_INTERVAL'))
+    total, hits = search_index.search(query, allowed, limit=per_page, offset=(page - 1) * per_page)
+    
+    ids = [ticket_id for ticket_id, _ in hits]
+    terms = tokenize(query)
+    tickets = {}
+    message_text = {}
+    for shard_ids in by_shard('ticket', ids):
+        shard_tickets = {ticket.id: ticket for ticket in Ticket.query.filter(Ticket.id.in_(shard_ids))}
+        tickets.update(shard_tickets)
+        
+        # Snippets come from the description, or from the first message that matches
+        need_message = [ticket_id for ticket_id in shard_ids if ticket_id in shard_tickets and not any(
+            term in (shard_tickets[ticket_id].title + ' ' + shard_tickets[ticket_id].description).lower()
+            for term in terms)]
+        if need_message:
+            matches = Message.query.filter(
+                Message.ticket_id.in_(need_message),
+                db.or_(*[Message.content.ilike(f'%{term}%') for term in terms])
+            ).order_by(Message.created_at)
+            for message in matches:
+                message_text.setdefault(message.ticket_id, message.content)
+    
+    items = []
+    for ticket_id, score in hits:
+        ticket = tickets.get(ticket_id)
+        if ticket is None:
+            continue
+        text = message_text.get(ticket_id, ticket.description)
+        items.append({
+            'ticket': ticket.to_dict(),
+            'score': round(score, 4),
+            'snippet': snippet(text, terms),
+        })
+    
+    return jsonify({'items': items, 'total': total, 'page': page, 'per_page': per_page})
+
+@ticket_bp.route('/tickets/suggestions', methods=['GET'])
+@login_required
+@limiter.limit('suggest')
+def suggest_for_draft():
+    """Knowledge base articles and open tickets similar to a ticket being written"""
+    user = User.query.get(session['user_id'])
+    title = request.args.get('title', '')
+    description = request.args.get('description', '')
+    limit = min(max(request.args.get('limit', 5, type=int), 1), 20)
+    if not (title.strip() or description.strip()):
+        return jsonify({'articles': [], 'tickets': []})
+
+    suggestions.ensure_loaded(current_app.config.get('SUGGEST_SYNC_INTERVAL'))
+    # Over-fetch tickets: closed ones and, for agents, other agents' are dropped below
+    article_hits, ticket_hits = suggestions.suggest(
+        title, description, limit * 4,
+        customer_id=user.id if user.role == 'customer' else None)
+
+    article_ids = [article_id for article_id, _ in article_hits[:limit]]
+    articles = {article.id: article for article in
+                KnowledgeBaseArticle.query.filter(KnowledgeBaseArticle.id.in_(article_ids))}
+    active = sla.active_status_ids()
+    tickets = {}
+    for shard_ids in by_shard('ticket', [ticket_id for ticket_id, _ in ticket_hits]):
+        query = Ticket.query.filter(Ticket.id.in_(shard_ids), Ticket.status_id.in_(active))
+        if user.role == 'agent':
+            query = query.filter((Ticket.agent_id == user.id) | (Ticket.agent_id == None))
+        tickets.update((ticket.id, ticket) for ticket in query)
+
+    return jsonify({
+        'articles': [dict(articles[article_id].to_summary_dict(), score=round(score, 4))
+                     for article_id, score in article_hits[:limit] if article_id in articles],
+        'tickets': [{
+            'id': ticket_id,
+            'title': tickets[ticket_id].title,
+            'status': tickets[ticket_id].status.name if tickets[ticket_id].status else None,
+            'created_at': tickets[ticket_id].created_at.isoformat() if tickets[ticket_id].created_at else None,
+            'score': round(score, 4),
+        } for ticket_id, score in ticket_hits if ticket_id in tickets][:limit],
+    })
 
 @ticket_bp.route('/tickets/<int:ticket_id>', methods=['GET'])
 @login_required
@@ -109,17 +275,51 @@ def assign_ticket(ticket_id):
     if agent.role != 'agent':
         return jsonify({'error': 'User is not an agent'}), 400
     
-    ticket.agent_id = agent.id
+    before = assignment_engine.snapshot(ticket)
+    try:
+        with unit_of_work():
+            transition(ticket, 'In Progress', data.get('version'), agent_id=agent.id)
+    except TransitionConflict as e:
+        return jsonify({'error': str(e)}), 409
+    assignment_engine.update(before, assignment_engine.snapshot(ticket))
+    
+    return jsonify(ticket.to_dict())
+
+@ticket_bp.route('/tickets/<int:ticket_id>/auto-assign', methods=['POST'])
+@admin_required
+def auto_assign_ticket(ticket_id):
+    ticket = Ticket.query.get_or_404(ticket_id)
+    if ticket.agent_id is not None:
+        return jsonify({'error': 'Ticket is already assigned'}), 400
     
-    # Update status to "In Progress"
-    in_progress_status = Status.query.filter_by(name='In Progress').first()
-    if in_progress_status:
-        ticket.status_id = in_progress_status.id
+    before = assignment_engine.snapshot(ticket)
+    if before[3] is False:
+        return jsonify({'error': 'Ticket is not active'}), 400
     
-    db.session.commit()
+    agent_id = reserve_agent(ticket)
+    if agent_id is None:
+        return jsonify({'error': 'No agents available'}), 409
+    try:
+        commit_assignment(ticket, agent_id, (request.get_json(silent=True) or {}).get('version'))
+    except TransitionConflict as e:
+        return jsonify({'error': str(e)}), 409
     
     return jsonify(ticket.to_dict())
 
+@ticket_bp.route('/tickets/assignment/load', methods=['GET'])
+@admin_required
+def assignment_load():
+    assignment_engine.ensure_loaded(current_app.config.get('ASSIGNMENT_REBUILD_INTERVAL'))
+    loads = assignment_engine.loads()
+    return jsonify([{'agent_id': agent_id, 'load': load}
+                    for agent_id, load in sorted(loads.items(), key=lambda item: item[1])])
+
+@ticket_bp.route('/tickets/assignment/rebuild', methods=['POST'])
+@admin_required
+def assignment_rebuild():
+    assignment_engine.rebuild()
+    return jsonify({'agents': len(assignment_engine.loads())})
+
 @ticket_bp.route('/tickets/<int:ticket_id>/status', methods=['PUT'])
 @agent_or_admin_required
 def update_ticket_status(ticket_id):
@@ -134,15 +334,28 @@ def update_ticket_status(ticket_id):
     new_status = Status.query.filter_by(name=data['status']).first()
     if not new_status:
         return jsonify({'error': 'Invalid status'}), 400
+    if not Status.can_transition(ticket.status.name, new_status.name):
+        return jsonify({'error': f'Cannot change status from {ticket.status.name} to {new_status.name}'}), 409
     
-    ticket.status_id = new_status.id
-    
-    # If closing ticket, set closed_at
-    if data['status'] == 'Closed':
-        from datetime import datetime
-        ticket.closed_at = datetime.utcnow()
+    before = assignment_engine.snapshot(ticket)
+    leaving_moderation = (ticket.status.name == 'Pending Moderation'
+                          and new_status.name != 'Pending Moderation')
     
-    db.session.commit()
+    try:
+        # Approved tickets go straight to the least loaded agent
+        if (leaving_moderation and ticket.agent_id is None
+                and new_status.name not in Status.INACTIVE_NAMES
+                and current_app.config.get('AUTO_ASSIGN_ON_MODERATION')):
+            agent_id = reserve_agent(ticket)
+            if agent_id is not None:
+                commit_assignment(ticket, agent_id, data.get('version'))
+                return jsonify(ticket.to_dict())
+        
+        with unit_of_work():
+            transition(ticket, new_status.name, data.get('version'))
+    except TransitionConflict as e:
+        return jsonify({'error': str(e)}), 409
+    assignment_engine.update(before, assignment_engine.snapshot(ticket))
     
     return jsonify(ticket.to_dict())
 
@@ -156,8 +369,16 @@ def update_ticket_priority(ticket_id):
     if data['priority'] not in valid_priorities:
         return jsonify({'error': 'Invalid priority'}), 400
     
-    ticket.priority = data['priority']
-    db.session.commit()
+    before = assignment_engine.snapshot(ticket)
+    calendar = sla.BusinessCalendar.from_config(current_app.config)
+    try:
+        with unit_of_work():
+            transition(ticket, expected_version=data.get('version'), priority=data['priority'],
+                       sla_due_at=sla.compute_due(ticket.created_at or datetime.utcnow(),
+                                                  data['priority'], calendar))
+    except TransitionConflict as e:
+        return jsonify({'error': str(e)}), 409
+    assignment_engine.update(before, assignment_engine.snapshot(ticket))
     
     return jsonify(ticket.to_dict())
 
@@ -165,25 +386,61 @@ def update_ticket_priority(ticket_id):
 @login_required
 def ticket_stats():
     user = User.query.get(session['user_id'])
-    query = Ticket.query
+    user_id, role = user.id, user.role
+    at_risk_window = current_app.config.get('SLA_AT_RISK_WINDOW', 3600)
+    names = {
+        'pending_moderation': 'Pending Moderation',
+        'open': 'Open',
+        'in_progress': 'In Progress',
+        'awaiting_customer': 'Awaiting Customer Reply',
+        'awaiting_agent': 'Awaiting Agent Reply',
+        'resolved': 'Resolved',
+        'closed': 'Closed',
+    }
+    
+    def count():
+        query = Ticket.query
+        if role == 'agent':
+            query = query.filter_by(agent_id=user_id)
+        elif role == 'customer':
+            query = query.filter_by(customer_id=user_id)
+        tickets = query.all()
+        def count_status(name):
+            status = Status.query.filter_by(name=name).first()
+            if not status:
+                return 0
+            return sum(1 for t in tickets if t.status_id == status.id)
+        counts = {key: count_status(name) for key, name in names.items()}
+        counts['total'] = len(tickets)
+        counts['sla_breached'] = sla.breached_filter(query).count()
+        counts['sla_at_risk'] = sla.at_risk_filter(query, at_risk_window).count()
+        return counts
+    
+    results = [count()] if role == 'customer' else fan_out(count)
+    keys = ['total', *names, 'sla_breached', 'sla_at_risk']
+    return jsonify({key: sum(counts[key] for counts in results) for key in keys})
+
+@ticket_bp.route('/tickets/sla', methods=['GET'])
+@agent_or_admin_required
+def sla_overview():
+    user = User.query.get(session['user_id'])
+    within = request.args.get('within', current_app.config.get('SLA_AT_RISK_WINDOW', 3600), type=int)
+    sla.sla_scanner.ensure_fresh(5)
+    breached = sla.sla_scanner.breached()
+    upcoming = sla.sla_scanner.upcoming(within)
     if user.role == 'agent':
-        query = query.filter_by(agent_id=user.id)
-    elif user.role == 'customer':
-        query = query.filter_by(customer_id=user.id)
-    tickets = query.all()
-    def count_status(name):
-        status = Status.query.filter_by(name=name).first()
-        if not status:
-            return 0
-        return sum(1 for t in tickets if t.status_id == status.id)
+        # Agents only see their own and unassigned tickets
+        visible = set()
+        for shard_ids in by_shard('ticket', breached + [ticket_id for _, ticket_id in upcoming]):
+            visible.update(ticket_id for ticket_id, in db.session.query(Ticket.id).filter(
+                Ticket.id.in_(shard_ids),
+                (Ticket.agent_id == user.id) | (Ticket.agent_id == None)
+            ))
+        breached = [ticket_id for ticket_id in breached if ticket_id in visible]
+        upcoming = [(due, ticket_id) for due, ticket_id in upcoming if ticket_id in visible]
     return jsonify({
-        'total': len(tickets),
-        'pending_moderation': count_status('Pending Moderation'),
-        'open': count_status('Open'),
-        'in_progress': count_status('In Progress'),
-        'awaiting_customer': count_status('Awaiting Customer Reply'),
-        'awaiting_agent': count_status('Awaiting Agent Reply'),
-        'resolved': count_status('Resolved'),
-        'closed': count_status('Closed'),
+        'breached': breached,
+        'upcoming': [{'ticket_id': ticket_id, 'sla_due_at': due.isoformat()}
+                     for due, ticket_id in upcoming],
     })
 
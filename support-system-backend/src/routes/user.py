@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify, session
 from werkzeug.security import check_password_hash, generate_password_hash
 from src.models.user import db, User
+from src.services.assignment import assignment_engine
+from src.services.ratelimit import limiter
+from src.services import fields
 from functools import wraps
 
 user_bp = Blueprint('user', __name__)
@@ -25,6 +28,7 @@ def admin_required(f):
     return decorated_function
 
 @user_bp.route('/login', methods=['POST'])
+@limiter.limit('login')
 def login():
     """User login"""
     try:
@@ -79,8 +83,13 @@ def get_users():
         if not user or user.role != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
         
-        users = User.query.all()
-        return jsonify([user.to_dict() for user in users])
+        try:
+            projection = fields.parse(request.args, User)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        users = User.query.options(*fields.query_options(User, projection)).all()
+        return jsonify([fields.serialize(user, projection) for user in users])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -122,6 +131,8 @@ def create_user():
         
         db.session.add(new_user)
         db.session.commit()
+        if new_user.role == 'agent':
+            assignment_engine.invalidate()
         
         return jsonify(new_user.to_dict()), 201
     except Exception as e:
@@ -167,6 +178,8 @@ def update_user(user_id):
         if 'role' in data:
             if data['role'] not in ['customer', 'agent', 'admin']:
                 return jsonify({'error': 'Invalid role'}), 400
+            if user_to_update.role != data['role']:
+                assignment_engine.invalidate()
             user_to_update.role = data['role']
         
         db.session.commit()
@@ -196,6 +209,8 @@ def delete_user(user_id):
         
         db.session.delete(user_to_delete)
         db.session.commit()
+        if user_to_delete.role == 'agent':
+            assignment_engine.drop_agent(user_id)
         
         return jsonify({'message': 'User deleted successfully'})
     except Exception as e:
@@ -0,0 +1,220 @@
+import heapq
+import itertools
+import threading
+import time
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import aliased
+
+from src.extensions import db
+from src.services.routing import primary
+from src.services.sharding import each_shard
+
+# Weight of an open ticket in an agent's load, by priority
+PRIORITY_WEIGHTS = {'Low': 1, 'Medium': 2, 'High': 4, 'Critical': 8}
+
+
+def ticket_weight(priority):
+    return PRIORITY_WEIGHTS.get(priority, PRIORITY_WEIGHTS['Medium'])
+
+
+class AssignmentEngine:
+    """In-memory index of open ticket load per agent.
+
+    Loads live in a dict and a min-heap keyed by (load, last assignment
+    sequence, agent id), so picking the least loaded agent is O(log n).
+    Stale heap entries are skipped lazily when they reach the top.
+    """
+
+    def __init__(self, affinity_slack=2):
+        self.affinity_slack = affinity_slack
+        self._lock = threading.RLock()
+        self._load = {}            # agent_id -> weighted open load
+        self._seq = {}             # agent_id -> sequence of last assignment
+        self._companies = {}       # company_id -> {agent_id: open tickets}
+        self._heap = []
+        self._counter = itertools.count(1)
+        self._loaded_at = None
+
+    # Building
+
+    def load(self, rows):
+        """Replace the state from (agent_id, priority, company_id, count) rows.
+
+        Agents without open tickets appear once with a NULL priority and a
+        zero count (the result of the outer join in ``rebuild``).
+        """
+        with self._lock:
+            self._load = {}
+            self._seq = {}
+            self._companies = {}
+            for agent_id, priority, company_id, count in rows:
+                self._load.setdefault(agent_id, 0)
+                self._seq.setdefault(agent_id, 0)
+                if not count:
+                    continue
+                self._load[agent_id] += ticket_weight(priority) * count
+                if company_id is not None:
+                    agents = self._companies.setdefault(company_id, {})
+                    agents[agent_id] = agents.get(agent_id, 0) + count
+            self._heap = [(load, 0, agent_id) for agent_id, load in self._load.items()]
+            heapq.heapify(self._heap)
+            self._loaded_at = time.monotonic()
+
+    def rebuild(self):
+        """Reload open ticket counts with a single grouped query"""
+        from src.models.status import Status
+        from src.models.ticket import Ticket
+        from src.models.user import User
+
+        customer = aliased(User)
+        inactive = select(Status.id).where(Status.name.in_(Status.INACTIVE_NAMES))
+        rows = []
+        with primary():
+            # Counts add up across shards; agents without tickets appear once per shard with 0
+            for _ in each_shard():
+                rows += db.session.query(
+                    User.id, Ticket.priority, customer.company_id, func.count(Ticket.id)
+                ).select_from(User).outerjoin(
+                    Ticket, and_(Ticket.agent_id == User.id, Ticket.status_id.notin_(inactive))
+                ).outerjoin(
+                    customer, customer.id == Ticket.customer_id
+                ).filter(
+                    User.role == 'agent'
+                ).group_by(User.id, Ticket.priority, customer.company_id).all()
+        self.load(rows)
+
+    def invalidate(self):
+        """Force a rebuild on next use (e.g. after agents are added or removed)"""
+        with self._lock:
+            self._loaded_at = None
+
+    def ensure_loaded(self, max_age=None):
+        with self._lock:
+            stale = self._loaded_at is None or (
+                max_age is not None and time.monotonic() - self._loaded_at > max_age
+            )
+            if stale:
+                self.rebuild()
+
+    # Bookkeeping
+
+    def _adjust(self, agent_id, delta, company_id=None, count_delta=0):
+        load = self._load.get(agent_id, 0) + delta
+        self._load[agent_id] = max(load, 0)
+        seq = self._seq.setdefault(agent_id, 0)
+        heapq.heappush(self._heap, (self._load[agent_id], seq, agent_id))
+        if company_id is not None and count_delta:
+            agents = self._companies.setdefault(company_id, {})
+            count = agents.get(agent_id, 0) + count_delta
+            if count > 0:
+                agents[agent_id] = count
+            else:
+                agents.pop(agent_id, None)
+        if len(self._heap) > 4 * len(self._load) + 64:
+            self._compact()
+
+    def _compact(self):
+        self._heap = [(load, self._seq.get(agent_id, 0), agent_id)
+                      for agent_id, load in self._load.items()]
+        heapq.heapify(self._heap)
+
+    def _is_current(self, entry):
+        load, seq, agent_id = entry
+        return self._load.get(agent_id) == load and self._seq.get(agent_id) == seq
+
+    def add(self, agent_id, priority, company_id=None):
+        with self._lock:
+            self._adjust(agent_id, ticket_weight(priority), company_id, 1)
+
+    def remove(self, agent_id, priority, company_id=None):
+        with self._lock:
+            if agent_id in self._load:
+                self._adjust(agent_id, -ticket_weight(priority), company_id, -1)
+
+    def drop_agent(self, agent_id):
+        with self._lock:
+            self._load.pop(agent_id, None)
+            self._seq.pop(agent_id, None)
+            for agents in self._companies.values():
+                agents.pop(agent_id, None)
+
+    def update(self, before, after):
+        """Apply the change between two ``snapshot`` tuples of one ticket"""
+        if before == after:
+            return
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            agent_id, priority, company_id, active = before
+            if agent_id is not None and active:
+                self.remove(agent_id, priority, company_id)
+            agent_id, priority, company_id, active = after
+            if agent_id is not None and active:
+                self.add(agent_id, priority, company_id)
+
+    @staticmethod
+    def snapshot(ticket):
+        """Fields of a ticket that contribute to agent load"""
+        from src.models.status import Status
+
+        status = db.session.get(Status, ticket.status_id)
+        active = status is None or status.name not in Status.INACTIVE_NAMES
+        company_id = ticket.customer.company_id if ticket.customer else None
+        return (ticket.agent_id, ticket.priority, company_id, active)
+
+    # Picking
+
+    def pick(self, company_id=None, affinity=True, exclude=()):
+        """Return the least loaded agent id without reserving it.
+
+        With ``affinity`` an agent already handling open tickets of the
+        same company is preferred while its load is within
+        ``affinity_slack`` ticket weights of the least loaded agent.
+        """
+        with self._lock:
+            best = None
+            skipped = []
+            while self._heap:
+                entry = self._heap[0]
+                if not self._is_current(entry):
+                    heapq.heappop(self._heap)
+                    continue
+                if entry[2] in exclude:
+                    skipped.append(heapq.heappop(self._heap))
+                    continue
+                best = entry
+                break
+            for entry in skipped:
+                heapq.heappush(self._heap, entry)
+            if best is None:
+                return None
+            if affinity and company_id is not None:
+                limit = best[0] + self.affinity_slack * PRIORITY_WEIGHTS['Medium']
+                candidates = [
+                    (self._load[agent_id], self._seq[agent_id], agent_id)
+                    for agent_id in self._companies.get(company_id, {})
+                    if agent_id in self._load and agent_id not in exclude
+                ]
+                if candidates:
+                    preferred = min(candidates)
+                    if preferred[0] <= limit:
+                        return preferred[2]
+            return best[2]
+
+    def reserve(self, priority, company_id=None, affinity=True, exclude=()):
+        """Pick an agent and count the ticket against it atomically"""
+        with self._lock:
+            agent_id = self.pick(company_id, affinity, exclude)
+            if agent_id is not None:
+                self._seq[agent_id] = next(self._counter)
+                self._adjust(agent_id, ticket_weight(priority), company_id, 1)
+            return agent_id
+
+    def loads(self):
+        with self._lock:
+            return dict(self._load)
+
+
+# Per-process engine; every worker rebuilds its own copy from the database
+assignment_engine = AssignmentEngine()
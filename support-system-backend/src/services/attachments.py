@@ -0,0 +1,110 @@
+"""Content-addressed storage for message attachments.
+
+Uploads are read from the request stream in fixed-size chunks, hashed and
+written to a temporary file as they arrive, then renamed to
+``<root>/ab/cd/<sha256>``. Memory use is one chunk whatever the file
+size, and identical files are stored once however often they are
+attached.
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+import click
+from flask.cli import AppGroup
+
+from src.extensions import db
+from src.services.sharding import each_shard
+
+CHUNK_SIZE = 64 * 1024
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+class BlobStore:
+    def __init__(self, root=None):
+        self.root = root
+
+    def init_app(self, app):
+        self.root = app.config['ATTACHMENT_DIR']
+        os.makedirs(os.path.join(self.root, 'tmp'), exist_ok=True)
+        app.extensions['blob_store'] = self
+        app.cli.add_command(attachments_cli)
+
+    def path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def store(self, stream, max_size):
+        """Copy ``stream`` into the store; returns (sha256, size).
+
+        Raises AttachmentTooLarge as soon as more than ``max_size`` bytes
+        have been read, leaving nothing behind.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        raise AttachmentTooLarge()
+                    digest.update(chunk)
+                    out.write(chunk)
+            sha256 = digest.hexdigest()
+            final_path = self.path(sha256)
+            try:
+                # Same content already stored: restart its grace period so a
+                # concurrent gc keeps it until our attachment row is committed
+                os.utime(final_path)
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(temp_path, final_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return sha256, size
+
+    def collect_garbage(self, grace_seconds=3600):
+        """Delete blobs no attachment refers to; returns (files, bytes) removed.
+
+        Blobs younger than ``grace_seconds`` are kept, since their
+        attachment row may not be committed yet. Temporary files of
+        uploads abandoned before that are removed too.
+        """
+        from src.models.attachment import Attachment
+
+        referenced = {sha256 for _ in each_shard()
+                      for sha256, in db.session.query(Attachment.sha256).distinct()}
+        cutoff = time.time() - grace_seconds
+        removed = freed = 0
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                if filename in referenced or os.path.getmtime(path) > cutoff:
+                    continue
+                freed += os.path.getsize(path)
+                os.unlink(path)
+                removed += 1
+        return removed, freed
+
+
+blob_store = BlobStore()
+
+attachments_cli = AppGroup('attachments', help='Maintain stored message attachments')
+
+
+@attachments_cli.command('gc')
+@click.option('--grace', type=int, default=3600, help='Keep unreferenced files younger than this (seconds)')
+def gc_command(grace):
+    """Delete attachment files no message refers to any more"""
+    removed, freed = blob_store.collect_garbage(grace)
+    click.echo(f'Removed {removed} files ({freed} bytes)')
@@ -0,0 +1,104 @@
+from sqlalchemy import and_, case, distinct, func
+
+from src.extensions import db
+from src.services.cache import TTLCache
+from src.services.sharding import fan_out, shard_router, use_company
+
+summary_cache = TTLCache(ttl=30)
+
+
+def duration_seconds(start, end):
+    """SQL expression for the number of seconds between two datetime columns"""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return (func.julianday(end) - func.julianday(start)) * 86400.0
+    if dialect == 'postgresql':
+        return func.extract('epoch', end - start)
+    return func.timestampdiff(db.text('SECOND'), start, end)
+
+
+def summary_query():
+    """Per-company aggregates in one grouped query through User.company_id"""
+    from src.models.company import Company
+    from src.models.status import Status
+    from src.models.ticket import Ticket
+    from src.models.user import User
+
+    statuses = Status.query.order_by(Status.id).all()
+    resolution = case((Ticket.closed_at.isnot(None),
+                       duration_seconds(Ticket.created_at, Ticket.closed_at)))
+    columns = [
+        Company.id,
+        Company.name,
+        func.count(distinct(User.id)),
+        func.count(Ticket.id),
+        func.count(Ticket.closed_at),
+        func.avg(resolution),
+        func.min(resolution),
+        func.max(resolution),
+    ]
+    columns += [func.sum(case((Ticket.status_id == status.id, 1), else_=0)) for status in statuses]
+    query = db.session.query(*columns).select_from(Company).outerjoin(
+        User, and_(User.company_id == Company.id, User.role == 'customer')
+    ).outerjoin(
+        Ticket, Ticket.customer_id == User.id
+    ).group_by(Company.id, Company.name).order_by(Company.name, Company.id)
+    return query, statuses
+
+
+def summary_row(row, statuses):
+    from src.models.status import Status
+
+    company_id, name, customers, tickets, closed, avg_res, min_res, max_res = row[:8]
+    by_status = {status.name: int(count or 0) for status, count in zip(statuses, row[8:])}
+    inactive = sum(count for name_, count in by_status.items() if name_ in Status.INACTIVE_NAMES)
+    return {
+        'id': company_id,
+        'name': name,
+        'customers': customers,
+        'tickets': tickets,
+        'open_tickets': tickets - inactive,
+        'tickets_by_status': by_status,
+        'resolution_time': {
+            'count': closed,
+            'avg_seconds': round(avg_res, 1) if avg_res is not None else None,
+            'min_seconds': round(min_res, 1) if min_res is not None else None,
+            'max_seconds': round(max_res, 1) if max_res is not None else None,
+        },
+    }
+
+
+def company_summaries(page, per_page):
+    from src.models.company import Company
+
+    def page_rows():
+        query, statuses = summary_query()
+        return query.limit(per_page).offset((page - 1) * per_page).all(), statuses
+
+    def build():
+        results = fan_out(page_rows)
+        rows, statuses = results[0]
+        if shard_router.enabled:
+            # Every shard returns the same page of companies; take each one's row from its own shard
+            by_shard = dict(zip(shard_router.names(), (shard_rows for shard_rows, _ in results)))
+            rows = [by_shard[shard_router.shard_of(row[0])[0]][index] for index, row in enumerate(rows)]
+        return {
+            'items': [summary_row(row, statuses) for row in rows],
+            'page': page,
+            'per_page': per_page,
+            'total': Company.query.count(),
+        }
+
+    return summary_cache.get_or_set(('page', page, per_page), build)
+
+
+def company_summary(company_id):
+    from src.models.company import Company
+
+    def build():
+        with use_company(company_id):
+            query, statuses = summary_query()
+            row = query.filter(Company.id == company_id).first()
+            return summary_row(row, statuses) if row else None
+
+    return summary_cache.get_or_set(('company', company_id), build)
@@ -0,0 +1,168 @@
+"""Response compression negotiated from ``Accept-Encoding``.
+
+gzip is always available; brotli and zstd are used when the ``brotli``
+and ``zstandard`` packages are installed. Buffered responses are
+compressed in one go when they are at least ``COMPRESS_MIN_SIZE`` bytes.
+Streamed responses (exports) are compressed chunk by chunk and flushed
+after every chunk, so clients still receive rows as they are produced.
+"""
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+
+class GzipCodec:
+    name = 'gzip'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def stream(self, chunks):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class BrotliCodec:
+    name = 'br'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.level, mode=brotli.MODE_TEXT)
+
+    def stream(self, chunks):
+        compressor = brotli.Compressor(quality=self.level, mode=brotli.MODE_TEXT)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class ZstdCodec:
+    name = 'zstd'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def stream(self, chunks):
+        compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+CODECS = {'gzip': GzipCodec}
+if brotli is not None:
+    CODECS['br'] = BrotliCodec
+if zstandard is not None:
+    CODECS['zstd'] = ZstdCodec
+
+
+def parse_accept_encoding(header):
+    """{encoding: q} from an Accept-Encoding header"""
+    accepted = {}
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+class Compressor:
+    def __init__(self):
+        self.enabled = True
+        self.min_size = 1024
+        self.mimetypes = set()
+        self.preference = ['gzip']
+        self.codecs = {}
+
+    def init_app(self, app):
+        self.enabled = app.config.get('COMPRESS_ENABLED', True)
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+        self.mimetypes = set(app.config.get('COMPRESS_MIMETYPES', ()))
+        levels = app.config.get('COMPRESS_LEVELS', {})
+        self.preference = [name for name in app.config.get('COMPRESS_ALGORITHMS', ['gzip'])
+                           if name in CODECS]
+        self.codecs = {name: CODECS[name](levels.get(name, 6)) for name in self.preference}
+        app.after_request(self.after_request)
+
+    def choose(self, header):
+        """Preferred codec the client accepts, or None"""
+        accepted = parse_accept_encoding(header)
+        best, best_q = None, 0.0
+        for name in self.preference:
+            q = accepted.get(name, accepted.get('*', 0.0))
+            if q > best_q:
+                best, best_q = name, q
+        return self.codecs.get(best)
+
+    def should_compress(self, response):
+        if not self.enabled or request.method == 'HEAD':
+            return False
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        if 'Content-Encoding' in response.headers or response.direct_passthrough:
+            return False
+        if response.mimetype not in self.mimetypes:
+            return False
+        if not response.is_streamed and response.calculate_content_length() < self.min_size:
+            return False
+        return True
+
+    def after_request(self, response):
+        if not self.should_compress(response):
+            return response
+        response.vary.add('Accept-Encoding')
+        codec = self.choose(request.headers.get('Accept-Encoding'))
+        if codec is None:
+            return response
+
+        if response.is_streamed:
+            response.response = codec.stream(chunk for chunk in response.iter_encoded() if chunk)
+            response.headers.pop('Content-Length', None)
+        else:
+            response.set_data(codec.compress(response.get_data()))
+        response.headers['Content-Encoding'] = codec.name
+        # The compressed body differs byte-for-byte from the uncompressed one
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+compressor = Compressor()
@@ -0,0 +1,218 @@
+import bisect
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import aliased
+
+from src.services.sharding import engines
+
+TICKET_COLUMNS = ['id', 'title', 'description', 'priority', 'status', 'customer_id',
+                  'company_id', 'agent_id', 'created_at', 'updated_at', 'closed_at']
+MESSAGE_COLUMNS = ['message_id', 'sender_id', 'content', 'message_created_at']
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'columnar': 'application/x-ndjson',
+}
+
+
+def parse_datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _jsonable(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def ticket_chunks(since=None, until=None, status=None, company_id=None,
+                  after_id=None, until_id=None, chunk_size=500, message_chunk_size=5000):
+    """Yield lists of ticket rows (with their messages) in id order.
+
+    Tickets are fetched by keyset (``id > last id``) and their messages by
+    keyset on (ticket_id, id), each on a fresh connection, so no
+    transaction or cursor stays open between chunks. A chunk holds at most
+    ``chunk_size`` tickets and ``message_chunk_size`` messages, so memory
+    is bounded however large the export or any one thread is. A ticket
+    whose messages do not fit is split over consecutive chunks: every part
+    but the first has ``continued`` set and every part but the last has
+    ``more`` set. With sharding the shards are exported one after
+    another, each in id order.
+    """
+    from src.models.status import Status
+    from src.models.ticket import Ticket
+    from src.models.user import User
+
+    customer = aliased(User)
+    query = select(
+        Ticket.id, Ticket.title, Ticket.description, Ticket.priority,
+        Status.name.label('status'), Ticket.customer_id,
+        customer.company_id, Ticket.agent_id,
+        Ticket.created_at, Ticket.updated_at, Ticket.closed_at
+    ).join(Status, Status.id == Ticket.status_id).join(
+        customer, customer.id == Ticket.customer_id
+    ).order_by(Ticket.id).limit(chunk_size)
+    if since:
+        query = query.where(Ticket.created_at >= since)
+    if until:
+        query = query.where(Ticket.created_at < until)
+    if status:
+        query = query.where(Status.name == status)
+    if company_id:
+        query = query.where(customer.company_id == company_id)
+    if until_id:
+        query = query.where(Ticket.id <= until_id)
+
+    for engine in engines(company_id):
+        yield from _chunks_from(engine, query, after_id or 0, message_chunk_size)
+
+
+def _chunks_from(engine, query, last_id, message_chunk_size):
+    from src.models.ticket import Ticket
+
+    while True:
+        with engine.connect() as connection:
+            tickets = [dict(row._mapping) for row in
+                       connection.execute(query.where(Ticket.id > last_id))]
+        if not tickets:
+            return
+        yield from _with_messages(engine, tickets, message_chunk_size)
+        last_id = tickets[-1]['id']
+
+
+def _with_messages(engine, tickets, limit):
+    """Split ``tickets`` into chunks carrying at most ``limit`` of their messages"""
+    from src.models.message import Message
+
+    ids = [ticket['id'] for ticket in tickets]
+    # One row past the limit tells whether the page's last ticket has more messages
+    page = select(
+        Message.ticket_id, Message.id, Message.sender_id, Message.content, Message.created_at
+    ).order_by(Message.ticket_id, Message.id).limit(limit + 1)
+    after_ticket, after_message = 0, 0
+    first, continued = 0, False
+    while True:
+        with engine.connect() as connection:
+            rows = connection.execute(page.where(
+                Message.ticket_id.in_(ids[first:]),
+                or_(Message.ticket_id > after_ticket,
+                    and_(Message.ticket_id == after_ticket, Message.id > after_message))
+            )).all()
+        full = len(rows) > limit
+        split = full and rows[limit].ticket_id == rows[limit - 1].ticket_id
+        rows = rows[:limit]
+        by_ticket = {}
+        for ticket_id, message_id, sender_id, content, created_at in rows:
+            by_ticket.setdefault(ticket_id, []).append({
+                'message_id': message_id,
+                'sender_id': sender_id,
+                'content': content,
+                'message_created_at': created_at,
+            })
+        last = bisect.bisect_left(ids, rows[-1].ticket_id) if full else len(ids) - 1
+        chunk = [dict(ticket, messages=by_ticket.get(ticket['id'], [])) for ticket in tickets[first:last + 1]]
+        if continued:
+            chunk[0]['continued'] = True
+        if split:
+            chunk[-1]['more'] = True
+        yield chunk
+        if not full:
+            return
+        after_ticket, after_message = rows[-1].ticket_id, rows[-1].id
+        first, continued = (last, True) if split else (last + 1, False)
+
+
+def write_csv(chunks):
+    """One row per message; tickets without messages get one row with empty message columns"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(TICKET_COLUMNS + MESSAGE_COLUMNS)
+    for tickets in chunks:
+        for ticket in tickets:
+            values = [_jsonable(ticket[column]) for column in TICKET_COLUMNS]
+            for message in ticket['messages'] or [dict.fromkeys(MESSAGE_COLUMNS)]:
+                writer.writerow(values + [_jsonable(message[column]) for column in MESSAGE_COLUMNS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_part(ticket):
+    """A ticket's JSON line, or the piece of it a split ticket's part contributes"""
+    messages = ', '.join(json.dumps(message, default=_jsonable, ensure_ascii=False)
+                         for message in ticket['messages'])
+    if ticket.get('continued'):
+        text = ', ' + messages
+    else:
+        row = dict({column: ticket[column] for column in TICKET_COLUMNS}, messages=[])
+        # Everything up to the open messages array
+        text = json.dumps(row, default=_jsonable, ensure_ascii=False)[:-2] + messages
+    return text if ticket.get('more') else text + ']}\n'
+
+
+def write_ndjson(chunks):
+    """One JSON object per ticket with its messages nested"""
+    for tickets in chunks:
+        yield ''.join(_ndjson_part(ticket) for ticket in tickets)
+
+
+def write_columnar(chunks):
+    """One JSON line per chunk holding column arrays, like Parquet row groups.
+
+    Messages are a second set of columns keyed by ``ticket_id``; a split
+    ticket's row is in the group of its first part.
+    """
+    yield json.dumps({'tickets': TICKET_COLUMNS,
+                      'messages': ['ticket_id'] + MESSAGE_COLUMNS}) + '\n'
+    for tickets in chunks:
+        messages = [dict(message, ticket_id=ticket['id'])
+                    for ticket in tickets for message in ticket['messages']]
+        rows = [ticket for ticket in tickets if not ticket.get('continued')]
+        group = {
+            'rows': len(rows),
+            'tickets': {column: [_jsonable(ticket[column]) for ticket in rows]
+                        for column in TICKET_COLUMNS},
+            'messages': {column: [_jsonable(message[column]) for message in messages]
+                         for column in ['ticket_id'] + MESSAGE_COLUMNS},
+        }
+        yield json.dumps(group, ensure_ascii=False) + '\n'
+
+
+WRITERS = {'csv': write_csv, 'ndjson': write_ndjson, 'columnar': write_columnar}
+
+
+def export(fmt, **filters):
+    return WRITERS[fmt](ticket_chunks(**filters))
+
+
+@click.command('export-tickets')
+@click.option('--format', 'fmt', type=click.Choice(sorted(WRITERS)), default='ndjson')
+@click.option('--output', type=click.Path(dir_okay=False), help='File to write (default: stdout)')
+@click.option('--since', help='Created at or after (ISO date)')
+@click.option('--until', help='Created before (ISO date)')
+@click.option('--status', help='Status name')
+@click.option('--company-id', type=int)
+@click.option('--after-id', type=int, help='Resume after this ticket id')
+@click.option('--until-id', type=int, help='Stop at this ticket id')
+@click.option('--chunk-size', type=int, default=500, help='Tickets per chunk')
+@click.option('--message-chunk-size', type=click.IntRange(min=1), default=5000, help='Messages per chunk')
+@with_appcontext
+def export_command(fmt, output, since, until, status, company_id, after_id, until_id, chunk_size,
+                   message_chunk_size):
+    """Stream tickets with their messages as CSV, NDJSON or columnar JSON"""
+    stream = open(output, 'w', encoding='utf-8', newline='') if output else sys.stdout
+    try:
+        for part in export(fmt, since=parse_datetime(since), until=parse_datetime(until),
+                           status=status, company_id=company_id, after_id=after_id,
+                           until_id=until_id, chunk_size=chunk_size,
+                           message_chunk_size=message_chunk_size):
+            stream.write(part)
+    finally:
+        if output:
+            stream.close()
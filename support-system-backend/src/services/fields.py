@@ -0,0 +1,138 @@
+"""``fields=`` / ``expand=`` projections for list endpoints.
+
+Models opt in by declaring:
+
+- ``API_COLUMNS``: scalar columns that may be requested by name
+- ``API_RELATIONS``: {name: (relationship attribute, local column it joins on)};
+  to-many relations serialize as lists
+- ``API_COMPUTED`` (optional): {name: [columns the method needs]}
+
+``fields=id,title,status.name`` selects top-level keys, with one level of
+dotted sub-fields for relations; ``expand=customer`` embeds a relation in
+full. Without either parameter the model's regular ``to_dict`` is used.
+Only the requested columns are loaded and only requested relations are
+queried.
+"""
+from datetime import datetime
+
+from sqlalchemy.orm import load_only, selectinload
+
+
+class Projection:
+    def __init__(self, model, columns, relations, computed):
+        self.model = model
+        self.columns = columns        # ordered list of column names
+        self.relations = relations    # {name: Projection or None for full}
+        self.computed = computed      # ordered list of computed names
+
+
+def _split(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+def _relations(model):
+    return getattr(model, 'API_RELATIONS', {})
+
+
+def _related_model(model, name):
+    return getattr(model, _relations(model)[name][0]).property.mapper.class_
+
+
+def _computed(model):
+    return getattr(model, 'API_COMPUTED', {})
+
+
+def _build(model, names, expand):
+    columns, computed, relations, nested = [], [], {}, {}
+    for name in names:
+        head, _, rest = name.partition('.')
+        if rest:
+            if head not in _relations(model):
+                raise ValueError(f'Unknown field: {name}')
+            nested.setdefault(head, []).append(rest)
+        elif head in model.API_COLUMNS:
+            columns.append(head)
+        elif head in _computed(model):
+            computed.append(head)
+        elif head in _relations(model):
+            relations[head] = None
+        else:
+            raise ValueError(f'Unknown field: {name}')
+    for name in expand:
+        if name not in _relations(model):
+            raise ValueError(f'Unknown relation: {name}')
+        relations[name] = None
+    for name, sub_names in nested.items():
+        if name not in relations:
+            relations[name] = _build(_related_model(model, name), sub_names, [])
+    return Projection(model, columns, relations, computed)
+
+
+def parse(args, model):
+    """Projection requested by the query string, or None for the full representation"""
+    names, expand = _split(args.get('fields')), _split(args.get('expand'))
+    if not names and not expand:
+        return None
+    if not names:
+        # expand alone adds relations on top of the regular columns
+        names = list(model.API_COLUMNS)
+    return _build(model, names, expand)
+
+
+def _full_loads(model, depth=2):
+    options = []
+    if depth == 0:
+        return options
+    for name, (attribute, _) in _relations(model).items():
+        loader = selectinload(getattr(model, attribute))
+        nested = _full_loads(_related_model(model, name), depth - 1)
+        options.append(loader.options(*nested) if nested else loader)
+    return options
+
+
+def _loaded_columns(projection):
+    model = projection.model
+    names = set(projection.columns) | {model.__mapper__.primary_key[0].key}
+    for name in projection.computed:
+        names.update(_computed(model)[name])
+    for name in projection.relations:
+        names.add(_relations(model)[name][1])
+    return [getattr(model, name) for name in sorted(names)]
+
+
+def query_options(model, projection):
+    """Loader options for a query serialized with ``projection``"""
+    if projection is None:
+        return _full_loads(model)
+    options = [load_only(*_loaded_columns(projection))]
+    for name, sub in projection.relations.items():
+        attribute, _ = _relations(model)[name]
+        related = _related_model(model, name)
+        loader = selectinload(getattr(model, attribute))
+        if sub is None:
+            nested = _full_loads(related, 1)
+            options.append(loader.options(*nested) if nested else loader)
+        else:
+            options.append(loader.options(*query_options(related, sub)))
+    return options
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def serialize(obj, projection):
+    if projection is None:
+        return obj.to_dict()
+    result = {name: _value(getattr(obj, name)) for name in projection.columns}
+    for name in projection.computed:
+        result[name] = getattr(obj, name)()
+    for name, sub in projection.relations.items():
+        related = getattr(obj, _relations(projection.model)[name][0])
+        if related is None:
+            result[name] = None
+        elif isinstance(related, list):
+            result[name] = [item.to_dict() if sub is None else serialize(item, sub) for item in related]
+        else:
+            result[name] = related.to_dict() if sub is None else serialize(related, sub)
+    return result
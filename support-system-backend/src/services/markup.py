@@ -0,0 +1,49 @@
+import html
+import re
+
+import markdown
+from markdown.extensions import Extension
+
+SAFE_URL_SCHEMES = ('http', 'https', 'mailto')
+URL_ATTR_RE = re.compile(r'\b(href|src)="([^"]*)"')
+TAG_RE = re.compile(r'<[^>]+>')
+FIRST_HEADING_RE = re.compile(r'^\s*<h1>(.*?)</h1>', re.S)
+
+
+def _safe_url(match):
+    attribute, url = match.groups()
+    target = re.sub(r'[\s\x00-\x1f]', '', html.unescape(url)).lower()
+    scheme, colon, _ = target.partition(':')
+    if colon and '/' not in scheme and scheme not in SAFE_URL_SCHEMES:
+        url = '#'
+    return f'{attribute}="{url}"'
+
+
+class EscapeHtml(Extension):
+    """Treat raw HTML blocks and inline tags as text, which Markdown then escapes.
+
+    Escaping before rendering would escape code spans and blocks twice and
+    break ``<http://...>`` autolinks; those still work with this extension.
+    """
+
+    def extendMarkdown(self, md):
+        md.preprocessors.deregister('html_block')
+        md.inlinePatterns.deregister('html')
+
+
+def render_markdown(text):
+    """Markdown to HTML with raw HTML escaped and only safe link schemes kept"""
+    rendered = markdown.markdown(text or '', extensions=['sane_lists', EscapeHtml()], output_format='html')
+    return URL_ATTR_RE.sub(_safe_url, rendered)
+
+
+def excerpt(rendered_html, title=None, length=200):
+    """Plain-text start of an article, skipping a leading heading that repeats the title"""
+    heading = FIRST_HEADING_RE.match(rendered_html)
+    if heading and title and html.unescape(TAG_RE.sub('', heading.group(1))).strip() == title.strip():
+        rendered_html = rendered_html[heading.end():]
+    text = ' '.join(html.unescape(TAG_RE.sub(' ', rendered_html)).split())
+    if len(text) <= length:
+        return text
+    cut = text[:length].rsplit(' ', 1)[0]
+    return cut.rstrip('.,;:') + '…'
@@ -0,0 +1,231 @@
+"""On-demand request profiling.
+
+An admin profiles a request by sending ``X-Profile: 1`` (or ``?_profile=1``);
+``PROFILE_SAMPLE_RATE`` additionally profiles that fraction of all
+requests. The request runs under cProfile with every SQL statement and its
+duration recorded, and the result goes into a ring buffer of the last
+``PROFILE_BUFFER_SIZE`` profiles. The response carries ``X-Profile-Id``.
+
+Only the view runs under the profiler: the body of a streamed response is
+produced after the profile has been stored.
+"""
+import cProfile
+import itertools
+import marshal
+import os
+import pstats
+import random
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+
+from flask import g, has_request_context, request, session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ARG = '_profile'
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == '~':  # built-in
+        return name.replace(';', ',')
+    return f'{name} ({os.path.basename(filename)}:{line})'.replace(';', ',')
+
+
+def collapsed_stacks(stats, max_depth=64, min_seconds=1e-6):
+    """Flamegraph "frame;frame;frame microseconds" lines from pstats data.
+
+    cProfile records only direct caller/callee edges, not whole stacks, so
+    a function's time is split across the paths leading to it in
+    proportion to each caller's share of its cumulative time.
+    """
+    children = defaultdict(list)
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            children[caller].append((func, edge[3]))
+    totals = Counter()
+
+    def walk(func, path, seen, fraction):
+        path = path + (_label(func),)
+        self_time = stats[func][2] * fraction
+        if self_time > 0:
+            totals[';'.join(path)] += self_time
+        if len(path) >= max_depth:
+            return
+        for child, edge_time in children.get(func, ()):
+            child_time = stats[child][3]
+            share = edge_time * fraction
+            if child in seen or child_time <= 0 or share < min_seconds:
+                continue
+            walk(child, path, seen | {child}, share / child_time)
+
+    for func, value in stats.items():
+        if not value[4]:
+            walk(func, (), {func}, 1.0)
+    return ''.join(f'{stack} {int(seconds * 1e6)}\n'
+                   for stack, seconds in totals.most_common() if seconds * 1e6 >= 1)
+
+
+class Profile:
+    def __init__(self, profile_id, method, path, endpoint, user_id, sampled):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.user_id = user_id
+        self.sampled = sampled
+        self.created_at = datetime.utcnow()
+        self.status_code = None
+        self.duration = 0.0
+        self.sql = []          # [(statement, seconds)]
+        self.sql_dropped = 0
+        self.stats = {}
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'endpoint': self.endpoint,
+            'user_id': self.user_id,
+            'sampled': self.sampled,
+            'status_code': self.status_code,
+            'created_at': self.created_at.isoformat(),
+            'duration_ms': round(self.duration * 1000, 2),
+            'sql_count': len(self.sql) + self.sql_dropped,
+            'sql_ms': round(sum(seconds for _, seconds in self.sql) * 1000, 2),
+        }
+
+    def to_dict(self, top=30):
+        result = self.summary()
+        result['sql'] = [{'statement': statement, 'ms': round(seconds * 1000, 3)}
+                         for statement, seconds in self.sql]
+        result['sql_dropped'] = self.sql_dropped
+        functions = sorted(self.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+        result['functions'] = [{
+            'function': _label(func),
+            'calls': nc,
+            'self_ms': round(tt * 1000, 3),
+            'cumulative_ms': round(ct * 1000, 3),
+        } for func, (cc, nc, tt, ct, callers) in functions]
+        return result
+
+    def pstats_bytes(self):
+        """Contents of a .pstats file (what pstats.Stats.dump_stats writes)"""
+        return marshal.dumps(self.stats)
+
+
+class RequestProfiler:
+    def __init__(self, size=50):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.max_sql = 500
+        self.excluded_prefixes = ()
+        self._profiles = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PROFILING_ENABLED', False)
+        if not self.enabled:
+            return
+        self.sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.max_sql = app.config.get('PROFILE_MAX_SQL', 500)
+        self.excluded_prefixes = tuple(app.config.get('PROFILE_EXCLUDED_PATHS', ()))
+        self._profiles = deque(maxlen=app.config.get('PROFILE_BUFFER_SIZE', 50))
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    # Request hooks
+
+    def _requested_by_admin(self):
+        from src.models.user import User
+
+        flag = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_ARG)
+        if flag not in ('1', 'true') or 'user_id' not in session:
+            return False
+        user = User.query.get(session['user_id'])
+        return user is not None and user.role == 'admin'
+
+    def before_request(self):
+        if request.path.startswith(self.excluded_prefixes):
+            return
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and not self._requested_by_admin():
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active on this interpreter (Python 3.12+)
+            return
+        g.profile = Profile(next(self._ids), request.method, request.full_path.rstrip('?'),
+                            request.endpoint, session.get('user_id'), sampled)
+        g.profiler = profiler
+        g.profile_started = time.perf_counter()
+
+    def after_request(self, response):
+        profile = g.get('profile')
+        if profile is not None:
+            profile.status_code = response.status_code
+            response.headers['X-Profile-Id'] = str(profile.id)
+        return response
+
+    def teardown_request(self, exc):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        profiler = g.pop('profiler')
+        profiler.disable()
+        profile.duration = time.perf_counter() - g.pop('profile_started')
+        if profile.status_code is None:
+            profile.status_code = 500
+        profile.stats = pstats.Stats(profiler).stats
+        with self._lock:
+            self._profiles.append(profile)
+
+    # Buffer
+
+    def list(self):
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def get(self, profile_id):
+        with self._lock:
+            for profile in self._profiles:
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    if has_request_context() and g.get('profile') is not None:
+        connection.info.setdefault('profile_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    started = connection.info.get('profile_started')
+    if not started or not has_request_context():
+        return
+    seconds = time.perf_counter() - started.pop()
+    profile = g.get('profile')
+    if profile is None:
+        return
+    if len(profile.sql) < request_profiler.max_sql:
+        profile.sql.append((statement, seconds))
+    else:
+        profile.sql_dropped += 1
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,219 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import g, jsonify, request, session
+
+RATE_UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+def parse_rate(rate):
+    """'30/minute' -> (30, 0.5): bucket size and tokens added per second"""
+    count, _, unit = rate.partition('/')
+    count = int(count)
+    return count, count / RATE_UNITS[unit.strip().rstrip('s')]
+
+
+def refill(tokens, updated, capacity, per_second, now):
+    return min(capacity, tokens + (now - updated) * per_second)
+
+
+class MemoryBackend:
+    """Token buckets in a dict, local to one process"""
+
+    def __init__(self, max_keys=100000, max_idle=3600):
+        self.max_keys = max_keys
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, capacity, per_second, cost=1, now=None):
+        """Take ``cost`` tokens; returns 0 if allowed, else seconds to wait"""
+        return self.take_many([(key, capacity, per_second)], cost, now)
+
+    def take_many(self, buckets, cost=1, now=None):
+        """Take ``cost`` tokens from every (key, capacity, per_second) bucket, or from none.
+
+        Returns 0 if all buckets allowed, else the longest wait.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            levels = {}
+            for key, capacity, per_second in buckets:
+                tokens, updated = self._buckets.get(key, (capacity, now))
+                levels[key] = refill(tokens, updated, capacity, per_second, now)
+            wait = max([(cost - levels[key]) / per_second
+                        for key, _, per_second in buckets if levels[key] < cost], default=0)
+            for key, tokens in levels.items():
+                self._buckets[key] = (tokens if wait else tokens - cost, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets = {key: value for key, value in self._buckets.items()
+                                 if now - value[1] < self.max_idle}
+            return wait
+
+
+class SqliteBackend:
+    """Token buckets in a local SQLite file shared by all worker processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute('CREATE TABLE IF NOT EXISTS buckets '
+                           '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            self._local.connection = connection
+        return connection
+
+    def take(self, key, capacity, per_second, cost=1, now=None):
+        return self.take_many([(key, capacity, per_second)], cost, now)
+
+    def take_many(self, buckets, cost=1, now=None):
+        # Wall clock, since monotonic clocks are not shared between processes
+        now = time.time() if now is None else now
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            levels = {}
+            for key, capacity, per_second in buckets:
+                row = connection.execute('SELECT tokens, updated FROM buckets WHERE key = ?',
+                                         (key,)).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                levels[key] = refill(tokens, updated, capacity, per_second, now)
+            wait = max([(cost - levels[key]) / per_second
+                        for key, _, per_second in buckets if levels[key] < cost], default=0)
+            connection.executemany('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                                   [(key, tokens if wait else tokens - cost, now)
+                                    for key, tokens in levels.items()])
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+
+def too_many_requests(retry_after, error='Too many requests'):
+    response = jsonify({'error': error})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+class RateLimiter:
+    """Per-route token-bucket limits configured through RATE_LIMITS.
+
+    RATE_LIMITS maps a limit name to a list of rules such as
+    ``{'rate': '30/minute', 'burst': 10, 'key': 'user'}`` where ``key`` is
+    one of ``ip``, ``user`` (falls back to ip when anonymous) or ``route``
+    (one bucket shared by every caller).
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.rules = {}
+        self.enabled = True
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
+        self.rules = app.config.get('RATE_LIMITS', {})
+        backend = app.config.get('RATE_LIMIT_BACKEND', 'memory')
+        if backend == 'memory':
+            self.backend = MemoryBackend()
+        elif backend.startswith('sqlite:///'):
+            self.backend = SqliteBackend(backend[len('sqlite:///'):])
+        else:
+            raise ValueError(f'Unknown rate limit backend: {backend}')
+        app.extensions['rate_limiter'] = self
+
+    @staticmethod
+    def _key(kind, name, rate):
+        # The rate keeps rules of the same kind (e.g. burst and sustained per user) apart
+        scope = f"{name}:{rate.replace(' ', '')}"
+        if kind == 'route':
+            return scope
+        if kind == 'user' and 'user_id' in session:
+            return f"{scope}:user:{session['user_id']}"
+        return f'{scope}:ip:{request.remote_addr}'
+
+    def check(self, name):
+        """Return the seconds to wait if any rule for ``name`` is exhausted.
+
+        Tokens are only taken when every rule allows the request, so a
+        request rejected by one rule costs nothing against the others.
+        """
+        buckets = []
+        for rule in self.rules.get(name, ()):
+            count, per_second = parse_rate(rule['rate'])
+            capacity = rule.get('burst', count)
+            buckets.append((self._key(rule.get('key', 'ip'), name, rule['rate']), capacity, per_second))
+        return self.backend.take_many(buckets) if buckets else 0
+
+    def limit(self, name):
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if self.enabled and self.backend is not None:
+                    wait = self.check(name)
+                    if wait:
+                        return too_many_requests(wait)
+                return f(*args, **kwargs)
+            return decorated_function
+        return decorator
+
+
+class WriteAdmission:
+    """Caps concurrent write requests so excess load is shed with a 503
+    instead of queueing on the SQLite write lock"""
+
+    def __init__(self, app=None):
+        self._semaphore = None
+        self.timeout = 0
+        self.exempt = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        limit = app.config.get('WRITE_CONCURRENCY_LIMIT', 0)
+        if not limit:
+            return
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self.timeout = app.config.get('WRITE_ADMISSION_TIMEOUT', 1.0)
+        self.exempt = set(app.config.get('WRITE_ADMISSION_EXEMPT_ENDPOINTS', ()))
+        app.before_request(self._acquire)
+        app.teardown_request(self._release)
+
+    def _acquire(self):
+        if request.method not in WRITE_METHODS or not request.path.startswith('/api/'):
+            return None
+        if request.endpoint in self.exempt:
+            return None
+        if not self._semaphore.acquire(timeout=self.timeout):
+            response = jsonify({'error': 'Server is busy, please retry'})
+            response.status_code = 503
+            response.headers['Retry-After'] = '1'
+            return response
+        g.write_admitted = True
+        return None
+
+    def _release(self, exc=None):
+        if g.pop('write_admitted', False):
+            self._semaphore.release()
+
+
+limiter = RateLimiter()
+write_admission = WriteAdmission()
@@ -0,0 +1,351 @@
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, inspect
+
+from src.extensions import db
+from src.models.rollup import TicketDailyStats, TicketResolutionBucket
+from src.services.sharding import each_shard
+
+# Resolution histogram: 4 buckets per doubling, so estimates are within ~19%
+BUCKETS_PER_OCTAVE = 4
+
+
+def bucket_for(seconds):
+    if seconds < 1:
+        return 0
+    return int(math.floor(BUCKETS_PER_OCTAVE * math.log2(seconds))) + 1
+
+
+def bucket_value(bucket):
+    """Representative resolution time of a bucket (its geometric midpoint)"""
+    if bucket <= 0:
+        return 0.5
+    return 2 ** ((bucket - 0.5) / BUCKETS_PER_OCTAVE)
+
+
+def contributions(snapshot):
+    """Rollup deltas of one ticket, from (created_at, closed_at, priority, agent_id).
+
+    Returns ({(day, priority, agent_key): [created, closed, resolution_seconds]},
+    {(day, priority, agent_key, bucket): count}). Rollups are the sum of
+    this over all tickets, so a change is applied by retracting the old
+    snapshot and adding the new one.
+    """
+    created_at, closed_at, priority, agent_id = snapshot
+    agent_key = agent_id or 0
+    daily = defaultdict(lambda: [0, 0, 0.0])
+    buckets = Counter()
+    if created_at is None:
+        return daily, buckets
+    daily[(created_at.date(), priority, agent_key)][0] += 1
+    if closed_at is not None:
+        seconds = max((closed_at - created_at).total_seconds(), 0.0)
+        key = (closed_at.date(), priority, agent_key)
+        daily[key][1] += 1
+        daily[key][2] += seconds
+        buckets[key + (bucket_for(seconds),)] += 1
+    return daily, buckets
+
+
+# Ticket columns the rollups depend on, in snapshot order
+SNAPSHOT_FIELDS = ('created_at', 'closed_at', 'priority', 'agent_id')
+
+
+def ticket_snapshot(ticket, previous=False):
+    """Rollup-relevant fields of a ticket, optionally as loaded before this flush"""
+    state = inspect(ticket)
+
+    def value(name):
+        history = state.attrs[name].history
+        if previous and history.deleted:
+            return history.deleted[0]
+        if previous and history.added:
+            return None
+        return getattr(ticket, name)
+
+    return tuple(value(name) for name in SNAPSHOT_FIELDS)
+
+
+def delta_statements(before=None, after=None):
+    """(update, insert) statement pairs moving one ticket's contribution from ``before`` to ``after``.
+
+    Building them is the costly part; ``execute_delta`` only runs them, so
+    callers can build them before taking the write lock.
+    """
+    daily = defaultdict(lambda: [0, 0, 0.0])
+    buckets = Counter()
+    for snapshot, sign in ((before, -1), (after, 1)):
+        if snapshot is None:
+            continue
+        snapshot_daily, snapshot_buckets = contributions(snapshot)
+        for key, values in snapshot_daily.items():
+            for i, amount in enumerate(values):
+                daily[key][i] += sign * amount
+        for key, count in snapshot_buckets.items():
+            buckets[key] += sign * count
+
+    statements = []
+    stats = TicketDailyStats.__table__
+    for (day, priority, agent_key), (created, closed, seconds) in daily.items():
+        if not (created or closed or seconds):
+            continue
+        where = (stats.c.day == day) & (stats.c.priority == priority) & (stats.c.agent_key == agent_key)
+        statements.append((
+            stats.update().where(where).values(
+                created=stats.c.created + created,
+                closed=stats.c.closed + closed,
+                resolution_seconds=stats.c.resolution_seconds + seconds),
+            stats.insert().values(
+                day=day, priority=priority, agent_key=agent_key,
+                created=created, closed=closed, resolution_seconds=seconds)))
+
+    histogram = TicketResolutionBucket.__table__
+    for (day, priority, agent_key, bucket), count in buckets.items():
+        if not count:
+            continue
+        where = ((histogram.c.day == day) & (histogram.c.priority == priority)
+                 & (histogram.c.agent_key == agent_key) & (histogram.c.bucket == bucket))
+        statements.append((
+            histogram.update().where(where).values(count=histogram.c.count + count),
+            histogram.insert().values(
+                day=day, priority=priority, agent_key=agent_key, bucket=bucket, count=count)))
+    return statements
+
+
+def execute_delta(connection, statements):
+    """Run ``delta_statements``: update each row, inserting it if missing"""
+    for update, insert in statements:
+        if connection.execute(update).rowcount == 0:
+            connection.execute(insert)
+
+
+def apply_delta(connection, before=None, after=None):
+    """Move one ticket's contribution from ``before`` to ``after`` snapshots"""
+    execute_delta(connection, delta_statements(before, after))
+
+
+def _track_ticket_changes(session, flush_context):
+    from src.models.ticket import Ticket
+
+    connection = None
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Ticket):
+            continue
+        if obj in session.new:
+            before, after = None, ticket_snapshot(obj)
+        elif obj in session.deleted:
+            before, after = ticket_snapshot(obj, previous=True), None
+        else:
+            state = inspect(obj)
+            if not any(state.attrs[name].history.has_changes() for name in SNAPSHOT_FIELDS):
+                continue
+            before, after = ticket_snapshot(obj, previous=True), ticket_snapshot(obj)
+        connection = connection or session.connection()
+        apply_delta(connection, before, after)
+
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+def init_app(app):
+    """Maintain rollups in the same transaction as every ticket change"""
+    from src.models.ticket import Ticket
+
+    if not event.contains(db.session, 'after_flush', _track_ticket_changes):
+        event.listen(db.session, 'after_flush', _track_ticket_changes)
+        # Load the old value when these are set on an expired ticket, so
+        # the previous snapshot can always be retracted
+        for name in ('closed_at', 'priority', 'agent_id'):
+            event.listen(getattr(Ticket, name), 'set', _load_previous_value,
+                         active_history=True, retval=True)
+    app.cli.add_command(rollups_cli)
+
+
+# Full recomputation
+
+def recompute(chunk_size=1000):
+    """Rollups computed from scratch over the current shard's tickets, as plain dicts"""
+    from src.models.ticket import Ticket
+
+    daily = defaultdict(lambda: [0, 0, 0.0])
+    buckets = Counter()
+    rows = db.session.query(
+        Ticket.created_at, Ticket.closed_at, Ticket.priority, Ticket.agent_id
+    ).execution_options(yield_per=chunk_size)
+    for row in rows:
+        ticket_daily, ticket_buckets = contributions(tuple(row))
+        for key, values in ticket_daily.items():
+            for i, amount in enumerate(values):
+                daily[key][i] += amount
+        buckets.update(ticket_buckets)
+    return daily, buckets
+
+
+def rebuild():
+    """Recompute the rollups of every shard; returns the number of rows written"""
+    daily_rows = bucket_rows = 0
+    for _ in each_shard():
+        daily, buckets = rebuild_shard()
+        daily_rows += daily
+        bucket_rows += buckets
+    return daily_rows, bucket_rows
+
+
+def rebuild_shard():
+    """Recompute the rollups of the current shard from its tickets"""
+    daily, buckets = recompute()
+    TicketResolutionBucket.query.delete()
+    TicketDailyStats.query.delete()
+    if daily:
+        db.session.execute(TicketDailyStats.__table__.insert(), [
+            {'day': day, 'priority': priority, 'agent_key': agent_key,
+             'created': created, 'closed': closed, 'resolution_seconds': seconds}
+            for (day, priority, agent_key), (created, closed, seconds) in daily.items()
+        ])
+    if buckets:
+        db.session.execute(TicketResolutionBucket.__table__.insert(), [
+            {'day': day, 'priority': priority, 'agent_key': agent_key, 'bucket': bucket, 'count': count}
+            for (day, priority, agent_key, bucket), count in buckets.items()
+        ])
+    db.session.commit()
+    return len(daily), len(buckets)
+
+
+def verify(tolerance=1e-3):
+    """Differences between the stored rollups and a full recomputation"""
+    differences = []
+    for _ in each_shard():
+        differences += _verify_shard(tolerance)
+    return differences
+
+
+def _verify_shard(tolerance):
+    daily, buckets = recompute()
+    differences = []
+    stored = {(row.day, row.priority, row.agent_key): [row.created, row.closed, row.resolution_seconds]
+              for row in TicketDailyStats.query}
+    for key in set(daily) | set(stored):
+        expected = daily.get(key, [0, 0, 0.0])
+        actual = stored.get(key, [0, 0, 0.0])
+        if expected[:2] != actual[:2] or abs(expected[2] - actual[2]) > tolerance:
+            differences.append(('daily', key, expected, actual))
+    stored = {(row.day, row.priority, row.agent_key, row.bucket): row.count
+              for row in TicketResolutionBucket.query}
+    for key in set(buckets) | set(stored):
+        if buckets.get(key, 0) != stored.get(key, 0):
+            differences.append(('bucket', key, buckets.get(key, 0), stored.get(key, 0)))
+    return differences
+
+
+rollups_cli = AppGroup('rollups', help='Maintain ticket analytics rollups')
+
+
+@rollups_cli.command('rebuild')
+def rebuild_command():
+    """Recompute all rollups from the tickets table"""
+    daily, buckets = rebuild()
+    click.echo(f'Rebuilt {daily} daily rows and {buckets} histogram rows')
+
+
+@rollups_cli.command('verify')
+def verify_command():
+    """Compare stored rollups with a full recomputation"""
+    differences = verify()
+    for difference in differences[:50]:
+        click.echo(repr(difference))
+    if differences:
+        raise SystemExit(f'{len(differences)} rollup rows differ')
+    click.echo('Rollups match a full recomputation')
+
+
+# Queries over rollups
+
+def _percentile(histogram, fraction):
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = fraction * total
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return round(bucket_value(bucket), 1)
+
+
+def ticket_series(start, end, priority=None, agent_id=None):
+    """Per-day created/closed/backlog and resolution stats for [start, end]"""
+    stats = TicketDailyStats
+    filters = []
+    if priority:
+        filters.append(stats.priority == priority)
+    if agent_id is not None:
+        filters.append(stats.agent_key == agent_id)
+
+    backlog = 0
+    by_day = defaultdict(lambda: (0, 0))
+    for _ in each_shard():
+        backlog += db.session.query(
+            func.coalesce(func.sum(stats.created - stats.closed), 0)
+        ).filter(stats.day < start, *filters).scalar()
+        rows = db.session.query(
+            stats.day, func.sum(stats.created), func.sum(stats.closed)
+        ).filter(stats.day >= start, stats.day <= end, *filters).group_by(stats.day)
+        for day, created, closed in rows:
+            by_day[day] = (by_day[day][0] + created, by_day[day][1] + closed)
+
+    days = []
+    day = start
+    while day <= end:
+        created, closed = by_day.get(day, (0, 0))
+        backlog += created - closed
+        days.append({'day': day.isoformat(), 'created': created, 'closed': closed, 'backlog': backlog})
+        day += timedelta(days=1)
+
+    return {'days': days, 'resolution': resolution_stats(start, end, priority, agent_id)}
+
+
+def resolution_stats(start, end, priority=None, agent_id=None):
+    stats, histogram = TicketDailyStats, TicketResolutionBucket
+    stat_filters = [stats.day >= start, stats.day <= end]
+    bucket_filters = [histogram.day >= start, histogram.day <= end]
+    if priority:
+        stat_filters.append(stats.priority == priority)
+        bucket_filters.append(histogram.priority == priority)
+    if agent_id is not None:
+        stat_filters.append(stats.agent_key == agent_id)
+        bucket_filters.append(histogram.agent_key == agent_id)
+
+    result = {}
+    for name, stat_group, bucket_group in (
+            ('by_priority', stats.priority, histogram.priority),
+            ('by_agent', stats.agent_key, histogram.agent_key)):
+        totals = defaultdict(lambda: [0, 0.0])
+        histograms = defaultdict(Counter)
+        for _ in each_shard():
+            for key, closed, seconds in db.session.query(
+                    stat_group, func.sum(stats.closed), func.sum(stats.resolution_seconds)
+            ).filter(*stat_filters).group_by(stat_group):
+                totals[key][0] += closed or 0
+                totals[key][1] += seconds or 0.0
+            for key, bucket, count in db.session.query(
+                    bucket_group, histogram.bucket, func.sum(histogram.count)
+            ).filter(*bucket_filters).group_by(bucket_group, histogram.bucket):
+                histograms[key][bucket] += count
+        group = {}
+        for key, (closed, seconds) in totals.items():
+            if not closed:
+                continue
+            label = key if name == 'by_priority' else str(key) if key else 'unassigned'
+            group[label] = {
+                'closed': closed,
+                'avg_seconds': round(seconds / closed, 1),
+                'median_seconds': _percentile(histograms[key], 0.5),
+                'p90_seconds': _percentile(histograms[key], 0.9),
+            }
+        result[name] = group
+    return result
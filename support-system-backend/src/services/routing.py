@@ -0,0 +1,100 @@
+"""Read/write routing: GET requests read from a separate pool.
+
+Without ``SQLALCHEMY_READ_URI`` the read pool holds read-only
+connections to the primary SQLite file, which is switched to WAL so
+readers never block on (or block) the writer. With a replica URI (e.g. a
+PostgreSQL streaming replica) a user's reads stay on the primary for
+``READ_AFTER_WRITE_SECONDS`` after their own write, so they always see
+it despite replication lag.
+"""
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context, has_request_context, request, session
+from sqlalchemy import create_engine, event
+
+from src.extensions import db
+
+READ_METHODS = {'GET', 'HEAD'}
+
+
+def _enable_wal(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.close()
+
+
+def sqlite_read_only_uri(url):
+    """Read-only URI for the same SQLite file (``mode=ro``)"""
+    return f'sqlite:///file:{url.database}?mode=ro&uri=true'
+
+
+def note_write():
+    """Record that the current request committed a write"""
+    if has_request_context():
+        g.db_wrote = True
+
+
+def _note_commit(db_session):
+    note_write()
+
+
+class ReadRouter:
+    def __init__(self):
+        self.engine = None
+        self.sticky_seconds = 0
+
+    def init_app(self, app):
+        if not app.config.get('READ_ROUTING_ENABLED'):
+            return
+        with app.app_context():
+            primary = db.engine
+        read_uri = app.config.get('SQLALCHEMY_READ_URI')
+        if read_uri:
+            self.sticky_seconds = app.config.get('READ_AFTER_WRITE_SECONDS', 5)
+        elif primary.dialect.name == 'sqlite' and primary.url.database not in (None, '', ':memory:'):
+            event.listen(primary, 'connect', _enable_wal)
+            with primary.connect() as connection:
+                connection.exec_driver_sql('PRAGMA journal_mode=WAL')
+            read_uri = sqlite_read_only_uri(primary.url)
+        else:
+            # No replica and not a file database: nothing to route to
+            return
+        self.engine = create_engine(read_uri, pool_size=app.config.get('READ_POOL_SIZE', 10),
+                                    pool_pre_ping=True)
+        app.extensions['read_router'] = self
+        if not event.contains(db.session, 'after_commit', _note_commit):
+            event.listen(db.session, 'after_commit', _note_commit)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def before_request(self):
+        if request.method not in READ_METHODS:
+            return
+        if self.sticky_seconds and session.get('read_primary_until', 0) > time.time():
+            return
+        g.read_engine = self.engine
+
+    def after_request(self, response):
+        # Read-your-writes: this client's next reads go to the primary
+        if self.sticky_seconds and g.get('db_wrote'):
+            session['read_primary_until'] = time.time() + self.sticky_seconds
+        return response
+
+
+@contextmanager
+def primary():
+    """Read from the primary inside the block, even during a routed GET.
+
+    Used to rebuild in-memory state that is kept current by commit hooks,
+    which must not be rebuilt from a lagging replica.
+    """
+    engine = g.pop('read_engine', None) if has_app_context() else None
+    try:
+        yield
+    finally:
+        if engine is not None:
+            g.read_engine = engine
+
+
+read_router = ReadRouter()
@@ -0,0 +1,66 @@
+"""Additive schema upgrades for databases created by older versions.
+
+``db.create_all()`` creates missing tables but never changes existing
+ones, so columns added to existing tables are listed here and added with
+ALTER TABLE at startup, before anything reads them. Indexes missing from
+existing tables are created too. Column types, defaults and nullability
+come from the models.
+"""
+import logging
+
+from sqlalchemy import inspect, text
+
+from src.extensions import db
+
+logger = logging.getLogger(__name__)
+
+# (table, column) added after the table was first released
+ADDED_COLUMNS = [
+    ('ticket', 'sla_due_at'),
+    ('knowledge_base_articles', 'content_html'),
+    ('knowledge_base_articles', 'excerpt'),
+    ('ticket', 'version'),
+]
+
+
+def column_ddl(column, dialect):
+    ddl = f'{column.name} {column.type.compile(dialect=dialect)}'
+    if column.server_default is not None:
+        ddl += f' DEFAULT {column.server_default.arg}'
+    if not column.nullable:
+        ddl += ' NOT NULL'
+    return ddl
+
+
+def upgrade(engine=None):
+    """Add missing columns and indexes to existing tables; returns the columns added"""
+    engine = engine or db.engine
+    added = []
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        tables = set(inspector.get_table_names())
+        existing = {}
+        for table_name, column_name in ADDED_COLUMNS:
+            if table_name not in tables:
+                continue  # created with every column by create_all
+            if table_name not in existing:
+                existing[table_name] = {column['name'] for column in inspector.get_columns(table_name)}
+            if column_name in existing[table_name]:
+                continue
+            column = db.metadata.tables[table_name].c[column_name]
+            connection.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_ddl(column, engine.dialect)}'))
+            added.append(f'{table_name}.{column_name}')
+        indexes = []
+        for table in db.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    indexes.append(index.name)
+    for name in added:
+        logger.warning('Added column %s to the existing database', name)
+    for name in indexes:
+        logger.warning('Added index %s to the existing database', name)
+    return added
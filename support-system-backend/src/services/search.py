@@ -0,0 +1,266 @@
+import heapq
+import math
+import re
+import threading
+import time
+
+from sqlalchemy import event, inspect
+
+from src.extensions import db
+from src.services.routing import primary
+from src.services.sharding import each_shard
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+TITLE_WEIGHT = 3.0
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall((text or '').lower()) if len(token) > 1]
+
+
+def snippet(text, terms, width=160):
+    """A window of ``text`` around the first occurrence of any term"""
+    if not text:
+        return ''
+    lowered = text.lower()
+    positions = [lowered.find(term) for term in terms]
+    positions = [position for position in positions if position >= 0]
+    start = max(min(positions) - width // 4, 0) if positions else 0
+    end = start + width
+    result = ' '.join(text[start:end].split())
+    if start > 0:
+        result = '…' + result
+    if end < len(text):
+        result += '…'
+    return result
+
+
+class TicketSearchIndex:
+    """In-memory inverted index over ticket titles, descriptions and messages.
+
+    Postings map a term to {ticket_id: weighted term frequency}; a query
+    only touches the postings of its own terms, so its cost grows with
+    the number of matching tickets rather than with the corpus. Results
+    are ranked with BM25. Each process keeps its own index, built from the
+    database on first use and kept current by session events after every
+    commit; ``SEARCH_REBUILD_INTERVAL`` bounds drift between workers.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+        self._journal = None    # changes made while a rebuild reads the database
+        self._postings = {}
+        self._lengths = {}      # ticket_id -> number of weighted terms
+        self._owners = {}       # ticket_id -> (customer_id, agent_id)
+        self._total_length = 0.0
+        self._loaded_at = None
+
+    # Indexing
+
+    def _add_text(self, ticket_id, text, weight=1.0):
+        tokens = tokenize(text)
+        if not tokens:
+            return
+        for token in tokens:
+            docs = self._postings.setdefault(token, {})
+            docs[ticket_id] = docs.get(ticket_id, 0.0) + weight
+        added = len(tokens) * weight
+        self._lengths[ticket_id] = self._lengths.get(ticket_id, 0.0) + added
+        self._total_length += added
+
+    def _record(self, *change):
+        if self._journal is not None:
+            self._journal.append(change)
+
+    def add_ticket(self, ticket_id, customer_id, agent_id, title, description):
+        with self._lock:
+            self._record('ticket', ticket_id, customer_id, agent_id, title, description)
+            self._owners[ticket_id] = (customer_id, agent_id)
+            self._add_text(ticket_id, title, TITLE_WEIGHT)
+            self._add_text(ticket_id, description)
+
+    def add_message(self, ticket_id, content, message_id=None):
+        with self._lock:
+            self._record('message', ticket_id, content, message_id)
+            if ticket_id in self._owners:
+                self._add_text(ticket_id, content)
+
+    def set_agent(self, ticket_id, agent_id):
+        with self._lock:
+            self._record('agent', ticket_id, agent_id)
+            if ticket_id in self._owners:
+                self._owners[ticket_id] = (self._owners[ticket_id][0], agent_id)
+
+    def remove_ticket(self, ticket_id):
+        with self._lock:
+            self._record('delete', ticket_id)
+            if self._owners.pop(ticket_id, None) is None:
+                return
+            for term in list(self._postings):
+                docs = self._postings[term]
+                if docs.pop(ticket_id, None) is not None and not docs:
+                    del self._postings[term]
+            self._total_length -= self._lengths.pop(ticket_id, 0.0)
+
+    def rebuild(self, chunk_size=1000):
+        """Reload the index from the database in chunks.
+
+        The new postings are built without holding the lock, so commits
+        keep updating the current ones meanwhile. Their changes are
+        recorded and replayed onto the new postings, except tickets and
+        messages the reload already read, before the two are swapped.
+        """
+        with self._rebuild_lock:
+            self._rebuild(chunk_size)
+
+    def _rebuild(self, chunk_size=1000):
+        from src.models.message import Message
+        from src.models.ticket import Ticket
+
+        fresh = TicketSearchIndex()
+        read_messages = set()
+        with self._lock:
+            self._journal = []
+        try:
+            with primary():
+                for _ in each_shard():
+                    tickets = db.session.query(
+                        Ticket.id, Ticket.customer_id, Ticket.agent_id, Ticket.title, Ticket.description
+                    ).execution_options(yield_per=chunk_size)
+                    for row in tickets:
+                        fresh.add_ticket(*row)
+                    messages = db.session.query(
+                        Message.id, Message.ticket_id, Message.content
+                    ).execution_options(yield_per=chunk_size)
+                    for message_id, ticket_id, content in messages:
+                        # A message whose ticket was committed after the tickets were
+                        # read is not indexed here; the journal replay adds both
+                        if ticket_id in fresh._owners:
+                            read_messages.add(message_id)
+                            fresh.add_message(ticket_id, content)
+            with self._lock:
+                for kind, *args in self._journal:
+                    if kind == 'ticket':
+                        if args[0] not in fresh._owners:
+                            fresh.add_ticket(*args)
+                    elif kind == 'message':
+                        if args[2] not in read_messages:
+                            fresh.add_message(*args)
+                    elif kind == 'agent':
+                        fresh.set_agent(*args)
+                    else:
+                        fresh.remove_ticket(*args)
+                self._postings, self._lengths = fresh._postings, fresh._lengths
+                self._owners, self._total_length = fresh._owners, fresh._total_length
+                self._loaded_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._journal = None
+
+    def ensure_loaded(self, max_age=None):
+        """Load the index on first use, and reload it when older than ``max_age``.
+
+        Requests wait for the first load. A reload happens in one request
+        while the others keep searching the current index.
+        """
+        if self._loaded_at is None:
+            with self._rebuild_lock:
+                if self._loaded_at is None:
+                    self._rebuild()
+        elif max_age and time.monotonic() - self._loaded_at > max_age:
+            if self._rebuild_lock.acquire(blocking=False):
+                try:
+                    if time.monotonic() - self._loaded_at > max_age:
+                        self._rebuild()
+                finally:
+                    self._rebuild_lock.release()
+
+    # Querying
+
+    def search(self, query, allowed=None, limit=20, offset=0):
+        """Return (total matches, [(ticket_id, score), ...]) for one page.
+
+        ``allowed`` is called with (customer_id, agent_id) to apply the
+        caller's role scoping before ranking.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            count = len(self._owners)
+            if not terms or not count:
+                return 0, []
+            average = self._total_length / count or 1.0
+            scores = {}
+            for term in terms:
+                docs = self._postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+                for ticket_id, frequency in docs.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[ticket_id] / average)
+                    scores[ticket_id] = scores.get(ticket_id, 0.0) + \
+                        idf * frequency * (self.k1 + 1) / (frequency + norm)
+            if allowed is not None:
+                scores = {ticket_id: score for ticket_id, score in scores.items()
+                          if allowed(*self._owners[ticket_id])}
+        top = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return len(scores), top[offset:]
+
+
+search_index = TicketSearchIndex()
+
+
+def _collect_changes(session, flush_context):
+    from src.models.message import Message
+    from src.models.ticket import Ticket
+
+    pending = session.info.setdefault('search_index_changes', [])
+    for obj in session.new:
+        if isinstance(obj, Ticket):
+            pending.append(('ticket', obj.id, obj.customer_id, obj.agent_id,
+                            obj.title, obj.description))
+        elif isinstance(obj, Message):
+            pending.append(('message', obj.ticket_id, obj.content, obj.id))
+    for obj in session.dirty:
+        if isinstance(obj, Ticket) and inspect(obj).attrs.agent_id.history.has_changes():
+            pending.append(('agent', obj.id, obj.agent_id))
+    for obj in session.deleted:
+        if isinstance(obj, Ticket):
+            pending.append(('delete', obj.id))
+
+
+def note_agent_change(session, ticket_id, agent_id):
+    """Record an agent change made outside the ORM unit of work (a core UPDATE)"""
+    session.info.setdefault('search_index_changes', []).append(('agent', ticket_id, agent_id))
+
+
+def _apply_changes(session):
+    changes = session.info.pop('search_index_changes', None)
+    if not changes or (search_index._loaded_at is None and search_index._journal is None):
+        return
+    for change in changes:
+        kind, args = change[0], change[1:]
+        if kind == 'ticket':
+            search_index.add_ticket(*args)
+        elif kind == 'message':
+            search_index.add_message(*args)
+        elif kind == 'agent':
+            search_index.set_agent(*args)
+        else:
+            search_index.remove_ticket(*args)
+
+
+def _discard_changes(session):
+    session.info.pop('search_index_changes', None)
+
+
+def init_app(app):
+    """Keep the index current with committed tickets and messages"""
+    if event.contains(db.session, 'after_flush', _collect_changes):
+        return
+    event.listen(db.session, 'after_flush', _collect_changes)
+    event.listen(db.session, 'after_commit', _apply_changes)
+    event.listen(db.session, 'after_rollback', _discard_changes)
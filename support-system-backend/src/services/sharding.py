@@ -0,0 +1,451 @@
+"""Per-company database sharding (SQLite).
+
+With ``SHARDING_ENABLED`` each company's tickets, messages, attachments
+and ticket rollups live on one of the ``SHARD_URIS`` databases, so one
+busy company's writes only lock its own file. The primary database is the
+``default`` shard: it keeps users, companies, statuses and articles, the
+company -> shard map, and the tickets of companies that were there before
+sharding was enabled (and of customers without a company). New companies
+are placed on the configured shard holding the fewest companies.
+
+Routing: before each request the router picks the company the request is
+about: that of the ticket, message or attachment in the URL, or else the
+customer's own. Every statement of the request then goes to that
+company's shard. Shard connections ATTACH the primary database, so queries
+joining tickets to users or statuses work unchanged.
+
+Ids: rows get ids ``company_id * ID_SPAN + n`` from a per-company counter
+on the company's shard, taken in the same transaction as the insert. Ids
+stay unique across shards and give the company of any row without a
+lookup. Rows created before sharding keep their ids; once they leave the
+default shard they are found through ``shard_legacy_rows``.
+
+Views across companies (staff ticket lists, statistics, the in-memory
+indexes) use ``fan_out`` or ``each_shard``. ``flask shards move-company``
+moves a company between shards.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import click
+from flask import current_app, g, jsonify, request, session
+from flask.cli import AppGroup
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.exc import IntegrityError
+
+from src.extensions import db
+from src.models.shard import CompanyShard, LegacyRowLocation, ShardIdCounter
+from src.services.routing import _enable_wal
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD = 'default'
+ID_SPAN = 10 ** 9
+# Tables whose rows live on the shard of their company
+SHARDED_TABLES = ('ticket', 'message', 'attachment', 'ticket_daily_stats',
+                  'ticket_resolution_buckets', 'shard_id_counters')
+# Sharded tables with per-company ids; their ids appear in URLs
+ALLOCATED_TABLES = ('ticket', 'message', 'attachment')
+# URL arguments that name the row a request is about
+LOCATING_ARGS = (('ticket_id', 'ticket'), ('message_id', 'message'), ('attachment_id', 'attachment'))
+
+
+class CompanyMoving(Exception):
+    """The company is being copied to another shard"""
+
+
+def _attach_primary(path):
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('ATTACH DATABASE ? AS global', (path,))
+        cursor.close()
+    return connect
+
+
+class ShardRouter:
+    def __init__(self):
+        self.enabled = False
+        self.engines = {}       # shard name -> engine; the default shard is db.engine
+        self.map_ttl = 5
+        self._map = {}          # company_id -> (shard, moving)
+        self._map_loaded_at = None
+        self._legacy = {}       # (table, row id) -> company_id
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def init_app(self, app):
+        if not app.config.get('SHARDING_ENABLED'):
+            return
+        with app.app_context():
+            primary = db.engine
+        if primary.dialect.name != 'sqlite' or primary.url.database in (None, '', ':memory:'):
+            raise RuntimeError('Sharding needs a file-backed SQLite primary database')
+        if not event.contains(primary, 'connect', _enable_wal):
+            event.listen(primary, 'connect', _enable_wal)
+        self.map_ttl = app.config.get('SHARD_MAP_TTL', 5)
+        tables = [db.metadata.tables[name] for name in SHARDED_TABLES]
+        for name, uri in app.config.get('SHARD_URIS', {}).items():
+            if name == DEFAULT_SHARD:
+                raise ValueError(f"'{DEFAULT_SHARD}' is the primary database; pick another shard name")
+            engine = create_engine(uri, connect_args={'timeout': 30})
+            event.listen(engine, 'connect', _attach_primary(primary.url.database))
+            db.metadata.create_all(engine, tables=tables)
+            self.engines[name] = engine
+        self._pool = ThreadPoolExecutor(max_workers=len(self.engines) + 1, thread_name_prefix='shard')
+        self.enabled = True
+        app.extensions['shard_router'] = self
+        app.before_request(self.before_request)
+        app.register_error_handler(CompanyMoving, self.moving_response)
+        app.cli.add_command(shards_cli)
+        if not event.contains(db.session, 'before_flush', _allocate_ids):
+            event.listen(db.session, 'before_flush', _allocate_ids)
+        with app.app_context():
+            db.create_all()
+            self._adopt_existing()
+
+    def names(self):
+        return [DEFAULT_SHARD] + sorted(self.engines)
+
+    def engine(self, name):
+        return self.engines[name] if name != DEFAULT_SHARD else db.engine
+
+    # Company -> shard map
+
+    def _adopt_existing(self):
+        """Keep companies with tickets on the primary there, and start ids above the existing ones"""
+        from src.models.attachment import Attachment
+        from src.models.message import Message
+        from src.models.ticket import Ticket
+        from src.models.user import User
+
+        now = datetime.utcnow()
+        with db.engine.begin() as connection:
+            companies = connection.execute(
+                select(User.company_id).distinct().join(Ticket, Ticket.customer_id == User.id).where(
+                    User.company_id.isnot(None),
+                    User.company_id.notin_(select(CompanyShard.company_id)))
+            ).scalars().all()
+            if companies:
+                connection.execute(CompanyShard.__table__.insert(), [
+                    {'company_id': company_id, 'shard': DEFAULT_SHARD, 'moving': False, 'updated_at': now}
+                    for company_id in companies
+                ])
+            counters = ShardIdCounter.__table__
+            if connection.execute(select(counters.c.company_id).where(counters.c.company_id == 0)).first() is None:
+                last_id = max(connection.execute(
+                    select(func.coalesce(func.max(model.id), 0)).where(model.id < ID_SPAN)).scalar()
+                    for model in (Ticket, Message, Attachment))
+                connection.execute(counters.insert().values(company_id=0, last_id=last_id))
+
+    def _refresh_map(self):
+        with db.engine.connect() as connection:
+            rows = connection.execute(select(CompanyShard.company_id, CompanyShard.shard, CompanyShard.moving))
+            self._map = {company_id: (shard, moving) for company_id, shard, moving in rows}
+        self._map_loaded_at = time.monotonic()
+
+    def shard_of(self, company_id):
+        """(shard, moving) of a company, placing companies seen for the first time"""
+        if not company_id:
+            return DEFAULT_SHARD, False
+        with self._lock:
+            if self._map_loaded_at is None or time.monotonic() - self._map_loaded_at > self.map_ttl:
+                self._refresh_map()
+            entry = self._map.get(company_id)
+            if entry is None:
+                entry = self._place(company_id)
+        return entry
+
+    def _place(self, company_id):
+        from src.models.company import Company
+
+        try:
+            with db.engine.begin() as connection:
+                if connection.execute(select(Company.id).where(Company.id == company_id)).first() is None:
+                    # No such company, so none of its rows exist anywhere
+                    return DEFAULT_SHARD, False
+                counts = dict(connection.execute(
+                    select(CompanyShard.shard, func.count()).group_by(CompanyShard.shard)).all())
+                shard = min(self.engines, key=lambda name: (counts.get(name, 0), name)) \
+                    if self.engines else DEFAULT_SHARD
+                connection.execute(CompanyShard.__table__.insert().values(
+                    company_id=company_id, shard=shard, moving=False, updated_at=datetime.utcnow()))
+        except IntegrityError:
+            pass  # placed concurrently by another worker
+        self._refresh_map()
+        return self._map.get(company_id, (DEFAULT_SHARD, False))
+
+    def company_of(self, table, row_id):
+        """Company whose shard holds row ``row_id`` of ``table``; None for the default shard"""
+        if row_id >= ID_SPAN:
+            return row_id // ID_SPAN
+        company_id = self._legacy.get((table, row_id))
+        if company_id is None:
+            with db.engine.connect() as connection:
+                company_id = connection.execute(select(LegacyRowLocation.company_id).where(
+                    LegacyRowLocation.table_name == table, LegacyRowLocation.row_id == row_id)).scalar()
+            if company_id is not None:
+                self._legacy[(table, row_id)] = company_id
+        return company_id
+
+    # Request routing
+
+    def before_request(self):
+        from src.models.user import User
+
+        company_id = None
+        view_args = request.view_args or {}
+        for arg, table in LOCATING_ARGS:
+            if arg in view_args:
+                company_id = self.company_of(table, view_args[arg])
+                break
+        else:
+            user = db.session.get(User, session['user_id']) if 'user_id' in session else None
+            if user is not None and user.role == 'customer':
+                company_id = user.company_id
+        shard, moving = self.shard_of(company_id)
+        if moving:
+            return self.moving_response(None)
+        g.shard_name, g.shard_company, g.shard_engine = shard, company_id, self.engines.get(shard)
+
+    def moving_response(self, error):
+        response = jsonify({'error': 'This company is being moved to another database; retry shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(self.map_ttl + 1)
+        return response
+
+
+shard_router = ShardRouter()
+
+
+@contextmanager
+def use_shard(name, company_id=None):
+    """Route the statements inside the block to shard ``name``"""
+    saved = (g.get('shard_name'), g.get('shard_company'), g.get('shard_engine'))
+    g.shard_name, g.shard_company, g.shard_engine = name, company_id, shard_router.engines.get(name)
+    try:
+        yield
+    finally:
+        g.shard_name, g.shard_company, g.shard_engine = saved
+
+
+@contextmanager
+def use_company(company_id):
+    """Route the statements inside the block to the shard of ``company_id``"""
+    if not shard_router.enabled:
+        yield
+        return
+    shard, moving = shard_router.shard_of(company_id)
+    if moving:
+        raise CompanyMoving(f'Company {company_id} is being moved')
+    with use_shard(shard, company_id):
+        yield
+
+
+def each_shard():
+    """Make each shard the routing context in turn: ``for shard in each_shard(): ...``"""
+    if not shard_router.enabled:
+        yield DEFAULT_SHARD
+        return
+    for name in shard_router.names():
+        with use_shard(name):
+            yield name
+
+
+def fan_out(fn):
+    """[fn() for each shard], run in parallel threads; [fn()] when not sharded.
+
+    Each call gets its own app context and session, so ``fn`` must not
+    touch the request: read what it needs from the request beforehand.
+    """
+    if not shard_router.enabled:
+        return [fn()]
+    app = current_app._get_current_object()
+
+    def run(name):
+        with app.app_context(), use_shard(name):
+            try:
+                return fn()
+            finally:
+                db.session.remove()
+
+    return list(shard_router._pool.map(run, shard_router.names()))
+
+
+def by_shard(table, ids):
+    """Yield the part of ``ids`` (rows of ``table``) on each shard, with that shard as the routing context"""
+    if not shard_router.enabled:
+        yield list(ids)
+        return
+    groups = {}
+    for row_id in ids:
+        shard, _ = shard_router.shard_of(shard_router.company_of(table, row_id))
+        groups.setdefault(shard, []).append(row_id)
+    for name, subset in groups.items():
+        with use_shard(name):
+            yield subset
+
+
+def engines(company_id=None):
+    """Engines of every shard, or of the one holding ``company_id``"""
+    if not shard_router.enabled:
+        return [db.engine]
+    if company_id is not None:
+        return [shard_router.engine(shard_router.shard_of(company_id)[0])]
+    return [shard_router.engine(name) for name in shard_router.names()]
+
+
+# Ids
+
+def reserve_ids(db_session, company_id, count):
+    """First of ``count`` consecutive new ids for ``company_id``, reserved in the session's transaction"""
+    counters = ShardIdCounter.__table__
+    connection = db_session.connection()
+    where = counters.c.company_id == company_id
+    if connection.execute(counters.update().where(where).values(
+            last_id=counters.c.last_id + count)).rowcount == 0:
+        # The update above holds the write lock, so this cannot race
+        connection.execute(counters.insert().values(company_id=company_id, last_id=count))
+    last_id = connection.execute(select(counters.c.last_id).where(where)).scalar()
+    if last_id >= ID_SPAN:
+        raise RuntimeError(f'Company {company_id} has used up its id range')
+    return company_id * ID_SPAN + last_id - count + 1
+
+
+def _allocate_ids(db_session, flush_context, instances):
+    new = [obj for obj in db_session.new
+           if getattr(obj, '__tablename__', None) in ALLOCATED_TABLES and obj.id is None]
+    if not new:
+        return
+    first = reserve_ids(db_session, g.get('shard_company') or 0, len(new))
+    for offset, obj in enumerate(new):
+        obj.id = first + offset
+
+
+# Moving companies
+
+def _chunks(values, size=500):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _select_ids(connection, table, column, values):
+    """Ids of the rows of ``table`` whose ``column`` is in ``values``"""
+    return [row_id for chunk in _chunks(values) for row_id, in connection.execute(
+        select(table.c.id).where(column.in_(chunk)))]
+
+
+def move_company(company_id, target, wait=True, log=logger.info):
+    """Copy a company's rows to shard ``target``, switch it over, then delete the old copy.
+
+    The company's requests get a 503 while it moves: it is first marked
+    as moving and, with ``wait``, every worker is given ``SHARD_MAP_TTL``
+    to notice before copying starts. Copying replaces anything a failed
+    earlier attempt left on the target, so a failed move can be re-run.
+    """
+    from src.models.user import User
+    from src.services import rollups
+
+    if target not in shard_router.names():
+        raise ValueError(f'Unknown shard {target!r}')
+    shard_router._refresh_map()
+    source, _ = shard_router.shard_of(company_id)
+    if source == target:
+        raise ValueError(f'Company {company_id} is already on {target!r}')
+    source_engine, target_engine = shard_router.engine(source), shard_router.engine(target)
+    tables = {name: db.metadata.tables[name] for name in ALLOCATED_TABLES}
+    ticket, message, attachment = tables['ticket'], tables['message'], tables['attachment']
+    counters = ShardIdCounter.__table__
+    shard_map = CompanyShard.__table__
+
+    with db.engine.begin() as connection:
+        connection.execute(shard_map.update().where(shard_map.c.company_id == company_id).values(
+            moving=True, updated_at=datetime.utcnow()))
+        customers = connection.execute(select(User.id).where(User.company_id == company_id)).scalars().all()
+    if wait:
+        log(f'Waiting {shard_router.map_ttl + 1}s for workers to stop routing company {company_id}')
+        time.sleep(shard_router.map_ttl + 1)
+
+    with source_engine.connect() as connection:
+        low, high = company_id * ID_SPAN, (company_id + 1) * ID_SPAN
+        ticket_ids = connection.execute(select(ticket.c.id).where(
+            ticket.c.id >= low, ticket.c.id < high)).scalars().all()
+        # Rows from before sharding belong to the company of their customer
+        ticket_ids += [row_id for row_id in _select_ids(connection, ticket, ticket.c.customer_id, customers)
+                       if row_id < ID_SPAN]
+        ids = {'ticket': ticket_ids}
+        ids['message'] = _select_ids(connection, message, message.c.ticket_id, ids['ticket'])
+        ids['attachment'] = _select_ids(connection, attachment, attachment.c.message_id, ids['message'])
+        rows = {name: [dict(row) for chunk in _chunks(ids[name]) for row in connection.execute(
+            select(table).where(table.c.id.in_(chunk))).mappings()] for name, table in tables.items()}
+        counter = connection.execute(select(counters.c.last_id).where(
+            counters.c.company_id == company_id)).scalar()
+
+    with target_engine.begin() as connection:
+        for name in reversed(ALLOCATED_TABLES):
+            for chunk in _chunks(ids[name]):
+                connection.execute(tables[name].delete().where(tables[name].c.id.in_(chunk)))
+        for name in ALLOCATED_TABLES:
+            if rows[name]:
+                connection.execute(tables[name].insert(), rows[name])
+        connection.execute(counters.delete().where(counters.c.company_id == company_id))
+        if counter is not None:
+            connection.execute(counters.insert().values(company_id=company_id, last_id=counter))
+    log(f'Copied {len(ids["ticket"])} tickets, {len(ids["message"])} messages and '
+        f'{len(ids["attachment"])} attachments to {target!r}')
+
+    with db.engine.begin() as connection:
+        legacy = [{'table_name': name, 'row_id': row_id, 'company_id': company_id}
+                  for name in ALLOCATED_TABLES for row_id in ids[name] if row_id < ID_SPAN]
+        locations = LegacyRowLocation.__table__
+        connection.execute(locations.delete().where(locations.c.company_id == company_id))
+        if legacy:
+            connection.execute(locations.insert(), legacy)
+        connection.execute(shard_map.update().where(shard_map.c.company_id == company_id).values(
+            shard=target, moving=False, updated_at=datetime.utcnow()))
+    shard_router._refresh_map()
+
+    with source_engine.begin() as connection:
+        for name in reversed(ALLOCATED_TABLES):
+            for chunk in _chunks(ids[name]):
+                connection.execute(tables[name].delete().where(tables[name].c.id.in_(chunk)))
+        connection.execute(counters.delete().where(counters.c.company_id == company_id))
+    # Rollups are per shard sums, so both sides are recomputed
+    for name in (source, target):
+        with use_shard(name):
+            rollups.rebuild_shard()
+    return {name: len(ids[name]) for name in ALLOCATED_TABLES}
+
+
+shards_cli = AppGroup('shards', help='Inspect shards and move companies between them')
+
+
+@shards_cli.command('list')
+def list_command():
+    """Companies and tickets on each shard"""
+    from src.models.ticket import Ticket
+
+    shard_router._refresh_map()
+    companies = {}
+    for shard, _ in shard_router._map.values():
+        companies[shard] = companies.get(shard, 0) + 1
+    for name in each_shard():
+        click.echo(f'{name:20} {companies.get(name, 0):6d} companies {Ticket.query.count():9d} tickets')
+
+
+@shards_cli.command('move-company')
+@click.argument('company_id', type=int)
+@click.argument('target')
+@click.option('--no-wait', is_flag=True, help='Do not wait for other workers (only when none are running)')
+def move_company_command(company_id, target, no_wait):
+    """Move COMPANY_ID's tickets and messages to shard TARGET"""
+    try:
+        moved = move_company(company_id, target, wait=not no_wait, log=click.echo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Moved company {company_id} to {target!r}: {moved}')
@@ -0,0 +1,511 @@
+"""Knowledge base and similar-ticket suggestions for a ticket being written.
+
+Articles and tickets are kept as TF-IDF vectors in two ``VectorIndex``
+instances. Each term owns a pair of NumPy arrays (row ids and weights), so
+scoring a query is a handful of array concatenations and one
+``np.bincount`` over the rows, with no per-document Python work. Document
+weights are ``(1 + log tf) / sqrt(distinct terms)``; idf comes from the
+live document frequencies at query time, so adding a document never
+rewrites the others.
+
+The index follows committed writes through session events, like the search
+index, and is saved to ``SUGGEST_INDEX_PATH`` (at exit and with
+``flask suggestions save``). On start a worker loads the snapshot and
+reads only what changed since it was taken, instead of re-tokenizing every
+ticket.
+"""
+import atexit
+import math
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+import click
+import numpy as np
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect
+
+from src.extensions import db
+from src.services.routing import primary
+from src.services.search import TITLE_WEIGHT, tokenize
+from src.services.sharding import each_shard
+
+FORMAT_VERSION = 1
+
+
+def term_weights(title, body):
+    """{term: weight} for one document; titles count TITLE_WEIGHT times"""
+    counts = Counter()
+    for token in tokenize(title):
+        counts[token] += TITLE_WEIGHT
+    for token in tokenize(body):
+        counts[token] += 1
+    if not counts:
+        return {}
+    norm = math.sqrt(len(counts))
+    return {term: (1.0 + math.log(count)) / norm for term, count in counts.items()}
+
+
+class VectorIndex:
+    """TF-IDF vectors of one kind of document.
+
+    Rows are append-only: updating a document tombstones its row and adds
+    a new one, and queries mask dead rows out. Once more than a quarter of
+    the rows are dead the index is compacted.
+    """
+
+    # Terms in more than this share of documents are skipped at query time:
+    # their postings are the longest and their idf is close to zero
+    max_df_ratio = 0.5
+    max_df_min_docs = 1000
+
+    def __init__(self):
+        self.vocab = {}
+        self.df = np.zeros(0, dtype=np.int64)
+        self._postings = []     # term id -> [row ids, weights, used length]
+        self.doc_ids = np.zeros(0, dtype=np.int64)
+        self.owners = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.row_terms = []     # row -> (term ids, weights), None once dead
+        self.row_of = {}        # doc id -> row
+        self.n_rows = 0
+
+    def __len__(self):
+        return len(self.row_of)
+
+    # Indexing
+
+    def _term_id(self, term):
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            term_id = self.vocab[term] = len(self._postings)
+            self._postings.append([np.zeros(4, dtype=np.int32), np.zeros(4, dtype=np.float32), 0])
+            if term_id >= len(self.df):
+                self.df = np.concatenate([self.df, np.zeros(max(len(self.df), 64), dtype=np.int64)])
+        return term_id
+
+    def _reserve_row(self):
+        if self.n_rows == len(self.doc_ids):
+            extra = max(len(self.doc_ids), 64)
+            self.doc_ids = np.concatenate([self.doc_ids, np.zeros(extra, dtype=np.int64)])
+            self.owners = np.concatenate([self.owners, np.zeros(extra, dtype=np.int64)])
+            self.alive = np.concatenate([self.alive, np.zeros(extra, dtype=bool)])
+        self.n_rows += 1
+        return self.n_rows - 1
+
+    def add(self, doc_id, owner, weights):
+        """Index ``weights`` ({term: weight}) as the current version of ``doc_id``"""
+        self.remove(doc_id)
+        if not weights:
+            return
+        row = self._reserve_row()
+        self.doc_ids[row] = doc_id
+        self.owners[row] = owner or 0
+        self.alive[row] = True
+        self.row_of[doc_id] = row
+        term_ids = np.fromiter((self._term_id(term) for term in weights), dtype=np.int32, count=len(weights))
+        values = np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+        for term_id, weight in zip(term_ids.tolist(), values.tolist()):
+            posting = self._postings[term_id]
+            rows, row_weights, used = posting
+            if used == len(rows):
+                extra = max(used, 4)
+                posting[0] = rows = np.concatenate([rows, np.zeros(extra, dtype=np.int32)])
+                posting[1] = row_weights = np.concatenate([row_weights, np.zeros(extra, dtype=np.float32)])
+            rows[used] = row
+            row_weights[used] = weight
+            posting[2] = used + 1
+        self.df[term_ids] += 1
+        self.row_terms.append((term_ids, values))
+
+    def remove(self, doc_id):
+        row = self.row_of.pop(doc_id, None)
+        if row is None:
+            return
+        self.alive[row] = False
+        self.df[self.row_terms[row][0]] -= 1
+        self.row_terms[row] = None
+        dead = self.n_rows - len(self.row_of)
+        if dead > 1000 and dead * 4 > self.n_rows:
+            self.compact()
+
+    def prune(self, keep_ids):
+        """Remove every document whose id is not in ``keep_ids``"""
+        for doc_id in set(self.row_of) - set(keep_ids):
+            self.remove(doc_id)
+
+    def compact(self):
+        self.load(self.to_arrays())
+
+    # Bulk loading and saving, as CSR arrays over the live rows
+
+    def to_arrays(self):
+        rows = sorted(self.row_of.values())
+        parts = [self.row_terms[row] for row in rows]
+        lengths = np.fromiter((len(term_ids) for term_ids, _ in parts), dtype=np.int64, count=len(parts))
+        offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        term_ids = np.concatenate([p[0] for p in parts]) if parts else np.zeros(0, dtype=np.int32)
+        weights = np.concatenate([p[1] for p in parts]) if parts else np.zeros(0, dtype=np.float32)
+        # Renumber terms, dropping those no live document uses any more
+        used = self.df[:len(self.vocab)] > 0
+        new_ids = (np.cumsum(used) - 1).astype(np.int32)
+        return {
+            'doc_ids': self.doc_ids[rows],
+            'owners': self.owners[rows],
+            'offsets': offsets,
+            'term_ids': new_ids[term_ids],
+            'weights': weights,
+            'vocab': [term for term, keep in zip(self.vocab, used.tolist()) if keep],
+        }
+
+    def load(self, arrays):
+        """Replace the contents with CSR arrays from ``to_arrays`` (or a snapshot)"""
+        vocab = list(arrays['vocab'])
+        doc_ids = np.asarray(arrays['doc_ids'], dtype=np.int64)
+        offsets = np.asarray(arrays['offsets'], dtype=np.int64)
+        term_ids = np.asarray(arrays['term_ids'], dtype=np.int32)
+        weights = np.asarray(arrays['weights'], dtype=np.float32)
+        n_docs, n_terms = len(doc_ids), len(vocab)
+
+        self.vocab = {term: term_id for term_id, term in enumerate(vocab)}
+        self.doc_ids = doc_ids.copy()
+        self.owners = np.asarray(arrays['owners'], dtype=np.int64).copy()
+        self.alive = np.ones(n_docs, dtype=bool)
+        self.row_of = dict(zip(doc_ids.tolist(), range(n_docs)))
+        self.n_rows = n_docs
+        self.row_terms = [(term_ids[start:end], weights[start:end])
+                          for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+        # Transpose to postings: group (row, weight) pairs by term
+        rows = np.repeat(np.arange(n_docs, dtype=np.int32), np.diff(offsets))
+        order = np.argsort(term_ids, kind='stable')
+        counts = np.bincount(term_ids, minlength=n_terms)
+        bounds = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(counts, out=bounds[1:])
+        sorted_rows, sorted_weights = rows[order], weights[order]
+        self.df = counts.astype(np.int64)
+        self._postings = [[sorted_rows[start:end], sorted_weights[start:end], end - start]
+                          for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist())]
+
+    def build(self, documents):
+        """Replace the contents with (doc_id, owner, {term: weight}) documents"""
+        vocab = {}
+        doc_ids, owners, lengths, term_ids, weights = [], [], [], [], []
+        for doc_id, owner, document in documents:
+            if not document:
+                continue
+            doc_ids.append(doc_id)
+            owners.append(owner or 0)
+            lengths.append(len(document))
+            for term, weight in document.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                weights.append(weight)
+        offsets = np.zeros(len(doc_ids) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        self.load({
+            'doc_ids': doc_ids, 'owners': owners, 'offsets': offsets,
+            'term_ids': term_ids, 'weights': weights, 'vocab': list(vocab),
+        })
+
+    # Querying
+
+    def search(self, query, limit=10, owner=None):
+        """Top [(doc_id, score), ...] for a {term: weight} query.
+
+        Scores are TF-IDF dot products divided by the query's norm, so
+        they compare documents for one query, not across queries. With
+        ``owner``, only that owner's documents are ranked.
+        """
+        count = len(self.row_of)
+        if not query or not count:
+            return []
+        max_df = self.max_df_ratio * count if count >= self.max_df_min_docs else count
+        row_parts, weight_parts, norm = [], [], 0.0
+        for term, weight in query.items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            df = self.df[term_id]
+            if df == 0 or df > max_df:
+                continue
+            idf = math.log(1.0 + count / df)
+            rows, row_weights, used = self._postings[term_id]
+            row_parts.append(rows[:used])
+            weight_parts.append(row_weights[:used] * np.float32(weight * idf * idf))
+            norm += (weight * idf) ** 2
+        if not row_parts:
+            return []
+
+        rows = np.concatenate(row_parts)
+        scores = np.bincount(rows, weights=np.concatenate(weight_parts), minlength=self.n_rows)
+        valid = self.alive[:self.n_rows]
+        if owner is not None:
+            valid = valid & (self.owners[:self.n_rows] == owner)
+        candidates = np.flatnonzero(valid & (scores > 0))
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(scores[candidates], -limit)[-limit:]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        norm = math.sqrt(norm)
+        return [(int(self.doc_ids[row]), float(scores[row]) / norm) for row in candidates]
+
+
+class SuggestionIndex:
+    """Articles and tickets, shared by all requests of one process"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self.articles = VectorIndex()
+        self.tickets = VectorIndex()
+        self.path = None
+        self.synced_at = None   # database time the index is known to be current as of
+        self._loaded_at = None
+
+    def init_app(self, app):
+        self.path = app.config.get('SUGGEST_INDEX_PATH')
+        app.cli.add_command(suggestions_cli)
+        if self.path:
+            atexit.register(self.save_if_loaded)
+        if event.contains(db.session, 'after_flush', _collect_changes):
+            return
+        event.listen(db.session, 'after_flush', _collect_changes)
+        event.listen(db.session, 'after_commit', _apply_changes)
+        event.listen(db.session, 'after_rollback', _discard_changes)
+
+    # Indexing
+
+    def add_article(self, article_id, title, content):
+        with self._lock:
+            self.articles.add(article_id, 0, term_weights(title, content))
+
+    def add_ticket(self, ticket_id, customer_id, title, description):
+        with self._lock:
+            self.tickets.add(ticket_id, customer_id, term_weights(title, description))
+
+    def remove_article(self, article_id):
+        with self._lock:
+            self.articles.remove(article_id)
+
+    def remove_ticket(self, ticket_id):
+        with self._lock:
+            self.tickets.remove(ticket_id)
+
+    def rebuild(self, chunk_size=1000):
+        """Reload both indexes from the database"""
+        from src.models.knowledge_base import KnowledgeBaseArticle
+        from src.models.ticket import Ticket
+
+        with self._lock, primary():
+            synced_at = datetime.utcnow()
+            articles = db.session.query(
+                KnowledgeBaseArticle.id, KnowledgeBaseArticle.title, KnowledgeBaseArticle.content
+            ).execution_options(yield_per=chunk_size)
+            self.articles.build((article_id, 0, term_weights(title, content))
+                                for article_id, title, content in articles)
+
+            def tickets():
+                for _ in each_shard():
+                    yield from db.session.query(
+                        Ticket.id, Ticket.customer_id, Ticket.title, Ticket.description
+                    ).execution_options(yield_per=chunk_size)
+
+            self.tickets.build((ticket_id, customer_id, term_weights(title, description))
+                               for ticket_id, customer_id, title, description in tickets())
+            self.synced_at = synced_at
+            self._loaded_at = time.monotonic()
+
+    def catch_up(self, chunk_size=1000):
+        """Apply what changed in the database since ``synced_at``.
+
+        Picks up writes made by other workers and those missing from a
+        snapshot. Ticket text is never edited, so only new tickets are
+        read; articles are re-read by ``updated_at``. Deletions are found
+        by comparing ids. The database is read and the text tokenized
+        without holding the lock; only applying the result takes it.
+        """
+        from src.models.knowledge_base import KnowledgeBaseArticle
+        from src.models.ticket import Ticket
+
+        with self._lock:
+            since = self.synced_at
+            last_id = int(self.tickets.doc_ids[:self.tickets.n_rows].max(initial=0))
+            # Only documents indexed before reading can be found deleted; ones
+            # added meanwhile by commits may be missing from the id lists below
+            known_articles, known_tickets = set(self.articles.row_of), set(self.tickets.row_of)
+
+        with primary():
+            synced_at = datetime.utcnow()
+            articles = [(article_id, term_weights(title, content)) for article_id, title, content in
+                        db.session.query(
+                            KnowledgeBaseArticle.id, KnowledgeBaseArticle.title, KnowledgeBaseArticle.content
+                        ).filter(KnowledgeBaseArticle.updated_at >= since)]
+            article_ids = {article_id for article_id, in db.session.query(KnowledgeBaseArticle.id)}
+            tickets = []
+            ticket_ids = set()
+            for _ in each_shard():
+                rows = db.session.query(
+                    Ticket.id, Ticket.customer_id, Ticket.title, Ticket.description
+                ).filter(db.or_(Ticket.id > last_id, Ticket.created_at >= since)
+                         ).execution_options(yield_per=chunk_size)
+                tickets += [(ticket_id, customer_id, term_weights(title, description))
+                            for ticket_id, customer_id, title, description in rows]
+                ticket_ids.update(ticket_id for ticket_id, in db.session.query(Ticket.id))
+
+        with self._lock:
+            for article_id, weights in articles:
+                self.articles.add(article_id, 0, weights)
+            for article_id in known_articles - article_ids:
+                self.articles.remove(article_id)
+            for ticket_id, customer_id, weights in tickets:
+                self.tickets.add(ticket_id, customer_id, weights)
+            for ticket_id in known_tickets - ticket_ids:
+                self.tickets.remove(ticket_id)
+            self.synced_at = synced_at
+            self._loaded_at = time.monotonic()
+
+    def ensure_loaded(self, max_age=None):
+        """Load the index on first use; afterwards catch up every ``max_age`` seconds.
+
+        Requests wait for the first load. A catch-up runs in one request
+        while the others keep using the current index.
+        """
+        if self._loaded_at is not None:
+            if max_age and time.monotonic() - self._loaded_at > max_age \
+                    and self._sync_lock.acquire(blocking=False):
+                try:
+                    if time.monotonic() - self._loaded_at > max_age:
+                        self.catch_up()
+                finally:
+                    self._sync_lock.release()
+            return
+        with self._lock:
+            if self._loaded_at is not None:
+                return
+            if self.path and os.path.exists(self.path):
+                try:
+                    self.load(self.path)
+                    self.catch_up()
+                    return
+                except (OSError, KeyError, ValueError):
+                    pass
+            self.rebuild()
+            if self.path:
+                self.save(self.path)
+
+    # Snapshots
+
+    def save(self, path=None):
+        """Write both indexes to ``path`` atomically"""
+        path = path or self.path
+        with self._lock:
+            snapshot = {'format': np.array(FORMAT_VERSION),
+                        'synced_at': np.array(self.synced_at.isoformat())}
+            for name, index in (('articles', self.articles), ('tickets', self.tickets)):
+                arrays = index.to_arrays()
+                # Tokens never contain newlines; one byte string keeps the file compact
+                arrays['vocab'] = np.frombuffer('\n'.join(arrays['vocab']).encode(), dtype=np.uint8)
+                snapshot.update({f'{name}_{key}': value for key, value in arrays.items()})
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            np.savez(f, **snapshot)
+        os.replace(temporary, path)
+
+    def load(self, path=None):
+        with np.load(path or self.path, allow_pickle=False) as snapshot, self._lock:
+            if int(snapshot['format']) != FORMAT_VERSION:
+                raise ValueError('Unsupported suggestion index format')
+            for name, index in (('articles', self.articles), ('tickets', self.tickets)):
+                arrays = {key: snapshot[f'{name}_{key}']
+                          for key in ('doc_ids', 'owners', 'offsets', 'term_ids', 'weights')}
+                vocab = snapshot[f'{name}_vocab'].tobytes().decode()
+                arrays['vocab'] = vocab.split('\n') if vocab else []
+                index.load(arrays)
+            self.synced_at = datetime.fromisoformat(str(snapshot['synced_at']))
+            self._loaded_at = time.monotonic()
+
+    def save_if_loaded(self):
+        if self._loaded_at is not None and self.path:
+            try:
+                self.save(self.path)
+            except OSError:
+                pass
+
+    # Querying
+
+    def suggest(self, title, description, limit=5, customer_id=None):
+        """([(article_id, score)], [(ticket_id, score)]) most similar to the draft.
+
+        ``customer_id`` restricts tickets to that customer's own.
+        """
+        query = term_weights(title, description)
+        with self._lock:
+            return (self.articles.search(query, limit),
+                    self.tickets.search(query, limit, owner=customer_id))
+
+
+suggestions = SuggestionIndex()
+
+
+def _collect_changes(session, flush_context):
+    from src.models.knowledge_base import KnowledgeBaseArticle
+    from src.models.ticket import Ticket
+
+    pending = session.info.setdefault('suggest_changes', [])
+    for obj in session.new:
+        if isinstance(obj, Ticket):
+            pending.append(('ticket', obj.id, obj.customer_id, obj.title, obj.description))
+        elif isinstance(obj, KnowledgeBaseArticle):
+            pending.append(('article', obj.id, obj.title, obj.content))
+    for obj in session.dirty:
+        if isinstance(obj, KnowledgeBaseArticle):
+            attrs = inspect(obj).attrs
+            if attrs.title.history.has_changes() or attrs.content.history.has_changes():
+                pending.append(('article', obj.id, obj.title, obj.content))
+    for obj in session.deleted:
+        if isinstance(obj, Ticket):
+            pending.append(('remove_ticket', obj.id))
+        elif isinstance(obj, KnowledgeBaseArticle):
+            pending.append(('remove_article', obj.id))
+
+
+def _apply_changes(session):
+    changes = session.info.pop('suggest_changes', None)
+    if not changes or suggestions._loaded_at is None:
+        return
+    for change in changes:
+        kind, args = change[0], change[1:]
+        if kind == 'ticket':
+            suggestions.add_ticket(*args)
+        elif kind == 'article':
+            suggestions.add_article(*args)
+        elif kind == 'remove_ticket':
+            suggestions.remove_ticket(*args)
+        else:
+            suggestions.remove_article(*args)
+
+
+def _discard_changes(session):
+    session.info.pop('suggest_changes', None)
+
+
+suggestions_cli = AppGroup('suggestions', help='Maintain the ticket suggestion index')
+
+
+@suggestions_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the index from the database and save it"""
+    suggestions.rebuild()
+    suggestions.save()
+    click.echo(f'Indexed {len(suggestions.articles)} articles and {len(suggestions.tickets)} tickets')
+
+
+@suggestions_cli.command('save')
+def save_command():
+    """Bring the saved index up to date with the database"""
+    suggestions.ensure_loaded()
+    suggestions.save()
+    click.echo(f'Saved {len(suggestions.articles)} articles and {len(suggestions.tickets)} tickets')
@@ -0,0 +1,108 @@
+"""Conditional ticket state changes.
+
+A transition is one ``UPDATE ticket ... WHERE id = ? AND version = ? AND
+status_id = ?``: if another request changed the ticket since it was read,
+no row matches and the caller gets a conflict instead of overwriting it.
+All reads (permissions, agent choice, status ids) happen before the
+UPDATE, so on SQLite the write lock is only held from the UPDATE to the
+commit.
+
+Core UPDATEs bypass the ORM flush, so the rollup and search index hooks
+are fed here explicitly; callers still update the assignment engine.
+The rollup statements are built before the UPDATE, leaving only their
+execution inside the locked window.
+"""
+from datetime import datetime
+
+from flask import jsonify
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import StaleDataError
+
+from src.extensions import db
+from src.services import rollups, search
+from src.services.sharding import each_shard
+
+
+class TransitionConflict(Exception):
+    """The ticket changed since it was read, or the status change is not allowed"""
+
+
+def transition(ticket, status_name=None, expected_version=None, **values):
+    """Conditionally update ``ticket`` and move it to ``status_name``.
+
+    ``expected_version`` is the version the client last saw, if it sent
+    one. ``values`` are other columns to set. Entering Closed sets
+    ``closed_at`` and leaving it clears it. Flushes but does not commit;
+    on conflict nothing has been written and TransitionConflict is raised.
+    """
+    from src.models.status import Status
+    from src.models.ticket import Ticket
+
+    if expected_version is not None and expected_version != ticket.version:
+        raise TransitionConflict('Ticket was modified by someone else; reload and try again')
+    if status_name is not None:
+        current = Status.get_name(ticket.status_id)
+        if not Status.can_transition(current, status_name):
+            raise TransitionConflict(f'Cannot change status from {current} to {status_name}')
+        values['status_id'] = Status.get_id(status_name)
+        # closed_at is what rollups and resolution stats count as closed
+        if status_name == 'Closed' and current != 'Closed':
+            values.setdefault('closed_at', datetime.utcnow())
+        elif current == 'Closed' and status_name != 'Closed':
+            values['closed_at'] = None
+    values['updated_at'] = datetime.utcnow()
+    values['version'] = ticket.version + 1
+
+    # Work out the rollup change now; only its statements run under the write lock
+    before = rollups.ticket_snapshot(ticket)
+    after = tuple(values.get(name, value) for name, value in zip(rollups.SNAPSHOT_FIELDS, before))
+    rollup_delta = rollups.delta_statements(before, after) if after != before else []
+
+    table = Ticket.__table__
+    result = db.session.execute(table.update().where(
+        table.c.id == ticket.id,
+        table.c.version == ticket.version,
+        table.c.status_id == ticket.status_id,
+    ).values(**values))
+    if result.rowcount != 1:
+        raise TransitionConflict('Ticket was modified by someone else; reload and try again')
+    rollups.execute_delta(db.session.connection(), rollup_delta)
+
+    # Bring the loaded ticket up to date without marking it dirty
+    for name, value in values.items():
+        set_committed_value(ticket, name, value)
+    db.session.expire(ticket, ['status', 'agent'])
+    if 'agent_id' in values:
+        search.note_agent_change(db.session, ticket.id, values['agent_id'])
+    return ticket
+
+
+def clear_reopened(batch_size=500):
+    """Clear closed_at left on tickets reopened before transitions cleared it.
+
+    Goes through the ORM, so the rollups drop these tickets' closes in the
+    same commit.
+    """
+    from src.models.status import Status
+    from src.models.ticket import Ticket
+
+    closed_id = Status.get_id('Closed')
+    for _ in each_shard():
+        while True:
+            tickets = Ticket.query.filter(Ticket.closed_at.isnot(None),
+                                          Ticket.status_id != closed_id).limit(batch_size).all()
+            if not tickets:
+                break
+            for ticket in tickets:
+                ticket.closed_at = None
+            db.session.commit()
+
+
+def _stale_ticket(error):
+    db.session.rollback()
+    return jsonify({'error': 'Ticket was modified by someone else; reload and try again'}), 409
+
+
+def init_app(app):
+    # ORM flushes of a ticket deleted underneath them
+    app.register_error_handler(StaleDataError, _stale_ticket)
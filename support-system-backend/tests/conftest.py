@@ -0,0 +1,80 @@
+import itertools
+import os
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep the test databases and attachments out of src/database
+os.environ['SUPPORT_DATA_DIR'] = tempfile.mkdtemp(prefix='support-tests-')
+
+from src.extensions import db  # noqa: E402
+from src.main import app as support_app  # noqa: E402
+from src.models.company import Company  # noqa: E402
+from src.models.user import User  # noqa: E402
+from src.services.ratelimit import limiter  # noqa: E402
+
+_names = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def app():
+    support_app.config['TESTING'] = True
+    limiter.enabled = False
+    return support_app
+
+
+@pytest.fixture
+def make_user(app):
+    """Create a user with a unique username (password ``secret``); customers get their own company"""
+    def make(role):
+        username = f'test_{role}{next(_names)}'
+        with app.app_context():
+            user = User(username=username, email=f'{username}@example.com', role=role)
+            if role == 'customer':
+                user.company = Company(name=f'{username} company')
+            user.set_password('secret')
+            db.session.add(user)
+            db.session.commit()
+            return user.id, username
+    return make
+
+
+@pytest.fixture
+def login(app):
+    """A test client logged in as ``username``"""
+    def log_in(username, password='secret'):
+        client = app.test_client()
+        response = client.post('/api/login', json={'username': username, 'password': password})
+        assert response.status_code == 200, response.get_json()
+        return client
+    return log_in
+
+
+@contextmanager
+def _recorded(engine):
+    statements = []
+    thread = threading.get_ident()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread:
+            statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+@pytest.fixture
+def sql():
+    """``with sql(engine) as statements:`` records the SQL this thread runs on ``engine``
+
+    Background threads (SLA scanner, index catch-up) are left out.
+    """
+    return _recorded
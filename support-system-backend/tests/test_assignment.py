@@ -0,0 +1,81 @@
+from src.extensions import db
+from src.models.user import User
+from src.services.assignment import PRIORITY_WEIGHTS, AssignmentEngine, assignment_engine
+
+
+def rebuilt_loads():
+    engine = AssignmentEngine()
+    engine.rebuild()
+    return engine.loads()
+
+
+def test_reserve_picks_least_loaded_then_rotates():
+    engine = AssignmentEngine()
+    engine.load([(1, 'High', 10, 1), (2, 'Low', 10, 1), (3, None, None, 0)])
+
+    assert engine.reserve('Medium') == 3
+    assert engine.reserve('Low') == 2
+    # Agents 2 and 3 are now tied at 2; the one assigned longest ago goes next
+    assert engine.reserve('Low') == 3
+    assert engine.reserve('Low', exclude={2}) == 3
+    assert engine.loads() == {1: 4, 2: 2, 3: 4}
+
+
+def test_reserve_prefers_agents_of_the_same_company_within_slack():
+    engine = AssignmentEngine(affinity_slack=2)
+    engine.load([(1, 'Medium', 10, 2), (2, None, None, 0)])
+
+    assert engine.reserve('Low', company_id=10) == 1
+    assert engine.reserve('Low', company_id=10, affinity=False) == 2
+    engine.add(1, 'Critical', 10)
+    assert engine.reserve('Low', company_id=10) == 2
+
+
+def test_update_follows_status_and_priority_changes():
+    engine = AssignmentEngine()
+    engine.load([(1, None, None, 0)])
+
+    engine.update((None, 'Low', 10, True), (1, 'Low', 10, True))
+    engine.update((1, 'Low', 10, True), (1, 'Critical', 10, True))
+    assert engine.loads() == {1: PRIORITY_WEIGHTS['Critical']}
+    engine.update((1, 'Critical', 10, True), (1, 'Critical', 10, False))
+    assert engine.loads() == {1: 0}
+
+
+def test_moderation_assigns_least_loaded_agent(app, make_user, login):
+    customer_id, customer = make_user('customer')
+    make_user('agent')
+    customer_client, admin = login(customer), login('admin', 'admin123')
+    with app.app_context():
+        company_id = db.session.get(User, customer_id).company_id
+        assignment_engine.rebuild()
+    before = {row['agent_id']: row['load'] for row in admin.get('/api/tickets/assignment/load').get_json()}
+
+    ticket_id = customer_client.post('/api/tickets', json={'title': 'Scanner', 'description': 'Jams',
+                                                           'priority': 'High'}).get_json()['id']
+    ticket = admin.put(f'/api/tickets/{ticket_id}/status', json={'status': 'Open'}).get_json()
+
+    agent_id = ticket['agent_id']
+    assert ticket['status']['name'] == 'In Progress'
+    assert before[agent_id] == min(before.values())
+    with app.app_context():
+        assert assignment_engine.loads()[agent_id] == before[agent_id] + PRIORITY_WEIGHTS['High']
+        assert assignment_engine.loads() == rebuilt_loads()
+        # The next ticket of the same company stays with the agent while within slack
+        assert assignment_engine.pick(company_id) == agent_id
+
+    assert admin.put(f'/api/tickets/{ticket_id}/status', json={'status': 'Closed'}).status_code == 200
+    with app.app_context():
+        assert assignment_engine.loads()[agent_id] == before[agent_id]
+        assert assignment_engine.loads() == rebuilt_loads()
+
+
+def test_auto_assign_refuses_assigned_tickets(app, make_user, login):
+    _, customer = make_user('customer')
+    agent_id, _ = make_user('agent')
+    admin = login('admin', 'admin123')
+    ticket_id = login(customer).post('/api/tickets', json={'title': 'Mouse',
+                                                           'description': 'Sticky'}).get_json()['id']
+    assert admin.put(f'/api/tickets/{ticket_id}/assign', json={'agent_id': agent_id}).status_code == 200
+
+    assert admin.post(f'/api/tickets/{ticket_id}/auto-assign').status_code == 400
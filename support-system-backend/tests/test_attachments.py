@@ -0,0 +1,95 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+
+from src.services.attachments import blob_store
+
+
+@pytest.fixture
+def message(make_user, login):
+    """The customer's client and the attachments URL of their message"""
+    _, customer = make_user('customer')
+    client = login(customer)
+    ticket_id = client.post('/api/tickets', json={'title': 'Logs', 'description': 'Attached'}).get_json()['id']
+    message_id = client.post(f'/api/tickets/{ticket_id}/messages', json={'content': 'See log'}).get_json()['id']
+    return client, f'/api/messages/{message_id}/attachments'
+
+
+def blob_files(app):
+    return [name for _, _, names in os.walk(app.config['ATTACHMENT_DIR']) for name in names]
+
+
+def test_identical_uploads_share_one_blob(app, message):
+    client, url = message
+    data = b'dedupe me\n' * 1000
+    files_before = len(blob_files(app))
+
+    first = client.post(url + '?filename=server.log', data=data, content_type='text/plain')
+    second = client.post(url + '?filename=copy.log', data=data, content_type='text/plain')
+
+    assert (first.status_code, second.status_code) == (201, 201)
+    assert first.get_json()['sha256'] == second.get_json()['sha256'] == hashlib.sha256(data).hexdigest()
+    assert first.get_json()['id'] != second.get_json()['id']
+    assert len(blob_files(app)) == files_before + 1
+
+
+def test_dedupe_refreshes_and_restores_blob(app):
+    data = b'kept alive by reuse'
+    with app.app_context():
+        sha256, _ = blob_store.store(io.BytesIO(data), 100)
+        path = blob_store.path(sha256)
+        old = time.time() - 7200
+        os.utime(path, (old, old))
+
+        blob_store.store(io.BytesIO(data), 100)
+        assert os.path.getmtime(path) > time.time() - 60
+        # Not yet referenced, but stored moments ago, so garbage collection keeps it
+        blob_store.collect_garbage(3600)
+        assert os.path.exists(path)
+
+        os.unlink(path)
+        blob_store.store(io.BytesIO(data), 100)
+        with open(path, 'rb') as stored:
+            assert stored.read() == data
+
+
+def test_download_supports_range_and_etag(message):
+    client, url = message
+    data = bytes(range(256)) * 40
+    attachment = client.post(url + '?filename=dump.bin', data=data,
+                             content_type='application/octet-stream').get_json()
+    download = f"/api/attachments/{attachment['id']}"
+
+    full = client.get(download)
+    assert full.status_code == 200
+    assert full.data == data
+    assert full.headers['ETag'] == f'"{attachment["sha256"]}"'
+    assert 'private' in full.headers['Cache-Control']
+
+    partial = client.get(download, headers={'Range': 'bytes=100-199'})
+    assert partial.status_code == 206
+    assert partial.data == data[100:200]
+    assert partial.headers['Content-Range'] == f'bytes 100-199/{len(data)}'
+
+    cached = client.get(download, headers={'If-None-Match': full.headers['ETag']})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+
+def test_upload_limits_and_access(app, make_user, login, message):
+    client, url = message
+    _, other = make_user('customer')
+
+    assert login(other).post(url + '?filename=x.txt', data=b'x').status_code == 403
+    assert client.post(url, data=b'no name').status_code == 400
+    max_size = app.config['ATTACHMENT_MAX_SIZE']
+    try:
+        app.config['ATTACHMENT_MAX_SIZE'] = 10
+        assert client.post(url + '?filename=big.txt', data=b'x' * 11).status_code == 413
+    finally:
+        app.config['ATTACHMENT_MAX_SIZE'] = max_size
+    attachment = client.post(url + '?filename=ok.txt', data=b'fine').get_json()
+    assert login(other).get(f"/api/attachments/{attachment['id']}").status_code == 403
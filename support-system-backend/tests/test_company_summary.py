@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.extensions import db
+from src.models.ticket import Ticket
+from src.models.user import User
+from src.services.company_summary import summary_cache
+from src.services.routing import read_router
+
+
+@pytest.fixture
+def company(app, make_user, login):
+    """A company with two customers, two closed tickets (1h and 3h to close) and one open ticket"""
+    first_id, first = make_user('customer')
+    second_id, second = make_user('customer')
+    with app.app_context():
+        company_id = db.session.get(User, first_id).company_id
+        db.session.get(User, second_id).company_id = company_id
+        db.session.commit()
+
+    admin = login('admin', 'admin123')
+    created = datetime(2026, 1, 5, 9, 0)
+    for username, hours in ((first, 1), (first, 3), (second, None)):
+        ticket_id = login(username).post('/api/tickets', json={'title': 'Monitor',
+                                                               'description': 'Blank'}).get_json()['id']
+        if hours:
+            assert admin.put(f'/api/tickets/{ticket_id}/status', json={'status': 'Closed'}).status_code == 200
+        with app.app_context():
+            # Through the ORM, so the analytics rollups follow the change
+            ticket = db.session.get(Ticket, ticket_id)
+            ticket.created_at = created
+            ticket.closed_at = created + timedelta(hours=hours) if hours else None
+            db.session.commit()
+    summary_cache.clear()
+    return admin, company_id
+
+
+def test_summary_aggregates_tickets_of_all_customers(company):
+    admin, company_id = company
+
+    summary = admin.get(f'/api/companies/{company_id}/summary').get_json()
+
+    assert summary['customers'] == 2
+    assert summary['tickets'] == 3
+    assert summary['open_tickets'] == 1
+    assert summary['tickets_by_status']['Closed'] == 2
+    assert summary['tickets_by_status']['Pending Moderation'] == 1
+    assert summary['resolution_time'] == {'count': 2, 'avg_seconds': 7200.0,
+                                          'min_seconds': 3600.0, 'max_seconds': 10800.0}
+
+    items = admin.get('/api/companies/summary', query_string={'per_page': 100}).get_json()['items']
+    assert next(item for item in items if item['id'] == company_id) == summary
+
+
+def test_summary_is_one_query_and_cached(app, sql, company):
+    admin, company_id = company
+
+    with app.app_context():
+        recording = sql(read_router.engine)
+    with recording as statements:
+        first = admin.get(f'/api/companies/{company_id}/summary').get_json()
+        second = admin.get(f'/api/companies/{company_id}/summary').get_json()
+
+    assert first == second
+    assert len([statement for statement in statements if 'ticket' in statement]) == 1
+
+
+def test_summary_pages_and_access(company, make_user, login):
+    admin, _ = company
+    _, customer = make_user('customer')
+
+    page = admin.get('/api/companies/summary', query_string={'page': 2, 'per_page': 1}).get_json()
+    assert (len(page['items']), page['page'], page['per_page']) == (1, 2, 1)
+    assert page['total'] == len(admin.get('/api/companies/').get_json())
+    assert admin.get('/api/companies/999999/summary').status_code == 404
+    assert login(customer).get('/api/companies/summary').status_code == 403
@@ -0,0 +1,66 @@
+import gzip
+import zlib
+
+import pytest
+
+from src.services.compression import Compressor, parse_accept_encoding
+
+
+def test_negotiation_follows_server_preference_and_q_values():
+    assert parse_accept_encoding('gzip, br;q=0.5, *;q=0') == {'gzip': 1.0, 'br': 0.5, '*': 0.0}
+    compressor = Compressor()
+    compressor.preference = ['zstd', 'br', 'gzip']
+    compressor.codecs = {'zstd': 'zstd codec', 'br': 'br codec', 'gzip': 'gzip codec'}
+
+    assert compressor.choose('gzip, br') == 'br codec'
+    assert compressor.choose('gzip, br;q=0.5') == 'gzip codec'
+    assert compressor.choose('*') == 'zstd codec'
+    assert compressor.choose('gzip;q=0') is None
+    assert compressor.choose(None) is None
+
+
+@pytest.fixture
+def admin(make_user, login):
+    _, customer = make_user('customer')
+    ticket_id = login(customer).post('/api/tickets', json={'title': 'Printer',
+                                                           'description': 'Does not print ' * 200}).get_json()['id']
+    return login('admin', 'admin123'), ticket_id
+
+
+def test_large_responses_are_compressed(admin):
+    client, ticket_id = admin
+    plain = client.get(f'/api/tickets/{ticket_id}')
+    compressed = client.get(f'/api/tickets/{ticket_id}', headers={'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert int(compressed.headers['Content-Length']) == len(compressed.data) < len(plain.data) / 4
+    assert gzip.decompress(compressed.data) == plain.data
+
+    refused = client.get(f'/api/tickets/{ticket_id}', headers={'Accept-Encoding': 'gzip;q=0'})
+    assert 'Content-Encoding' not in refused.headers
+
+
+def test_small_responses_are_sent_as_is(make_user, login):
+    _, customer = make_user('customer')
+    response = login(customer).get('/api/tickets', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert len(response.data) < 1024
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_streamed_export_decodes_chunk_by_chunk(admin):
+    client, _ = admin
+    plain = client.get('/api/admin/export/tickets?chunk_size=2').data
+    response = client.get('/api/admin/export/tickets?chunk_size=2', headers={'Accept-Encoding': 'gzip'},
+                          buffered=False)
+    parts = [part for part in response.response if part]
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    decoder = zlib.decompressobj(31)
+    # Each chunk is flushed, so the client can parse rows before the export ends
+    assert decoder.decompress(parts[0]).endswith(b'\n')
+    assert gzip.decompress(b''.join(parts)) == plain
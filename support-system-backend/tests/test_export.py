@@ -0,0 +1,44 @@
+import json
+
+from src.extensions import db
+from src.models.user import User
+from src.services.export import export, ticket_chunks
+
+
+def test_long_threads_are_split_without_changing_output(app, make_user, login):
+    customer_id, customer = make_user('customer')
+    client = login(customer)
+    ticket_ids = []
+    for title, replies in (('Quiet', 0), ('Long thread', 7), ('Short', 2), ('Also quiet', 0)):
+        ticket_id = client.post('/api/tickets', json={'title': title, 'description': 'Details'}).get_json()['id']
+        for n in range(replies):
+            assert client.post(f'/api/tickets/{ticket_id}/messages',
+                               json={'content': f'{title} reply {n}'}).status_code == 201
+        ticket_ids.append(ticket_id)
+
+    with app.app_context():
+        company_id = db.session.get(User, customer_id).company_id
+        small = {'company_id': company_id, 'chunk_size': 3, 'message_chunk_size': 3}
+        chunks = list(ticket_chunks(**small))
+        outputs = {fmt: [''.join(export(fmt, company_id=company_id)), ''.join(export(fmt, **small))]
+                   for fmt in ('csv', 'ndjson', 'columnar')}
+
+    assert max(sum(len(ticket['messages']) for ticket in chunk) for chunk in chunks) == 3
+    parts = [(ticket['id'], len(ticket['messages']), bool(ticket.get('continued')), bool(ticket.get('more')))
+             for chunk in chunks for ticket in chunk]
+    quiet, long, short, also_quiet = ticket_ids
+    assert parts == [(quiet, 0, False, False), (long, 3, False, True),
+                     (long, 3, True, True),
+                     (long, 1, True, False), (short, 2, False, False),
+                     (also_quiet, 0, False, False)]
+
+    assert outputs['csv'][1] == outputs['csv'][0]
+    assert outputs['ndjson'][1] == outputs['ndjson'][0]
+    lines = [json.loads(line) for line in outputs['ndjson'][1].splitlines()]
+    assert [len(line['messages']) for line in lines] == [0, 7, 2, 0]
+    assert [message['content'] for message in lines[1]['messages']] == [f'Long thread reply {n}' for n in range(7)]
+
+    groups = [json.loads(line) for line in outputs['columnar'][1].splitlines()[1:]]
+    assert sum(group['rows'] for group in groups) == 4
+    assert sorted(ticket_id for group in groups for ticket_id in group['tickets']['id']) == ticket_ids
+    assert sum(len(group['messages']['message_id']) for group in groups) == 9
@@ -0,0 +1,74 @@
+import pytest
+
+from src.services.routing import read_router
+
+
+@pytest.fixture
+def customer(make_user, login):
+    """A customer's client with one assigned ticket that has a reply with an attachment"""
+    _, username = make_user('customer')
+    agent_id, _ = make_user('agent')
+    client = login(username)
+    ticket_id = client.post('/api/tickets', json={'title': 'Printer', 'description': 'x' * 300}).get_json()['id']
+    login('admin', 'admin123').put(f'/api/tickets/{ticket_id}/assign', json={'agent_id': agent_id})
+    message_id = client.post(f'/api/tickets/{ticket_id}/messages', json={'content': 'Still broken'}).get_json()['id']
+    client.post(f'/api/messages/{message_id}/attachments?filename=photo.txt', data=b'paper jam')
+    return client, ticket_id, agent_id
+
+
+def reads(app, sql):
+    with app.app_context():
+        return sql(read_router.engine)
+
+
+def test_fields_select_keys_and_columns(app, sql, customer):
+    client, ticket_id, _ = customer
+
+    with reads(app, sql) as statements:
+        response = client.get('/api/tickets?fields=id,title,status.name')
+
+    assert response.status_code == 200
+    assert response.get_json() == [{'id': ticket_id, 'title': 'Printer', 'status': {'name': 'Awaiting Agent Reply'}}]
+    ticket_query = next(statement for statement in statements if 'FROM ticket' in statement)
+    assert 'ticket.title' in ticket_query and 'ticket.description' not in ticket_query
+
+
+def test_expand_and_computed_fields(customer):
+    client, ticket_id, agent_id = customer
+
+    ticket, = client.get('/api/tickets?fields=id,sla_breached&expand=agent').get_json()
+
+    assert set(ticket) == {'id', 'sla_breached', 'agent'}
+    assert ticket['sla_breached'] is False
+    assert ticket['agent']['id'] == agent_id and 'username' in ticket['agent']
+
+
+def test_default_response_is_unchanged(customer):
+    client, _, _ = customer
+
+    ticket, = client.get('/api/tickets').get_json()
+
+    assert {'id', 'title', 'description', 'status', 'customer', 'agent', 'version'} <= set(ticket)
+
+
+def test_unknown_field_is_rejected(customer):
+    client, _, _ = customer
+
+    response = client.get('/api/tickets?fields=id,bogus')
+
+    assert response.status_code == 400
+    assert 'bogus' in response.get_json()['error']
+
+
+def test_message_attachments_only_load_when_requested(app, sql, customer):
+    client, ticket_id, _ = customer
+    url = f'/api/tickets/{ticket_id}/messages'
+
+    with reads(app, sql) as statements:
+        plain = client.get(url + '?fields=id,content,sender.username').get_json()
+    assert not any('FROM attachment' in statement for statement in statements)
+    assert [set(message) for message in plain] == [{'id', 'content', 'sender'}]
+
+    with_files = client.get(url + '?fields=id,attachments.filename').get_json()
+    assert with_files[0]['attachments'] == [{'filename': 'photo.txt'}]
+    assert client.get(url).get_json()[0]['attachments'][0]['filename'] == 'photo.txt'
@@ -0,0 +1,41 @@
+from src.extensions import db
+from src.models.knowledge_base import KnowledgeBaseArticle
+from src.models.user import User
+from src.services.markup import excerpt, render_markdown
+
+
+def test_code_is_escaped_once():
+    assert render_markdown('Run `a && b < c`') == '<p>Run <code>a &amp;&amp; b &lt; c</code></p>'
+    assert render_markdown('    if a < b && c:\n        pass') == \
+        '<pre><code>if a &lt; b &amp;&amp; c:\n    pass\n</code></pre>'
+
+
+def test_links():
+    assert render_markdown('<http://example.com/?a=1&b=2>') == \
+        '<p><a href="http://example.com/?a=1&amp;b=2">http://example.com/?a=1&amp;b=2</a></p>'
+    assert render_markdown('[docs](https://example.com/docs)') == \
+        '<p><a href="https://example.com/docs">docs</a></p>'
+    assert render_markdown('[x](javascript:alert(1))') == '<p><a href="#">x</a></p>'
+
+
+def test_raw_html_is_text():
+    assert render_markdown('<script>alert(1)</script>') == '<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>'
+    assert render_markdown('Hi <img src=x onerror=alert(1)> & bye') == \
+        '<p>Hi &lt;img src=x onerror=alert(1)&gt; &amp; bye</p>'
+    assert excerpt(render_markdown('Use `<br>` & friends')) == 'Use <br> & friends'
+
+
+def test_render_missing_replaces_double_escaped_html(app):
+    with app.app_context():
+        author = User.query.filter_by(username='admin').first()
+        article = KnowledgeBaseArticle(title='Shell', content='Run `a && b`', category='Tips',
+                                       author_id=author.id, excerpt='Run a &amp;&amp; b',
+                                       content_html='<p>Run <code>a &amp;amp;&amp;amp; b</code></p>')
+        db.session.add(article)
+        db.session.commit()
+        article_id = article.id
+
+        KnowledgeBaseArticle.render_missing()
+
+        article = db.session.get(KnowledgeBaseArticle, article_id)
+        assert (article.content_html, article.excerpt) == ('<p>Run <code>a &amp;&amp; b</code></p>', 'Run a && b')
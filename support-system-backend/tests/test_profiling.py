@@ -0,0 +1,84 @@
+import marshal
+import pstats
+
+import pytest
+
+from src.services.profiling import collapsed_stacks, request_profiler
+
+ROOT_A, ROOT_B = ('/app/a.py', 1, 'first'), ('/app/b.py', 1, 'second')
+SHARED = ('/app/c.py', 7, 'shared')
+
+
+def test_collapsed_stacks_split_shared_callees_by_caller_time():
+    stats = {
+        ROOT_A: (1, 1, 0.5, 1.5, {}),
+        ROOT_B: (1, 1, 0.0, 2.0, {}),
+        SHARED: (2, 2, 3.0, 3.0, {ROOT_A: (1, 1, 1.0, 1.0), ROOT_B: (1, 1, 2.0, 2.0)}),
+    }
+
+    assert sorted(collapsed_stacks(stats).splitlines()) == [
+        'first (a.py:1) 500000',
+        'first (a.py:1);shared (c.py:7) 1000000',
+        'second (b.py:1);shared (c.py:7) 2000000',
+    ]
+
+
+@pytest.fixture
+def admin(login):
+    return login('admin', 'admin123')
+
+
+def profile_id(response):
+    assert response.status_code == 200
+    return int(response.headers['X-Profile-Id'])
+
+
+def test_admin_profiles_a_request(admin, make_user, login):
+    _, customer = make_user('customer')
+    assert 'X-Profile-Id' not in login(customer).get('/api/tickets/stats', headers={'X-Profile': '1'}).headers
+    assert 'X-Profile-Id' not in admin.get('/api/tickets/stats').headers
+
+    header_id = profile_id(admin.get('/api/tickets/stats', headers={'X-Profile': '1'}))
+    query_id = profile_id(admin.get('/api/tickets/stats?_profile=1'))
+
+    listed = [profile['id'] for profile in admin.get('/api/admin/profiles').get_json()]
+    assert listed.index(query_id) < listed.index(header_id)
+    profile = admin.get(f'/api/admin/profiles/{header_id}').get_json()
+    assert (profile['method'], profile['path'], profile['status_code']) == ('GET', '/api/tickets/stats', 200)
+    assert profile['sql_count'] == len(profile['sql']) > 0
+    assert any('FROM ticket' in statement['statement'] for statement in profile['sql'])
+    assert profile['functions'][0]['cumulative_ms'] >= profile['functions'][-1]['cumulative_ms']
+
+
+def test_downloads_load_in_standard_tools(admin, tmp_path):
+    pid = profile_id(admin.get('/api/tickets/stats', headers={'X-Profile': '1'}))
+    profile = admin.get(f'/api/admin/profiles/{pid}').get_json()
+
+    path = tmp_path / 'profile.pstats'
+    path.write_bytes(admin.get(f'/api/admin/profiles/{pid}.pstats').data)
+    stats = pstats.Stats(str(path))
+    assert stats.total_tt > 0
+    assert marshal.loads(path.read_bytes()) == stats.stats
+
+    lines = admin.get(f'/api/admin/profiles/{pid}.collapsed').data.decode().splitlines()
+    total_us = sum(int(line.rsplit(' ', 1)[1]) for line in lines)
+    assert 0 < total_us <= profile['duration_ms'] * 1000
+
+
+def test_sql_log_is_capped(admin, monkeypatch):
+    monkeypatch.setattr(request_profiler, 'max_sql', 1)
+
+    profile = admin.get(f"/api/admin/profiles/{profile_id(admin.get('/api/tickets/stats?_profile=1'))}").get_json()
+
+    assert len(profile['sql']) == 1
+    assert profile['sql_count'] == 1 + profile['sql_dropped'] > 1
+
+
+def test_profile_endpoints_are_admin_only_and_not_profiled(admin, make_user, login):
+    _, customer = make_user('customer')
+    assert login(customer).get('/api/admin/profiles').status_code == 403
+    assert 'X-Profile-Id' not in admin.get('/api/admin/profiles', headers={'X-Profile': '1'}).headers
+    assert admin.get('/api/admin/profiles/0').status_code == 404
+
+    assert admin.delete('/api/admin/profiles').status_code == 204
+    assert admin.get('/api/admin/profiles').get_json() == []
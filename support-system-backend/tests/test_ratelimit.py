@@ -0,0 +1,61 @@
+import pytest
+from flask import session
+
+from src.services.ratelimit import MemoryBackend, RateLimiter, SqliteBackend
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    return MemoryBackend() if request.param == 'memory' else SqliteBackend(str(tmp_path / 'buckets.db'))
+
+
+@pytest.fixture
+def limiter_for(app, backend):
+    """A limiter with ``rules`` as its only limit, on the backend under test"""
+    def make(rules):
+        limiter = RateLimiter()
+        limiter.backend = backend
+        limiter.rules = {'test': rules}
+        return limiter
+    return make
+
+
+def check_as(app, limiter, user_id):
+    with app.test_request_context('/api/test', environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        if user_id is not None:
+            session['user_id'] = user_id
+        return limiter.check('test')
+
+
+def test_take_many_charges_no_bucket_when_one_refuses(backend):
+    buckets = [('wide', 5, 0.001), ('narrow', 1, 0.001)]
+    assert backend.take_many(buckets, now=0) == 0
+    assert backend.take_many(buckets, now=0) > 0
+    # The refused request left the wide bucket at 4 tokens
+    assert [backend.take('wide', 5, 0.001, now=0) for _ in range(5)] == [0, 0, 0, 0, pytest.approx(1000)]
+
+
+def test_rules_with_same_key_have_their_own_buckets(app, limiter_for):
+    limiter = limiter_for([{'rate': '2/hour', 'key': 'user'}, {'rate': '100/minute', 'key': 'user'}])
+
+    waits = [check_as(app, limiter, 1) for _ in range(6)]
+
+    assert waits[:2] == [0, 0]
+    assert all(wait > 0 for wait in waits[2:])
+    assert check_as(app, limiter, 2) == 0
+
+
+def test_request_refused_by_one_rule_costs_nothing_against_others(app, limiter_for):
+    limiter = limiter_for([{'rate': '1/hour', 'key': 'user'}, {'rate': '3/hour', 'key': 'route'}])
+
+    assert check_as(app, limiter, 1) == 0
+    # Refused by the per-user rule, so the shared route bucket keeps its tokens
+    assert check_as(app, limiter, 1) > 0
+    assert [check_as(app, limiter, user_id) for user_id in (2, 3)] == [0, 0]
+    assert check_as(app, limiter, 4) > 0
+
+
+def test_burst_caps_bucket_size(app, limiter_for):
+    limiter = limiter_for([{'rate': '60/minute', 'burst': 2, 'key': 'ip'}])
+
+    assert [check_as(app, limiter, None) > 0 for _ in range(3)] == [False, False, True]
@@ -0,0 +1,82 @@
+from datetime import datetime
+
+from src.extensions import db
+from src.models.ticket import Ticket
+from src.models.user import User
+from src.services import rollups
+
+
+def test_rollups_follow_ticket_lifecycle(app, make_user, login):
+    customer_id, customer = make_user('customer')
+    first_agent, _ = make_user('agent')
+    second_agent, _ = make_user('agent')
+    customer_client = login(customer)
+    admin = login('admin', 'admin123')
+    with app.app_context():
+        company_id = db.session.get(User, customer_id).company_id
+
+    def today():
+        return admin.get('/api/analytics/tickets', query_string={'start': datetime.utcnow().date()}).get_json()
+
+    def ticket(title, priority):
+        response = customer_client.post('/api/tickets', json={'title': title, 'description': 'Details',
+                                                               'priority': priority})
+        assert response.status_code == 201
+        return response.get_json()['id']
+
+    def put(ticket_id, action, **data):
+        response = admin.put(f'/api/tickets/{ticket_id}/{action}', json=data)
+        assert response.status_code == 200, response.get_json()
+
+    before = today()['days'][0]
+    approved, assigned, rejected = ticket('Login', 'Low'), ticket('Billing', 'Medium'), ticket('Spam', 'High')
+
+    put(approved, 'status', status='Open')
+    put(assigned, 'assign', agent_id=first_agent)
+    put(assigned, 'priority', priority='Critical')
+    put(approved, 'priority', priority='High')
+    put(assigned, 'status', status='Resolved')
+    put(assigned, 'status', status='Closed')
+    put(approved, 'status', status='Closed')
+    put(rejected, 'status', status='Closed')
+    # Reopening, by a status change or a customer's reply, takes the close back
+    put(assigned, 'status', status='Open')
+    put(assigned, 'assign', agent_id=second_agent)
+    put(assigned, 'priority', priority='Low')
+    put(assigned, 'status', status='Closed')
+    put(approved, 'status', status='In Progress')
+    assert customer_client.post(f'/api/tickets/{rejected}/messages',
+                                json={'content': 'This is not spam'}).status_code == 201
+
+    with app.app_context():
+        assert [db.session.get(Ticket, ticket_id).closed_at is None
+                for ticket_id in (approved, assigned, rejected)] == [True, False, True]
+        assert rollups.verify() == []
+
+    after = today()
+    day = after['days'][0]
+    assert (day['created'] - before['created'], day['closed'] - before['closed'],
+            day['backlog'] - before['backlog']) == (3, 1, 2)
+    by_agent = after['resolution']['by_agent']
+    assert by_agent[str(second_agent)]['closed'] == 1
+    assert str(first_agent) not in by_agent
+
+    summary = admin.get(f'/api/companies/{company_id}/summary').get_json()
+    assert (summary['tickets'], summary['open_tickets'], summary['resolution_time']['count']) == (3, 2, 1)
+
+
+def test_clear_reopened_takes_back_stale_closes(app, make_user, login):
+    from src.services.transitions import clear_reopened
+
+    _, customer = make_user('customer')
+    ticket_id = login(customer).post('/api/tickets', json={'title': 'Reopened long ago',
+                                                           'description': 'Details'}).get_json()['id']
+    with app.app_context():
+        # As left by a reopen before transitions cleared closed_at
+        db.session.get(Ticket, ticket_id).closed_at = datetime.utcnow()
+        db.session.commit()
+
+        clear_reopened()
+
+        assert db.session.get(Ticket, ticket_id).closed_at is None
+        assert rollups.verify() == []
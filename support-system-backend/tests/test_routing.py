@@ -0,0 +1,63 @@
+from flask import g
+
+from src.extensions import db
+from src.models.status import Status
+from src.models.ticket import Ticket
+from src.services.routing import read_router
+
+
+def verbs(statements):
+    return [statement.split(None, 1)[0].upper() for statement in statements]
+
+
+def engines(app):
+    with app.app_context():
+        return db.engine, read_router.engine
+
+
+def test_get_reads_use_read_engine(app, make_user, login, sql):
+    _, customer = make_user('customer')
+    client = login(customer)
+    client.post('/api/tickets', json={'title': 'Printer', 'description': 'Out of toner'})
+    primary_engine, read_engine = engines(app)
+
+    with sql(primary_engine) as primary, sql(read_engine) as reads:
+        response = client.get('/api/tickets')
+
+    assert response.status_code == 200
+    assert [ticket['title'] for ticket in response.get_json()] == ['Printer']
+    assert reads and set(verbs(reads)) == {'SELECT'}
+    assert primary == []
+
+
+def test_writes_use_primary(app, make_user, login, sql):
+    _, customer = make_user('customer')
+    client = login(customer)
+    primary_engine, read_engine = engines(app)
+
+    with sql(primary_engine) as primary, sql(read_engine) as reads:
+        response = client.post('/api/tickets', json={'title': 'VPN', 'description': 'Cannot connect'})
+
+    assert response.status_code == 201
+    assert 'INSERT' in verbs(primary)
+    assert reads == []
+
+
+def test_reads_after_flush_in_get_request_see_own_writes(app, make_user, sql):
+    customer_id, _ = make_user('customer')
+    primary_engine, read_engine = engines(app)
+
+    with app.test_request_context('/api/tickets', method='GET'):
+        read_router.before_request()
+        assert g.read_engine is read_engine
+        status_id = Status.get_id('Open')
+        with sql(primary_engine) as primary, sql(read_engine) as reads:
+            db.session.add(Ticket(customer_id=customer_id, title='Own write', description='Flushed only',
+                                  status_id=status_id))
+            db.session.flush()
+            found = db.session.query(Ticket.id).filter_by(title='Own write').first()
+        db.session.rollback()
+
+    assert found is not None
+    assert 'INSERT' in verbs(primary) and verbs(primary)[-1] == 'SELECT'
+    assert reads == []
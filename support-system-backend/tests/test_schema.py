@@ -0,0 +1,16 @@
+from sqlalchemy import inspect, text
+
+from src.extensions import db
+from src.services import schema
+
+
+def test_upgrade_adds_missing_indexes(app):
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(text('DROP INDEX ix_message_ticket_id_id'))
+
+        assert schema.upgrade() == []
+
+        assert 'ix_message_ticket_id_id' in {index['name'] for index in inspect(db.engine).get_indexes('message')}
+        # Nothing left to do
+        assert schema.upgrade() == []
@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from src.extensions import db
+from src.models.message import Message
+from src.models.status import Status
+from src.models.ticket import Ticket
+from src.services import search
+from src.services.search import TicketSearchIndex, search_index
+
+
+def commit_ticket(app, customer_id, title, reply):
+    """Commit a ticket and a reply from another thread, as a concurrent request would"""
+    def run():
+        with app.app_context():
+            ticket = Ticket(customer_id=customer_id, title=title, description='Details',
+                            status_id=Status.get_id('Open'))
+            db.session.add(ticket)
+            db.session.flush()
+            db.session.add(Message(ticket_id=ticket.id, sender_id=customer_id, content=reply))
+            db.session.commit()
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+
+
+def index_state(index):
+    return index._postings, index._lengths, index._owners, index._total_length
+
+
+def test_commits_update_loaded_index(app, make_user, login):
+    _, customer = make_user('customer')
+    client = login(customer)
+    with app.app_context():
+        search_index.ensure_loaded()
+
+    ticket_id = client.post('/api/tickets', json={'title': 'Flickering monitor',
+                                                  'description': 'Since Monday'}).get_json()['id']
+    client.post(f'/api/tickets/{ticket_id}/messages', json={'content': 'The cable is loose xylophonic'})
+
+    for query in ('flickering', 'xylophonic'):
+        result = client.get('/api/tickets/search', query_string={'q': query}).get_json()
+        assert [item['ticket']['id'] for item in result['items']] == [ticket_id]
+    assert 'xylophonic' in result['items'][0]['snippet']
+
+
+@pytest.mark.parametrize('moment', ['before reads', 'after reads'])
+def test_rebuild_keeps_commits_made_while_it_reads(app, monkeypatch, make_user, moment):
+    customer_id, _ = make_user('customer')
+    title = f'Concurrent {moment}'
+    each_shard = search.each_shard
+
+    def each_shard_with_commit():
+        for shard in each_shard():
+            if moment == 'before reads':
+                commit_ticket(app, customer_id, title, 'Replied during the rebuild')
+            yield shard
+            if moment == 'after reads':
+                commit_ticket(app, customer_id, title, 'Replied during the rebuild')
+
+    with app.app_context():
+        search_index.ensure_loaded()
+        monkeypatch.setattr(search, 'each_shard', each_shard_with_commit)
+        search_index.rebuild()
+        monkeypatch.undo()
+
+        clean = TicketSearchIndex()
+        clean.rebuild()
+        assert index_state(search_index) == index_state(clean)
+        total, hits = search_index.search(f'concurrent {moment} replied')
+        ticket_id = Ticket.query.filter_by(title=title).one().id
+        assert hits[0][0] == ticket_id
@@ -0,0 +1,172 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from flask import g
+from sqlalchemy import create_engine, event, select
+
+from src.extensions import db
+from src.models.message import Message
+from src.models.shard import CompanyShard, LegacyRowLocation, ShardIdCounter
+from src.models.status import Status
+from src.models.ticket import Ticket
+from src.models.user import User
+from src.services import sharding
+from src.services.sharding import (ID_SPAN, SHARDED_TABLES, by_shard, each_shard, fan_out, move_company,
+                                   shard_router, use_company)
+
+
+@pytest.fixture
+def shards(app, tmp_path, monkeypatch):
+    """Turn sharding on with two empty shards, as ``ShardRouter.init_app`` would"""
+    with app.app_context():
+        primary = db.engine.url.database
+    engines = {}
+    for name in ('shard1', 'shard2'):
+        engine = create_engine(f"sqlite:///{tmp_path / f'{name}.db'}")
+        event.listen(engine, 'connect', sharding._attach_primary(primary))
+        db.metadata.create_all(engine, tables=[db.metadata.tables[table] for table in SHARDED_TABLES])
+        engines[name] = engine
+    pool = ThreadPoolExecutor(max_workers=3)
+    for name, value in (('engines', engines), ('enabled', True), ('_pool', pool),
+                        ('_map', {}), ('_map_loaded_at', None), ('_legacy', {})):
+        monkeypatch.setattr(shard_router, name, value)
+    event.listen(db.session, 'before_flush', sharding._allocate_ids)
+    companies = []
+    yield engines, companies
+
+    event.remove(db.session, 'before_flush', sharding._allocate_ids)
+    with app.app_context():
+        for company_id in companies:
+            with use_company(company_id):
+                for ticket in Ticket.query.filter(Ticket.id >= company_id * ID_SPAN,
+                                                  Ticket.id < (company_id + 1) * ID_SPAN):
+                    Message.query.filter_by(ticket_id=ticket.id).delete()
+                    db.session.delete(ticket)
+                db.session.commit()
+        CompanyShard.query.filter(CompanyShard.company_id.in_(companies)).delete()
+        LegacyRowLocation.query.filter(LegacyRowLocation.company_id.in_(companies)).delete()
+        ShardIdCounter.query.filter(ShardIdCounter.company_id.in_(companies)).delete()
+        db.session.commit()
+    pool.shutdown()
+
+
+def customer_company(app, make_user, companies):
+    customer_id, _ = make_user('customer')
+    with app.app_context():
+        company_id = db.session.get(User, customer_id).company_id
+    companies.append(company_id)
+    return customer_id, company_id
+
+
+def create_ticket(customer_id, company_id, title):
+    with use_company(company_id):
+        ticket = Ticket(customer_id=customer_id, title=title, description='Details',
+                        status_id=Status.get_id('Open'))
+        db.session.add(ticket)
+        db.session.flush()
+        db.session.add(Message(ticket_id=ticket.id, sender_id=customer_id, content='Any news?'))
+        db.session.commit()
+        return ticket.id
+
+
+def ticket_ids_on(engine):
+    with engine.connect() as connection:
+        return set(connection.execute(select(Ticket.id)).scalars())
+
+
+def test_companies_write_to_their_own_shard(app, make_user, shards):
+    engines, companies = shards
+    first_customer, first = customer_company(app, make_user, companies)
+    second_customer, second = customer_company(app, make_user, companies)
+
+    with app.app_context():
+        first_ticket = create_ticket(first_customer, first, 'Keyboard')
+        second_ticket = create_ticket(second_customer, second, 'Mouse')
+        first_shard, second_shard = shard_router.shard_of(first)[0], shard_router.shard_of(second)[0]
+
+        assert {first_shard, second_shard} == {'shard1', 'shard2'}
+        assert (first_ticket, second_ticket) == (first * ID_SPAN + 1, second * ID_SPAN + 1)
+        assert ticket_ids_on(engines[first_shard]) == {first_ticket}
+        assert ticket_ids_on(engines[second_shard]) == {second_ticket}
+        assert Ticket.query.get(first_ticket) is None  # not on the primary
+
+        # Shard connections attach the primary, so joins to users and statuses work
+        with use_company(first):
+            assert Ticket.query.get(first_ticket).customer.company_id == first
+        ids = [first_ticket, second_ticket]
+        assert sorted(fan_out(lambda: Ticket.query.filter(Ticket.id.in_(ids)).count())) == [0, 1, 1]
+        assert list(each_shard()) == ['default', 'shard1', 'shard2']
+        located = {}
+        for subset in by_shard('ticket', ids):
+            located[g.shard_name] = subset
+        assert located == {first_shard: [first_ticket], second_shard: [second_ticket]}
+
+
+def test_requests_route_by_the_row_in_the_url(app, make_user, shards):
+    _, companies = shards
+    customer_id, company_id = customer_company(app, make_user, companies)
+    with app.app_context():
+        ticket_id = create_ticket(customer_id, company_id, 'Headset')
+        shard = shard_router.shard_of(company_id)[0]
+
+    with app.test_request_context(f'/api/tickets/{ticket_id}/messages'):
+        assert shard_router.before_request() is None
+        assert (g.shard_name, g.shard_company) == (shard, company_id)
+
+        db.session.execute(CompanyShard.__table__.update().where(
+            CompanyShard.company_id == company_id).values(moving=True))
+        db.session.commit()
+        shard_router._refresh_map()
+        assert shard_router.before_request().status_code == 503
+
+        db.session.execute(CompanyShard.__table__.update().where(
+            CompanyShard.company_id == company_id).values(moving=False))
+        db.session.commit()
+        shard_router._refresh_map()
+
+
+@pytest.fixture
+def legacy(app, make_user):
+    """A customer and their ticket from before sharding, on the primary"""
+    customer_id, _ = make_user('customer')
+    with app.app_context():
+        ticket = Ticket(customer_id=customer_id, title='Legacy', description='Old',
+                        status_id=Status.get_id('Open'))
+        db.session.add(ticket)
+        db.session.commit()
+        company_id, ticket_id = ticket.customer.company_id, ticket.id
+    yield customer_id, company_id, ticket_id
+
+    with app.app_context():
+        db.session.delete(db.session.get(Ticket, ticket_id))
+        db.session.commit()
+
+
+def test_move_company_keeps_ids_and_legacy_rows(app, legacy, shards):
+    engines, companies = shards
+    customer_id, company_id, legacy_id = legacy
+    companies.append(company_id)
+    with app.app_context():
+        # What adoption does for companies with tickets on the primary
+        db.session.add(CompanyShard(company_id=company_id, shard='default', moving=False))
+        db.session.commit()
+        sharded_id = create_ticket(customer_id, company_id, 'Monitor')
+        assert ticket_ids_on(db.engine) >= {legacy_id, sharded_id}
+
+        assert move_company(company_id, 'shard1', wait=False, log=lambda message: None)['ticket'] == 2
+        assert ticket_ids_on(engines['shard1']) == {legacy_id, sharded_id}
+        assert not ticket_ids_on(db.engine) & {legacy_id, sharded_id}
+        assert shard_router.company_of('ticket', legacy_id) == company_id
+        assert shard_router.company_of('ticket', sharded_id) == company_id
+
+        with use_company(company_id):
+            assert Message.query.filter_by(ticket_id=sharded_id).count() == 1
+            next_id = create_ticket(customer_id, company_id, 'Dock')
+        # The id counter moved along; the reply took the id in between
+        assert next_id == sharded_id + 2
+
+        with pytest.raises(ValueError):
+            move_company(company_id, 'shard1', wait=False)
+        move_company(company_id, 'default', wait=False, log=lambda message: None)
+        assert ticket_ids_on(db.engine) >= {legacy_id, sharded_id, next_id}
+        assert not ticket_ids_on(engines['shard1'])
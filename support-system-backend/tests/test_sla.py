@@ -0,0 +1,85 @@
+from datetime import date, datetime, timedelta
+
+from src.extensions import db
+from src.models.ticket import Ticket
+from src.services import sla
+from src.services.sla import BusinessCalendar, SlaScanner, compute_due
+
+MOSCOW = BusinessCalendar(tz='Europe/Moscow')
+FRIDAY_5PM = datetime(2026, 10, 16, 14, 0)  # UTC; 17:00 in Moscow, one working hour left
+
+
+def test_business_days_skip_weekends_and_holidays():
+    assert compute_due(FRIDAY_5PM, 'Critical', MOSCOW) == FRIDAY_5PM + timedelta(hours=1)
+    # One business day (9 hours): the last hour on Friday, then eight on Monday
+    assert compute_due(FRIDAY_5PM, 'Medium', MOSCOW) == datetime(2026, 10, 19, 14, 0)
+    assert compute_due(FRIDAY_5PM, 'Low', MOSCOW) == datetime(2026, 10, 21, 14, 0)
+
+    holiday = BusinessCalendar(tz='Europe/Moscow', holidays={date(2026, 10, 19)})
+    assert compute_due(FRIDAY_5PM, 'Medium', holiday) == datetime(2026, 10, 20, 14, 0)
+    # Outside working hours the clock starts at the next opening (Monday 09:00 Moscow)
+    saturday = datetime(2026, 10, 17, 10, 0)
+    assert compute_due(saturday, 'Medium', MOSCOW) == datetime(2026, 10, 19, 15, 0)
+
+
+def set_due(app, ticket_id, due):
+    with app.app_context():
+        db.session.execute(Ticket.__table__.update().where(Ticket.id == ticket_id).values(sla_due_at=due))
+        db.session.commit()
+
+
+def test_breached_tickets_are_listed_until_closed(app, make_user, login):
+    _, customer = make_user('customer')
+    admin = login('admin', 'admin123')
+    created = login(customer).post('/api/tickets', json={'title': 'Badge', 'description': 'Door stays shut',
+                                                         'priority': 'Critical'}).get_json()
+    ticket_id = created['id']
+    due = datetime.fromisoformat(created['sla_due_at'])
+    assert due - datetime.fromisoformat(created['created_at']) == timedelta(hours=1)
+    assert created['sla_breached'] is False
+
+    def listed(sla_filter):
+        return ticket_id in [ticket['id'] for ticket in
+                             admin.get('/api/tickets', query_string={'sla': sla_filter}).get_json()]
+
+    assert listed('at_risk') and not listed('breached')
+    set_due(app, ticket_id, datetime.utcnow() - timedelta(minutes=5))
+    assert listed('breached') and not listed('at_risk')
+    assert admin.get(f'/api/tickets/{ticket_id}').get_json()['sla_breached'] is True
+
+    low = admin.put(f'/api/tickets/{ticket_id}/priority', json={'priority': 'Low'}).get_json()
+    assert datetime.fromisoformat(low['sla_due_at']) > datetime.utcnow()
+    set_due(app, ticket_id, datetime.utcnow() - timedelta(minutes=5))
+    assert admin.put(f'/api/tickets/{ticket_id}/status', json={'status': 'Closed'}).status_code == 200
+    assert not listed('breached')
+
+
+def test_scanner_reports_new_breaches_once(app, make_user, login):
+    _, customer = make_user('customer')
+    client = login(customer)
+    late, soon = (client.post('/api/tickets', json={'title': title, 'description': 'Details',
+                                                    'priority': 'Critical'}).get_json()['id']
+                  for title in ('Late', 'Soon'))
+    now = datetime.utcnow()
+    set_due(app, late, now - timedelta(minutes=1))
+    set_due(app, soon, now + timedelta(minutes=10))
+
+    scanner = SlaScanner(horizon=3600)
+    with app.app_context():
+        assert late in scanner.refresh(now)
+        assert late not in scanner.refresh(now)
+    assert late in scanner.breached()
+    assert (now + timedelta(minutes=10), soon) in scanner.upcoming(15 * 60, now)
+    assert (now + timedelta(minutes=10), soon) not in scanner.upcoming(5 * 60, now)
+
+
+def test_backfill_fills_missing_due_times(app, make_user, login):
+    _, customer = make_user('customer')
+    ticket_id = login(customer).post('/api/tickets', json={'title': 'Legacy', 'description': 'Old',
+                                                           'priority': 'High'}).get_json()['id']
+    set_due(app, ticket_id, None)
+
+    with app.app_context():
+        sla.backfill(MOSCOW)
+        ticket = db.session.get(Ticket, ticket_id)
+        assert ticket.sla_due_at == ticket.created_at + timedelta(hours=4)
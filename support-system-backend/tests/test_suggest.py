@@ -0,0 +1,110 @@
+import threading
+
+from src.extensions import db
+from src.models.knowledge_base import KnowledgeBaseArticle
+from src.models.status import Status
+from src.models.ticket import Ticket
+from src.services import suggest
+from src.services.suggest import SuggestionIndex, suggestions
+
+
+def insert_ticket(customer_id, title, description):
+    """Write a ticket the way another worker would: invisible to this process's session hooks"""
+    result = db.session.execute(Ticket.__table__.insert().values(
+        customer_id=customer_id, title=title, description=description, status_id=Status.get_id('Open')))
+    db.session.commit()
+    return result.inserted_primary_key[0]
+
+
+def delete_ticket(ticket_id):
+    db.session.execute(Ticket.__table__.delete().where(Ticket.id == ticket_id))
+    db.session.commit()
+
+
+def ticket_ids(index, title, customer_id=None):
+    return [ticket_id for ticket_id, _ in index.suggest(title, '', customer_id=customer_id)[1]]
+
+
+def test_catch_up_reads_other_workers_writes(app, make_user):
+    customer_id, _ = make_user('customer')
+    admin_id, _ = make_user('admin')
+    with app.app_context():
+        suggestions.ensure_loaded()
+        ticket_id = insert_ticket(customer_id, 'Gyroscope calibration drift', 'Needs a reset')
+        article = KnowledgeBaseArticle(title='Resetting a printer', content='Hold the button',
+                                       category='Hardware', author_id=admin_id)
+        db.session.add(article)
+        db.session.commit()
+        db.session.execute(KnowledgeBaseArticle.__table__.update().where(
+            KnowledgeBaseArticle.id == article.id).values(title='Resetting a gyroscope'))
+        db.session.commit()
+        assert ticket_ids(suggestions, 'gyroscope') == []
+
+        suggestions.catch_up()
+        articles, tickets = suggestions.suggest('gyroscope', '', customer_id=customer_id)
+        assert [ticket_id for ticket_id, _ in tickets] == [ticket_id]
+        assert article.id in [article_id for article_id, _ in articles]
+
+        delete_ticket(ticket_id)
+        suggestions.catch_up()
+        assert ticket_ids(suggestions, 'gyroscope') == []
+
+
+def test_catch_up_keeps_tickets_committed_while_it_reads(app, monkeypatch, make_user):
+    customer_id, _ = make_user('customer')
+    each_shard = suggest.each_shard
+
+    def commit_ticket():
+        with app.app_context():
+            db.session.add(Ticket(customer_id=customer_id, title='Tachometer stuck',
+                                  description='Reads zero', status_id=Status.get_id('Open')))
+            db.session.commit()
+
+    def each_shard_with_commit():
+        for shard in each_shard():
+            yield shard
+            # After the id list is read, so the new ticket is missing from it
+            thread = threading.Thread(target=commit_ticket)
+            thread.start()
+            thread.join()
+
+    with app.app_context():
+        suggestions.ensure_loaded()
+        monkeypatch.setattr(suggest, 'each_shard', each_shard_with_commit)
+        suggestions.catch_up()
+        monkeypatch.undo()
+        assert len(ticket_ids(suggestions, 'tachometer', customer_id)) == 1
+
+
+def test_snapshot_catches_up_on_load(app, tmp_path, make_user):
+    customer_id, _ = make_user('customer')
+    path = str(tmp_path / 'suggest.npz')
+    with app.app_context():
+        saved = SuggestionIndex()
+        saved.rebuild()
+        saved.save(path)
+        ticket_id = insert_ticket(customer_id, 'Barometer offline', 'Since the storm')
+
+        loaded = SuggestionIndex()
+        loaded.load(path)
+        assert ticket_ids(loaded, 'barometer') == []
+        loaded.catch_up()
+        assert ticket_ids(loaded, 'barometer') == [ticket_id]
+
+        fresh = SuggestionIndex()
+        fresh.rebuild()
+        assert loaded.suggest('barometer storm', 'offline') == fresh.suggest('barometer storm', 'offline')
+        delete_ticket(ticket_id)
+
+
+def test_suggestions_only_show_own_tickets(app, make_user, login):
+    _, owner = make_user('customer')
+    _, other = make_user('customer')
+    owner_client, other_client = login(owner), login(other)
+    ticket_id = owner_client.post('/api/tickets', json={'title': 'Seismograph noise',
+                                                        'description': 'Constant hum'}).get_json()['id']
+
+    query = {'title': 'seismograph', 'description': 'hum'}
+    result = owner_client.get('/api/tickets/suggestions', query_string=query).get_json()
+    assert [ticket['id'] for ticket in result['tickets']] == [ticket_id]
+    assert other_client.get('/api/tickets/suggestions', query_string=query).get_json()['tickets'] == []
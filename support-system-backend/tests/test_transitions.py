@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+from src.extensions import db
+from src.models.message import Message
+from src.models.ticket import Ticket
+from src.routes import message as message_routes
+
+
+@pytest.fixture
+def assigned(make_user, login):
+    """A customer client, the assigned agent's client, the admin client and the ticket id"""
+    _, customer = make_user('customer')
+    agent_id, agent = make_user('agent')
+    customer_client, admin = login(customer), login('admin', 'admin123')
+    ticket_id = customer_client.post('/api/tickets', json={'title': 'Router',
+                                                           'description': 'Keeps rebooting'}).get_json()['id']
+    assert admin.put(f'/api/tickets/{ticket_id}/assign', json={'agent_id': agent_id}).status_code == 200
+    return customer_client, login(agent), admin, ticket_id
+
+
+def run_between_read_and_write(monkeypatch, request):
+    """Make ``request`` happen, on another thread, after a reply has read its ticket"""
+    check = message_routes.can_post_to_ticket
+    pending = [request]
+
+    def check_then_race(user, ticket):
+        allowed = check(user, ticket)
+        if pending:
+            thread = threading.Thread(target=pending.pop())
+            thread.start()
+            thread.join()
+        return allowed
+
+    monkeypatch.setattr(message_routes, 'can_post_to_ticket', check_then_race)
+
+
+def ticket_state(app, ticket_id):
+    with app.app_context():
+        ticket = db.session.get(Ticket, ticket_id)
+        return ticket.status.name, ticket.version, Message.query.filter_by(ticket_id=ticket_id).count()
+
+
+def test_stale_version_gets_409(app, assigned):
+    _, agent, admin, ticket_id = assigned
+    version = agent.get(f'/api/tickets/{ticket_id}').get_json()['version']
+    assert admin.put(f'/api/tickets/{ticket_id}/priority', json={'priority': 'High'}).status_code == 200
+
+    response = agent.put(f'/api/tickets/{ticket_id}/status', json={'status': 'Resolved', 'version': version})
+
+    assert response.status_code == 409
+    assert ticket_state(app, ticket_id)[0] == 'In Progress'
+
+
+def test_transition_outside_graph_gets_409(app, make_user, login):
+    _, customer = make_user('customer')
+    ticket_id = login(customer).post('/api/tickets', json={'title': 'Fax',
+                                                           'description': 'No tone'}).get_json()['id']
+
+    response = login('admin', 'admin123').put(f'/api/tickets/{ticket_id}/status',
+                                              json={'status': 'Awaiting Agent Reply'})
+
+    assert response.status_code == 409
+    assert ticket_state(app, ticket_id)[0] == 'Pending Moderation'
+
+
+def test_reply_keeps_concurrent_close(app, monkeypatch, assigned):
+    customer, agent, _, ticket_id = assigned
+    closes = []
+    run_between_read_and_write(monkeypatch, lambda: closes.append(
+        agent.put(f'/api/tickets/{ticket_id}/status', json={'status': 'Closed'}).status_code))
+
+    response = customer.post(f'/api/tickets/{ticket_id}/messages', json={'content': 'Any news?'})
+
+    assert closes == [200]
+    assert response.status_code == 201
+    status, _, messages = ticket_state(app, ticket_id)
+    assert (status, messages) == ('Closed', 1)
+
+
+def test_concurrent_replies_both_succeed(app, monkeypatch, assigned):
+    customer, agent, _, ticket_id = assigned
+    version = ticket_state(app, ticket_id)[1]
+    replies = []
+    run_between_read_and_write(monkeypatch, lambda: replies.append(
+        agent.post(f'/api/tickets/{ticket_id}/messages', json={'content': 'Looking into it'}).status_code))
+
+    response = customer.post(f'/api/tickets/{ticket_id}/messages', json={'content': 'It is down again'})
+
+    assert replies == [201]
+    assert response.status_code == 201
+    assert ticket_state(app, ticket_id) == ('Awaiting Agent Reply', version + 2, 2)
@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+from sqlalchemy import event
+
+from src.extensions import db
+from src.models.message import Message
+from src.models.status import Status
+from src.models.ticket import Ticket
+from src.routes import message as message_routes
+from src.services.group_commit import GroupCommitter
+
+
+@pytest.fixture
+def ticket(make_user, login):
+    """A customer client, their id and the id of their approved ticket"""
+    customer_id, customer = make_user('customer')
+    client = login(customer)
+    ticket_id = client.post('/api/tickets', json={'title': 'Webcam', 'description': 'Black'}).get_json()['id']
+    assert login('admin', 'admin123').put(f'/api/tickets/{ticket_id}/status',
+                                          json={'status': 'Open'}).status_code == 200
+    return client, customer_id, ticket_id
+
+
+@pytest.fixture
+def commits():
+    """Counts commits of any session, per thread"""
+    counts = {}
+
+    def count(session):
+        thread = threading.get_ident()
+        counts[thread] = counts.get(thread, 0) + 1
+
+    event.listen(db.session, 'after_commit', count)
+    yield counts
+    event.remove(db.session, 'after_commit', count)
+
+
+def message_count(app, ticket_id):
+    with app.app_context():
+        return Message.query.filter_by(ticket_id=ticket_id).count()
+
+
+def test_reply_commits_once(ticket, commits):
+    client, _, ticket_id = ticket
+
+    response = client.post(f'/api/tickets/{ticket_id}/messages', json={'content': 'Still black'})
+
+    assert response.status_code == 201
+    assert commits == {threading.get_ident(): 1}
+    assert client.get(f'/api/tickets/{ticket_id}').get_json()['status']['name'] == 'Awaiting Agent Reply'
+
+
+def test_failed_status_change_drops_the_message(app, monkeypatch, ticket):
+    client, _, ticket_id = ticket
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('status update failed')
+
+    monkeypatch.setattr(Ticket, 'update_status_based_on_action', fail)
+    with pytest.raises(RuntimeError):
+        client.post(f'/api/tickets/{ticket_id}/messages', json={'content': 'Lost'})
+
+    assert message_count(app, ticket_id) == 0
+
+
+def test_group_commit_shares_one_transaction(app, ticket, commits):
+    _, customer_id, ticket_id = ticket
+    committer = GroupCommitter(max_batch=4, max_delay=5)
+    committer.app = app
+
+    def job(n):
+        def write(session):
+            session.add(Message(ticket_id=ticket_id, sender_id=customer_id, content=f'message {n}'))
+            return n
+        return write
+
+    futures = [committer.submit(job(n)) for n in range(4)]
+
+    assert [future.result(10) for future in futures] == [0, 1, 2, 3]
+    assert list(commits.values()) == [1]
+    assert message_count(app, ticket_id) == 4
+
+
+def test_group_commit_isolates_a_failing_job(app, ticket, commits):
+    _, customer_id, ticket_id = ticket
+    committer = GroupCommitter(max_batch=3, max_delay=5)
+    committer.app = app
+
+    def write(session):
+        session.add(Message(ticket_id=ticket_id, sender_id=customer_id, content='kept'))
+
+    def fail(session):
+        raise ValueError('bad job')
+
+    futures = [committer.submit(job) for job in (write, fail, write)]
+
+    futures[0].result(10), futures[2].result(10)
+    with pytest.raises(ValueError):
+        futures[1].result(10)
+    assert message_count(app, ticket_id) == 2
+
+
+def test_reply_through_group_commit(app, monkeypatch, ticket):
+    client, _, ticket_id = ticket
+    committer = GroupCommitter(max_batch=8, max_delay=0.001)
+    committer.app = app
+    monkeypatch.setattr(message_routes, 'group_committer', committer)
+
+    response = client.post(f'/api/tickets/{ticket_id}/messages', json={'content': 'Batched'})
+
+    assert response.status_code == 201
+    assert response.get_json()['content'] == 'Batched'
+    with app.app_context():
+        assert db.session.get(Ticket, ticket_id).status_id == Status.get_id('Awaiting Agent Reply')
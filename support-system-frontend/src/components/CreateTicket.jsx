@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import { useAuth } from '../contexts/AuthContext';
 import { Button } from '@/ui/button';
 import { Input } from '@/ui/input';
@@ -7,7 +7,7 @@ import { Textarea } from '@/ui/textarea';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/ui/card';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/ui/select';
 import { Alert, AlertDescription } from '@/ui/alert';
-import { Loader2, Plus, ArrowLeft } from 'lucide-react';
+import { Loader2, Plus, ArrowLeft, Lightbulb } from 'lucide-react';
 
 const CreateTicket = ({ onTicketCreated }) => {
   const { API_BASE_URL } = useAuth();
@@ -19,6 +19,36 @@ const CreateTicket = ({ onTicketCreated }) => {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
   const [success, setSuccess] = useState(false);
+  const [suggestions, setSuggestions] = useState({ articles: [], tickets: [] });
+
+  // Suggest articles and similar tickets while the customer types
+  useEffect(() => {
+    const title = formData.title.trim();
+    const description = formData.description.trim();
+    if (title.length + description.length < 4) {
+      setSuggestions({ articles: [], tickets: [] });
+      return;
+    }
+    const controller = new AbortController();
+    const timer = setTimeout(async () => {
+      try {
+        const params = new URLSearchParams({ title, description, limit: '5' });
+        const response = await fetch(`${API_BASE_URL}/tickets/suggestions?${params}`, {
+          credentials: 'include',
+          signal: controller.signal,
+        });
+        if (response.ok) {
+          setSuggestions(await response.json());
+        }
+      } catch (error) {
+        // Suggestions are optional; ignore aborted and failed requests
+      }
+    }, 400);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [formData.title, formData.description, API_BASE_URL]);
 
   const handleCancel = () => {
     if (onTicketCreated) onTicketCreated();
@@ -112,6 +142,43 @@ const CreateTicket = ({ onTicketCreated }) => {
                 />
               </div>
 
+              {(suggestions.articles.length > 0 || suggestions.tickets.length > 0) && (
+                <div className="p-4 bg-amber-50 dark:bg-amber-900/20 rounded-lg space-y-3">
+                  <h3 className="font-medium flex items-center gap-2">
+                    <Lightbulb className="w-4 h-4" />
+                    Возможно, ответ уже есть
+                  </h3>
+                  {suggestions.articles.length > 0 && (
+                    <div>
+                      <p className="text-sm text-gray-600 dark:text-gray-300 mb-1">Статьи базы знаний:</p>
+                      <ul className="text-sm space-y-1">
+                        {suggestions.articles.map((article) => (
+                          <li key={article.id}>
+                            <span className="font-medium">{article.title}</span>
+                            {article.excerpt && (
+                              <span className="text-gray-500"> — {article.excerpt}</span>
+                            )}
+                          </li>
+                        ))}
+                      </ul>
+                    </div>
+                  )}
+                  {suggestions.tickets.length > 0 && (
+                    <div>
+                      <p className="text-sm text-gray-600 dark:text-gray-300 mb-1">Похожие открытые заявки:</p>
+                      <ul className="text-sm space-y-1">
+                        {suggestions.tickets.map((ticket) => (
+                          <li key={ticket.id}>
+                            #{ticket.id} {ticket.title}
+                            <span className="text-gray-500"> ({ticket.status})</span>
+                          </li>
+                        ))}
+                      </ul>
+                    </div>
+                  )}
+                </div>
+              )}
+
               <div className="space-y-2">
                 <Label htmlFor="priority">Приоритет</Label>
                 <Select
@@ -176,15 +176,20 @@ const KnowledgeBase = () => {
     fetchArticles();
   }, [searchTerm, selectedCategory]);
 
-  const formatContent = (content) => {
-    // Simple markdown-like formatting
-    return content
-      .replace(/^# (.*$)/gim, '<h1 class="text-2xl font-bold mb-4">$1</h1>')
-      .replace(/^## (.*$)/gim, '<h2 class="text-xl font-semibold mb-3">$1</h2>')
-      .replace(/^### (.*$)/gim, '<h3 class="text-lg font-medium mb-2">$1</h3>')
-      .replace(/^\*\*(.*)\*\*/gim, '<strong>$1</strong>')
-      .replace(/^\* (.*$)/gim, '<li class="ml-4">• $1</li>')
-      .replace(/\n/g, '<br>');
+  // The list only carries excerpts; full content and rendered HTML come from the article endpoint
+  const fetchArticle = async (articleId) => {
+    try {
+      const response = await fetch(`${API_BASE_URL}/knowledgebase/${articleId}`, {
+        credentials: 'include'
+      });
+      if (response.ok) {
+        return await response.json();
+      }
+      setError('Ошибка загрузки статьи');
+    } catch (error) {
+      setError('Ошибка сети');
+    }
+    return null;
   };
 
   if (loading) {
@@ -349,9 +354,12 @@ const KnowledgeBase = () => {
                     <Button
                       variant="ghost"
                       size="sm"
-                      onClick={() => {
-                        setEditingArticle({...article});
-                        setIsEditDialogOpen(true);
+                      onClick={async () => {
+                        const fullArticle = await fetchArticle(article.id);
+                        if (fullArticle) {
+                          setEditingArticle(fullArticle);
+                          setIsEditDialogOpen(true);
+                        }
                       }}
                     >
                       <Edit className="h-4 w-4" />
@@ -370,7 +378,7 @@ const KnowledgeBase = () => {
             <CardContent>
               <div className="space-y-3">
                 <p className="text-sm text-gray-600 dark:text-gray-400 line-clamp-3">
-                  {article.content.replace(/[#*]/g, '').substring(0, 150)}...
+                  {article.excerpt}
                 </p>
                 <div className="flex items-center justify-between text-xs text-gray-500">
                   <span>Автор: {article.author?.username}</span>
@@ -379,9 +387,12 @@ const KnowledgeBase = () => {
                 <Button
                   variant="outline"
                   className="w-full"
-                  onClick={() => {
-                    setViewingArticle(article);
-                    setIsViewDialogOpen(true);
+                  onClick={async () => {
+                    const fullArticle = await fetchArticle(article.id);
+                    if (fullArticle) {
+                      setViewingArticle(fullArticle);
+                      setIsViewDialogOpen(true);
+                    }
                   }}
                 >
                   <Eye className="h-4 w-4 mr-2" />
@@ -421,7 +432,7 @@ const KnowledgeBase = () => {
               </DialogHeader>
               <div 
                 className="prose dark:prose-invert max-w-none"
-                dangerouslySetInnerHTML={{ __html: formatContent(viewingArticle.content) }}
+                dangerouslySetInnerHTML={{ __html: viewingArticle.content_html }}
               />
             </>
           )}
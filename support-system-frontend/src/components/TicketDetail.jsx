@@ -20,7 +20,8 @@ import {
   CheckCircle,
   XCircle,
   Settings,
-  MessageSquare
+  MessageSquare,
+  Paperclip
 } from 'lucide-react';
 
 const TicketDetail = ({ ticketId, onBack, onUpdate }) => {
@@ -34,7 +35,9 @@ const TicketDetail = ({ ticketId, onBack, onUpdate }) => {
   const [newStatus, setNewStatus] = useState('');
   const [assignedAgent, setAssignedAgent] = useState('');
   const [agents, setAgents] = useState([]);
+  const [files, setFiles] = useState([]);
   const messagesEndRef = useRef(null);
+  const fileInputRef = useRef(null);
 
   useEffect(() => {
     fetchTicket();
@@ -118,8 +121,30 @@ const TicketDetail = ({ ticketId, onBack, onUpdate }) => {
       });
 
       if (response.ok) {
+        const message = await response.json();
+        for (const file of files) {
+          const upload = await fetch(
+            `${API_BASE_URL}/messages/${message.id}/attachments?filename=${encodeURIComponent(file.name)}`,
+            {
+              method: 'POST',
+              headers: {
+                'Content-Type': file.type || 'application/octet-stream',
+              },
+              credentials: 'include',
+              body: file,
+            }
+          );
+          if (!upload.ok) {
+            setError(`Ошибка при загрузке вложения ${file.name}`);
+          }
+        }
         setNewMessage('');
-        fetchMessages();
+        setFiles([]);
+        if (fileInputRef.current) {
+          fileInputRef.current.value = '';
+        }
+        // The reply moved the ticket's status and version; reloading it also reloads the messages
+        fetchTicket();
       } else {
         setError('Ошибка при отправке сообщения');
       }
@@ -138,13 +163,16 @@ const TicketDetail = ({ ticketId, onBack, onUpdate }) => {
           'Content-Type': 'application/json',
         },
         credentials: 'include',
-        body: JSON.stringify({ status }),
+        body: JSON.stringify({ status, version: ticketData.version }),
       });
 
       if (response.ok) {
         const updatedTicket = await response.json();
         setTicketData(updatedTicket);
         setError('');
+      } else if (response.status === 409) {
+        setError('Заявка была изменена другим пользователем, данные обновлены');
+        fetchTicket();
       } else {
         setError('Ошибка при обновлении статуса');
       }
@@ -161,13 +189,16 @@ const TicketDetail = ({ ticketId, onBack, onUpdate }) => {
           'Content-Type': 'application/json',
         },
         credentials: 'include',
-        body: JSON.stringify({ agent_id: parseInt(agentId) }),
+        body: JSON.stringify({ agent_id: parseInt(agentId), version: ticketData.version }),
       });
 
       if (response.ok) {
         const updatedTicket = await response.json();
         setTicketData(updatedTicket);
         setError('');
+      } else if (response.status === 409) {
+        setError('Заявка была изменена другим пользователем, данные обновлены');
+        fetchTicket();
       } else {
         setError('Ошибка при назначении исполнителя');
       }
@@ -398,6 +429,22 @@ const TicketDetail = ({ ticketId, onBack, onUpdate }) => {
                             }`}
                           >
                             <p className="text-sm">{message.content}</p>
+                            {message.attachments?.length > 0 && (
+                              <div className="mt-2 space-y-1">
+                                {message.attachments.map((attachment) => (
+                                  <a
+                                    key={attachment.id}
+                                    href={`${API_BASE_URL}/attachments/${attachment.id}`}
+                                    target="_blank"
+                                    rel="noopener noreferrer"
+                                    className="flex items-center gap-1 text-xs underline"
+                                  >
+                                    <Paperclip className="w-3 h-3" />
+                                    {attachment.filename}
+                                  </a>
+                                ))}
+                              </div>
+                            )}
                           </div>
                           <p className="text-xs text-gray-500 mt-1">
                             {message.sender?.username} • {formatDate(message.created_at)}
@@ -424,6 +471,22 @@ const TicketDetail = ({ ticketId, onBack, onUpdate }) => {
                       }
                     }}
                   />
+                  <input
+                    ref={fileInputRef}
+                    type="file"
+                    multiple
+                    className="hidden"
+                    onChange={(e) => setFiles(Array.from(e.target.files))}
+                  />
+                  <Button
+                    type="button"
+                    variant="outline"
+                    onClick={() => fileInputRef.current?.click()}
+                    title={files.map((file) => file.name).join(', ')}
+                  >
+                    <Paperclip className="w-4 h-4" />
+                    {files.length > 0 && <span className="ml-1 text-xs">{files.length}</span>}
+                  </Button>
                   <Button type="submit" disabled={sendingMessage || !newMessage.trim()}>
                     {sendingMessage ? (
                       <Loader2 className="w-4 h-4 animate-spin" />